@@ -0,0 +1,102 @@
+"""
+Admission control for the detection server
+Bounds the number of requests running inference and waiting for it, and
+sheds requests that cannot finish before their deadline, so overload turns
+into fast rejections instead of an ever-growing queue
+"""
+
+import math
+import time
+import threading
+from contextlib import contextmanager
+
+class AdmissionRejected(Exception):
+    """Request shed by the admission controller"""
+    
+    def __init__(self, reason, retry_after):
+        """
+        Args:
+            reason: 'overloaded' or 'deadline_exceeded'
+            retry_after: Suggested delay before retrying, in whole seconds
+        """
+        super(AdmissionRejected, self).__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """Bounded in-flight and queue limits with per-request deadlines"""
+    
+    def __init__(self, max_inflight=2, max_queue=8):
+        """
+        Initialize the admission controller
+        
+        Args:
+            max_inflight: Requests allowed to run at the same time
+            max_queue: Requests allowed to wait for a free slot; further
+                requests are rejected immediately
+        """
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.inflight = 0
+        self.waiting = 0
+        self._service_time = None
+        self._condition = threading.Condition()
+    
+    def expected_wait(self):
+        """Estimated seconds a new request waits for a slot"""
+        if self.inflight < self.max_inflight:
+            return 0.0
+        service_time = self._service_time if self._service_time is not None else 1.0
+        return service_time * (self.waiting + 1) / self.max_inflight
+    
+    def retry_after(self):
+        """Suggested Retry-After in whole seconds, from the current backlog"""
+        service_time = self._service_time if self._service_time is not None else 1.0
+        backlog = service_time * (self.inflight + self.waiting) / self.max_inflight
+        return max(1, int(math.ceil(backlog)))
+    
+    @contextmanager
+    def admit(self, deadline):
+        """
+        Context manager holding an inference slot for its block
+        
+        Args:
+            deadline: time.monotonic() value after which the result is useless
+        
+        Raises:
+            AdmissionRejected: The queue is full, or no slot frees up
+                before the deadline
+        """
+        with self._condition:
+            if self.inflight >= self.max_inflight:
+                if self.waiting >= self.max_queue:
+                    raise AdmissionRejected('overloaded', self.retry_after())
+                
+                # Shed right away what the current backlog is expected to make late
+                if time.monotonic() + self.expected_wait() > deadline:
+                    raise AdmissionRejected('deadline_exceeded', self.retry_after())
+                
+                self.waiting += 1
+                try:
+                    while self.inflight >= self.max_inflight:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise AdmissionRejected('deadline_exceeded', self.retry_after())
+                        self._condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.inflight += 1
+        
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            with self._condition:
+                self.inflight -= 1
+                # Exponentially weighted service time for the wait estimates
+                if self._service_time is None:
+                    self._service_time = elapsed
+                else:
+                    self._service_time = 0.8 * self._service_time + 0.2 * elapsed
+                self._condition.notify()
@@ -1,43 +1,788 @@
 """
 BarcodeDetector - Neural network-based barcode detection and recognition
-Uses PyTorch and torchvision for barcode number extraction
+Uses PyTorch for barcode number extraction
+
+The ResNet backbone and the image preprocessing are defined here with plain
+torch and PIL, so inference does not import torchvision; only the training
+scripts need it.
 """
 
 import torch
 import torch.nn as nn
-import torchvision.transforms as transforms
-from torchvision.models import resnet18
+import torch.nn.functional as F
 import numpy as np
 from PIL import Image
 import io
+import os
+import copy
+import json
+import time
+import struct
+
+# Barcode lengths protected by a GS1 check digit: EAN-8, UPC-A and EAN-13
+CHECKSUM_LENGTHS = (8, 12, 13)
+
+# Class index used by the digit heads for "no digit at this position"
+NO_DIGIT = 10
+
+# Default model input geometry as (height, width)
+DEFAULT_INPUT_SIZE = (224, 224)
+
+# Execution backends of BarcodeDetector, see build_runner
+BACKENDS = ('eager', 'channels_last', 'torchscript', 'quantized', 'onnxruntime')
+
+# ResNet18 residual blocks per stage and stem width
+DEFAULT_LAYERS = (2, 2, 2, 2)
+DEFAULT_WIDTH = 64
+
+# Models saved with this extension use the flat, memory-mappable safetensors
+# layout instead of a pickled torch checkpoint
+FLAT_EXTENSION = '.safetensors'
+
+# Test-time augmentation variants as (rotation in degrees, zoom, horizontal
+# shift as a fraction of the width, contrast stretch), grouped in stages that
+# each run as one batch until a stage gives a confident reading
+DEFAULT_TTA_STAGES = (
+    ((0, 1.0, 0.0, True), (-3, 1.0, 0.0, False), (3, 1.0, 0.0, False)),
+    ((0, 1.15, -0.06, False), (0, 1.15, 0.06, False), (0, 0.9, 0.0, True),
+     (-6, 1.1, 0.0, True), (6, 1.1, 0.0, True))
+)
+
+# Largest image decoded for detection, in pixels after any JPEG draft
+# scaling (a 12 MP photo is about 12 million)
+MAX_IMAGE_PIXELS = 40000000
+
+# safetensors dtype codes and their little-endian numpy equivalents
+FLAT_DTYPES = {
+    torch.float64: ('F64', '<f8'),
+    torch.float32: ('F32', '<f4'),
+    torch.float16: ('F16', '<f2'),
+    torch.int64: ('I64', '<i8'),
+    torch.int32: ('I32', '<i4'),
+    torch.int8: ('I8', 'i1'),
+    torch.uint8: ('U8', 'u1'),
+    torch.bool: ('BOOL', '?')
+}
+
+def get_normalization(in_channels=3):
+    """
+    Get the input normalization constants for a number of channels
+    
+    Args:
+        in_channels: 3 for RGB input, 1 for grayscale input
+    
+    Returns:
+        Tuple of (mean, std) lists
+    """
+    if in_channels == 1:
+        # Average of the ImageNet channel statistics
+        return [0.449], [0.226]
+    return [0.485, 0.456, 0.406], [0.229, 0.224, 0.225]
+
+class ImageTooLarge(ValueError):
+    """Image with more pixels than allowed for detection"""
+
+def decode_image(source, target_size=None, grayscale=False, max_pixels=MAX_IMAGE_PIXELS):
+    """
+    Decode an image for the model, doing as little work as possible
+    
+    Only the header is read before the size check. JPEGs are decoded with
+    DCT-domain scaling (PIL draft mode) by 1/2, 1/4 or 1/8, as far as the
+    result stays at least as large as target_size, so a camera frame is
+    never decoded at full resolution just to be shrunk to the model input.
+    
+    Args:
+        source: File path or binary file object
+        target_size: Model input size as (height, width), or None to decode
+            at full resolution
+        grayscale: Decode to a single channel ('L'), for grayscale models
+        max_pixels: Largest accepted decoded image (width x height)
+    
+    Returns:
+        PIL Image in 'L' or 'RGB' mode
+    
+    Raises:
+        ImageTooLarge: The image has more pixels than max_pixels, even
+            after draft scaling, or than PIL's own decompression bomb limit
+    """
+    mode = 'L' if grayscale else 'RGB'
+    try:
+        image = Image.open(source)
+        if target_size is not None and image.format == 'JPEG':
+            image.draft(mode, (target_size[1], target_size[0]))
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e)) from e
+    
+    width, height = image.size
+    if width * height > max_pixels:
+        image.close()
+        raise ImageTooLarge(f"{width}x{height} image exceeds {max_pixels} pixels")
+    return image.convert(mode)
+
+def save_model(model, path):
+    """
+    Save a BarcodeNet checkpoint together with its input geometry
+    
+    Paths ending in FLAT_EXTENSION get the memory-mappable flat format (see
+    save_flat_model), any other path a torch checkpoint.
+    
+    Args:
+        model: BarcodeNet instance
+        path: Destination file path
+    """
+    if path.endswith(FLAT_EXTENSION):
+        save_flat_model(model, path)
+        return
+    
+    torch.save({
+        'config': model.get_config(),
+        'state_dict': model.state_dict()
+    }, path)
+
+def save_flat_model(model, path):
+    """
+    Save a BarcodeNet in the flat safetensors layout
+    
+    The file is an 8-byte little-endian header length, a JSON header giving
+    the dtype, shape and byte range of every tensor (the architecture goes
+    in its __metadata__), then the raw tensor data. It is written to a
+    temporary file and renamed into place, so processes that memory-mapped
+    the previous file keep reading consistent weights.
+    
+    Args:
+        model: BarcodeNet instance
+        path: Destination file path
+    """
+    tensors = {name: tensor.detach().cpu().contiguous()
+               for name, tensor in model.state_dict().items()}
+    
+    # Widest dtypes first keeps every tensor aligned to its item size
+    names = sorted(tensors, key=lambda name: -tensors[name].element_size())
+    header = {'__metadata__': {'format': 'pt', 'config': json.dumps(model.get_config())}}
+    offset = 0
+    for name in names:
+        tensor = tensors[name]
+        if tensor.dtype not in FLAT_DTYPES:
+            raise ValueError(f"Cannot store {tensor.dtype} tensor {name} in {path}")
+        size = tensor.numel() * tensor.element_size()
+        header[name] = {'dtype': FLAT_DTYPES[tensor.dtype][0], 'shape': list(tensor.shape),
+                        'data_offsets': [offset, offset + size]}
+        offset += size
+    
+    # Padding the header to 8 bytes aligns the data section
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    header_bytes += b' ' * (-len(header_bytes) % 8)
+    
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for name in names:
+            f.write(tensors[name].numpy().astype(FLAT_DTYPES[tensors[name].dtype][1],
+                                                 copy=False).tobytes())
+    os.replace(tmp_path, path)
+
+def load_flat_model(path):
+    """
+    Load a BarcodeNet saved by save_flat_model without copying its weights
+    
+    The file is memory-mapped copy-on-write and the model's parameters are
+    views of the mapping, so processes loading the same file share its page
+    cache pages instead of each holding a private copy, and startup skips
+    both unpickling and random initialization.
+    
+    Args:
+        path: Flat model file path
+    
+    Returns:
+        BarcodeNet on the CPU whose weights are backed by the file
+    """
+    with open(path, 'rb') as f:
+        header_size = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(header_size))
+    config = json.loads(header.pop('__metadata__')['config'])
+    
+    data = np.memmap(path, dtype=np.uint8, mode='c')
+    codes = {code: numpy_dtype for code, numpy_dtype in FLAT_DTYPES.values()}
+    state_dict = {}
+    for name, entry in header.items():
+        start, end = entry['data_offsets']
+        array = data[8 + header_size + start:8 + header_size + end]
+        state_dict[name] = torch.from_numpy(
+            array.view(codes[entry['dtype']]).reshape(entry['shape']))
+    
+    # Parameters built on the meta device take no memory and no init time
+    with torch.device('meta'):
+        model = BarcodeNet(**config)
+    _assign_state_dict(model, state_dict)
+    return model
+
+def _assign_state_dict(model, state_dict):
+    """
+    Make the tensors of a state dict the model's parameters and buffers
+    
+    Unlike load_state_dict, nothing is copied (load_state_dict(assign=True)
+    needs torch 2.1).
+    
+    Args:
+        model: Module, typically built on the meta device
+        state_dict: Dictionary of tensors matching the model's state dict
+    """
+    expected = model.state_dict()
+    missing = set(expected) - set(state_dict)
+    unexpected = set(state_dict) - set(expected)
+    if missing or unexpected:
+        raise RuntimeError(f"State dict mismatch: missing {sorted(missing)}, "
+                           f"unexpected {sorted(unexpected)}")
+    
+    for name, tensor in state_dict.items():
+        if tensor.shape != expected[name].shape:
+            raise RuntimeError(f"Shape mismatch for {name}: {tuple(tensor.shape)} in the file, "
+                               f"{tuple(expected[name].shape)} in the model")
+        module_name, _, attribute = name.rpartition('.')
+        module = model.get_submodule(module_name)
+        if attribute in module._parameters:
+            module._parameters[attribute] = nn.Parameter(
+                tensor, requires_grad=module._parameters[attribute].requires_grad)
+        else:
+            module._buffers[attribute] = tensor
+
+def load_model(path, map_location='cpu'):
+    """
+    Load a BarcodeNet checkpoint
+    
+    Checkpoints holding only a state dict (older format) are loaded into the
+    default 3x224x224 architecture. Paths ending in FLAT_EXTENSION are
+    memory-mapped (see load_flat_model).
+    
+    Args:
+        path: Checkpoint file path
+        map_location: Device to map the weights to
+    
+    Returns:
+        BarcodeNet with the checkpoint weights loaded
+    """
+    if path.endswith(FLAT_EXTENSION):
+        return load_flat_model(path).to(map_location)
+    
+    checkpoint = torch.load(path, map_location=map_location)
+    if 'state_dict' in checkpoint and 'config' in checkpoint:
+        config = checkpoint['config']
+        state_dict = checkpoint['state_dict']
+    else:
+        config = {}
+        state_dict = checkpoint
+    
+    model = BarcodeNet(**config)
+    model.load_state_dict(state_dict)
+    return model
+
+def is_valid_checksum(barcode):
+    """
+    Check the GS1 check digit of an EAN-13, EAN-8 or UPC-A number
+    
+    Args:
+        barcode: Barcode digits as string
+    
+    Returns:
+        True if the length is supported and the check digit matches
+    """
+    if not barcode or not barcode.isdigit() or len(barcode) not in CHECKSUM_LENGTHS:
+        return False
+    
+    # Weights alternate 1, 3, 1, ... starting from the check digit
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(reversed(barcode)))
+    return total % 10 == 0
+
+def decode_checksum(digit_logits, top_k=3, lengths=CHECKSUM_LENGTHS):
+    """
+    Decode the most probable checksum-valid barcode for each batch element
+    
+    Only the top_k digits of every position are considered. For each
+    supported length a dynamic program over (position, weighted sum mod 10)
+    finds the best sequence whose check digit is valid, with the remaining
+    positions scored as "no digit". The search is vectorized over the batch,
+    the candidates and the ten residues.
+    
+    Args:
+        digit_logits: Tensor of shape (batch, positions, 11)
+        top_k: Number of candidate digits kept per position (10 = exhaustive)
+        lengths: Barcode lengths to search
+    
+    Returns:
+        List of (barcode, confidence) tuples, one per batch element. The
+        confidence is the model probability of the whole sequence. barcode
+        is None when no valid sequence exists among the candidates.
+    """
+    log_probs = torch.log_softmax(digit_logits.detach().float(), dim=2)
+    batch_size, num_positions, _ = log_probs.shape
+    top_k = max(1, min(top_k, NO_DIGIT))
+    device = log_probs.device
+    
+    cand_lp, cand_digits = log_probs[:, :, :NO_DIGIT].topk(top_k, dim=2)
+    
+    # suffix[:, i] = log probability that every position from i on is empty
+    pad_lp = log_probs[:, :, NO_DIGIT]
+    suffix = torch.flip(torch.cumsum(torch.flip(pad_lp, [1]), dim=1), [1])
+    suffix = torch.cat([suffix, torch.zeros(batch_size, 1, device=device)], dim=1)
+    
+    residues = torch.arange(10, device=device).view(1, 10, 1)
+    batch_index = torch.arange(batch_size, device=device)
+    
+    best_scores = []
+    best_digits = []
+    for length in lengths:
+        if length > num_positions:
+            continue
+        
+        # dp[b, r]: best score of a prefix whose weighted sum is r (mod 10)
+        dp = torch.full((batch_size, 10), float('-inf'), device=device)
+        dp[:, 0] = 0.0
+        history = []
+        for i in range(length):
+            weight = 3 if (length - 1 - i) % 2 else 1
+            contrib = (weight * cand_digits[:, i, :]).unsqueeze(1)
+            prev = (residues - contrib) % 10
+            scores = dp.gather(1, prev.view(batch_size, -1)).view(batch_size, 10, top_k)
+            scores = scores + cand_lp[:, i, :].unsqueeze(1)
+            dp, choice = scores.max(dim=2)
+            history.append((prev, choice))
+        
+        # Walk back from residue 0, i.e. a valid check digit
+        residue = torch.zeros(batch_size, dtype=torch.long, device=device)
+        digits = []
+        for i in reversed(range(length)):
+            prev, choice = history[i]
+            j = choice[batch_index, residue]
+            digits.append(cand_digits[batch_index, i, j])
+            residue = prev[batch_index, residue, j]
+        
+        best_scores.append(dp[:, 0] + suffix[:, length])
+        best_digits.append(torch.stack(digits[::-1], dim=1))
+    
+    if not best_scores:
+        return [(None, 0.0)] * batch_size
+    
+    scores = torch.stack(best_scores, dim=1)
+    winner = scores.argmax(dim=1)
+    results = []
+    for b in range(batch_size):
+        score = scores[b, winner[b]].item()
+        if score == float('-inf'):
+            results.append((None, 0.0))
+            continue
+        digits = best_digits[winner[b].item()][b].tolist()
+        results.append((''.join(str(d) for d in digits), float(np.exp(score))))
+    
+    return results
+
+class FrameQualityGate:
+    """Cheap pre-inference check for blurry, badly exposed or unchanged frames"""
+    
+    # Rejection reason codes
+    BLURRY = 'blurry'
+    UNDEREXPOSED = 'underexposed'
+    OVEREXPOSED = 'overexposed'
+    UNCHANGED = 'unchanged'
+    
+    def __init__(self, size=(160, 120), min_sharpness=30.0, min_brightness=25.0,
+                 max_brightness=245.0, min_change=3.0):
+        """
+        Initialize the frame quality gate
+        
+        Args:
+            size: (width, height) of the grayscale frame the checks run on
+            min_sharpness: Minimum variance of the Laplacian
+            min_brightness: Minimum mean gray level (0-255)
+            max_brightness: Maximum mean gray level (0-255)
+            min_change: Minimum mean absolute gray level difference against
+                the last accepted frame, or None to disable the check
+        """
+        self.size = size
+        self.min_sharpness = min_sharpness
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.min_change = min_change
+        self._last_frame = None
+    
+    def check(self, image):
+        """
+        Check a frame and remember it as reference when it passes
+        
+        Args:
+            image: PIL Image
+        
+        Returns:
+            Rejection reason code, or None if the frame should be processed
+        """
+        gray = np.asarray(image.convert('L').resize(self.size, Image.BILINEAR),
+                          dtype=np.float32)
+        
+        brightness = gray.mean()
+        if brightness < self.min_brightness:
+            return self.UNDEREXPOSED
+        if brightness > self.max_brightness:
+            return self.OVEREXPOSED
+        
+        if self.min_change is not None and self._last_frame is not None:
+            if np.abs(gray - self._last_frame).mean() < self.min_change:
+                return self.UNCHANGED
+        
+        if self.sharpness(gray) < self.min_sharpness:
+            return self.BLURRY
+        
+        if self.min_change is not None:
+            self._last_frame = gray
+        return None
+    
+    def reset(self):
+        """Forget the reference frame used for the change check"""
+        self._last_frame = None
+    
+    @staticmethod
+    def sharpness(gray):
+        """
+        Variance of the 4-neighbour Laplacian of a grayscale array
+        
+        Args:
+            gray: 2D float array
+        
+        Returns:
+            Sharpness score, higher is sharper
+        """
+        laplacian = (4 * gray[1:-1, 1:-1] - gray[:-2, 1:-1] - gray[2:, 1:-1]
+                     - gray[1:-1, :-2] - gray[1:-1, 2:])
+        return float(laplacian.var())
+
+class TestTimeAugmentation:
+    """
+    Read hard images again as a batch of slightly altered variants
+    
+    Used by BarcodeDetector when the plain forward pass does not give a
+    confident, checksum-valid reading in its decode mode. The variants of
+    each stage run in one forward call, their per-digit probabilities are
+    averaged with those of the earlier passes, and the remaining stages are
+    skipped as soon as the average reads confidently with a valid check
+    digit, or clearly holds no barcode.
+    """
+    
+    def __init__(self, stages=DEFAULT_TTA_STAGES, min_confidence=0.5, presence_floor=0.1):
+        """
+        Initialize the augmentation
+        
+        Args:
+            stages: Sequence of stages, each a sequence of (rotation degrees,
+                zoom, horizontal shift, contrast stretch) variants
+            min_confidence: Sequence probability the reading of the decode
+                mode (the per-position argmax, or the best checksum-valid
+                sequence) needs to stop early; it must also have a valid
+                check digit
+            presence_floor: Averaged presence probability under which an
+                image is taken to hold no barcode and is not retried
+        """
+        self.stages = [list(stage) for stage in stages]
+        self.min_confidence = min_confidence
+        self.presence_floor = presence_floor
+    
+    @staticmethod
+    def variants(images, stage, mean, std):
+        """
+        Build the variants of a stage for a batch of model inputs
+        
+        Args:
+            images: Normalized tensor of shape (batch, channels, height, width)
+            stage: Sequence of (rotation degrees, zoom, shift, contrast) tuples
+            mean: Normalization mean, shape (channels, 1, 1)
+            std: Normalization standard deviation, shape (channels, 1, 1)
+        
+        Returns:
+            Tensor of shape (batch * len(stage), channels, height, width),
+            the variants of the first image first
+        """
+        batch_size, channels, height, width = images.shape
+        
+        # One affine sampling grid per variant; rotation is done in pixel
+        # space, hence the aspect ratio terms in normalized coordinates
+        thetas = []
+        for degrees, zoom, shift, _ in stage:
+            angle = np.deg2rad(degrees)
+            cos, sin = np.cos(angle) / zoom, np.sin(angle) / zoom
+            thetas.append([[cos, -sin * height / width, 2 * shift],
+                           [sin * width / height, cos, 0.0]])
+        theta = torch.tensor(thetas, dtype=images.dtype, device=images.device)
+        theta = theta.repeat(batch_size, 1, 1)
+        inputs = images.repeat_interleave(len(stage), dim=0)
+        grid = F.affine_grid(theta, list(inputs.shape), align_corners=False)
+        outputs = F.grid_sample(inputs, grid, mode='bilinear', padding_mode='border',
+                                align_corners=False)
+        
+        # Contrast stretch: map the 2nd to 98th percentile to the full range
+        stretch = torch.tensor([contrast for _, _, _, contrast in stage],
+                               device=images.device).repeat(batch_size)
+        if stretch.any():
+            mean = mean.to(images.device)
+            std = std.to(images.device)
+            pixels = outputs[stretch] * std + mean
+            low, high = torch.quantile(pixels.flatten(1),
+                                       torch.tensor([0.02, 0.98], device=images.device), dim=1)
+            low = low.view(-1, 1, 1, 1)
+            high = torch.maximum(high.view(-1, 1, 1, 1), low + 1e-3)
+            outputs[stretch] = (((pixels - low) / (high - low)).clamp(0, 1) - mean) / std
+        return outputs
+
+def _conv3x3(in_planes, out_planes, stride=1):
+    """3x3 convolution with padding and no bias"""
+    return nn.Conv2d(in_planes, out_planes, kernel_size=3, stride=stride, padding=1, bias=False)
+
+class BasicBlock(nn.Module):
+    """ResNet basic residual block, with torchvision's module names"""
+    
+    def __init__(self, in_planes, planes, stride=1, inner=None):
+        """
+        Initialize the block
+        
+        Args:
+            in_planes: Input channels
+            planes: Output channels
+            stride: Stride of the first convolution
+            inner: Channels between the two convolutions (default: planes)
+        """
+        super(BasicBlock, self).__init__()
+        inner = inner or planes
+        self.conv1 = _conv3x3(in_planes, inner, stride)
+        self.bn1 = nn.BatchNorm2d(inner)
+        self.relu = nn.ReLU(inplace=True)
+        self.conv2 = _conv3x3(inner, planes)
+        self.bn2 = nn.BatchNorm2d(planes)
+        self.downsample = None
+        if stride != 1 or in_planes != planes:
+            self.downsample = nn.Sequential(
+                nn.Conv2d(in_planes, planes, kernel_size=1, stride=stride, bias=False),
+                nn.BatchNorm2d(planes)
+            )
+        self.stride = stride
+    
+    def forward(self, x):
+        """Residual forward pass"""
+        identity = x if self.downsample is None else self.downsample(x)
+        
+        out = self.relu(self.bn1(self.conv1(x)))
+        out = self.bn2(self.conv2(out))
+        out += identity
+        return self.relu(out)
+
+class ResNetBackbone(nn.Module):
+    """
+    ResNet with BasicBlocks and a configurable depth and width
+    
+    Parameter names match torchvision's resnet18 (conv1, bn1, layer1-4, fc),
+    so checkpoints trained with the torchvision backbone load unchanged.
+    """
+    
+    def __init__(self, layers=DEFAULT_LAYERS, width=DEFAULT_WIDTH, in_channels=3,
+                 num_classes=1000, block_widths=None):
+        """
+        Initialize the backbone
+        
+        Args:
+            layers: Residual blocks in each of the four stages
+            width: Channels of the first stage, doubled at every later stage
+            in_channels: Input image channels
+            num_classes: Outputs of the final fully connected layer
+            block_widths: Inner channels of every residual block in order
+                (default: the block's output channels)
+        
+        Raises:
+            ValueError: block_widths does not have one entry per block
+        """
+        super(ResNetBackbone, self).__init__()
+        if block_widths is not None and len(block_widths) != sum(layers):
+            raise ValueError(f"Expected {sum(layers)} block widths, got {len(block_widths)}")
+        inner = iter(block_widths or [None] * sum(layers))
+        
+        self.conv1 = nn.Conv2d(in_channels, width, kernel_size=7, stride=2, padding=3, bias=False)
+        self.bn1 = nn.BatchNorm2d(width)
+        self.relu = nn.ReLU(inplace=True)
+        self.maxpool = nn.MaxPool2d(kernel_size=3, stride=2, padding=1)
+        
+        in_planes = width
+        for stage, blocks in enumerate(layers):
+            planes = width * 2 ** stage
+            stage_blocks = []
+            for block in range(blocks):
+                stride = 2 if stage > 0 and block == 0 else 1
+                stage_blocks.append(BasicBlock(in_planes, planes, stride, next(inner)))
+                in_planes = planes
+            setattr(self, f'layer{stage + 1}', nn.Sequential(*stage_blocks))
+        
+        self.avgpool = nn.AdaptiveAvgPool2d((1, 1))
+        self.fc = nn.Linear(in_planes, num_classes)
+        
+        # Same initialization as torchvision
+        for module in self.modules():
+            if isinstance(module, nn.Conv2d):
+                nn.init.kaiming_normal_(module.weight, mode='fan_out', nonlinearity='relu')
+            elif isinstance(module, nn.BatchNorm2d):
+                nn.init.constant_(module.weight, 1)
+                nn.init.constant_(module.bias, 0)
+    
+    def forward(self, x):
+        """
+        Forward pass
+        
+        Args:
+            x: Input image tensor
+        
+        Returns:
+            Tensor of shape (batch, num_classes)
+        """
+        x = self.maxpool(self.relu(self.bn1(self.conv1(x))))
+        x = self.layer4(self.layer3(self.layer2(self.layer1(x))))
+        return self.fc(torch.flatten(self.avgpool(x), 1))
+
+class ImageTransform:
+    """
+    Preprocessing of PIL images into normalized model input tensors
+    
+    Equivalent to torchvision's Grayscale, Resize, ToTensor and Normalize
+    chain, with the resize skipped for images already at the input size.
+    """
+    
+    def __init__(self, input_size, in_channels=3):
+        """
+        Initialize the transform
+        
+        Args:
+            input_size: Model input size as (height, width)
+            in_channels: 1 for grayscale models, 3 for RGB
+        """
+        self.input_size = tuple(input_size)
+        self.mode = 'L' if in_channels == 1 else 'RGB'
+        mean, std = get_normalization(in_channels)
+        self.mean = torch.tensor(mean).view(-1, 1, 1)
+        self.std = torch.tensor(std).view(-1, 1, 1)
+    
+    def __call__(self, image):
+        """
+        Preprocess one image
+        
+        Args:
+            image: PIL Image
+        
+        Returns:
+            Float tensor of shape (channels, height, width)
+        """
+        return self.normalize(self.pixels(image))
+    
+    def pixels(self, image):
+        """
+        Convert and resize one image to the model's input geometry
+        
+        Args:
+            image: PIL Image
+        
+        Returns:
+            uint8 array of shape (height, width), or (height, width, 3) for RGB
+        """
+        if image.mode != self.mode:
+            image = image.convert(self.mode)
+        height, width = self.input_size
+        if image.size != (width, height):
+            image = image.resize((width, height), Image.BILINEAR)
+        return np.array(image, dtype=np.uint8)
+    
+    def normalize(self, pixels):
+        """
+        Normalize images prepared by pixels()
+        
+        Args:
+            pixels: uint8 array of one image, or a stack of them
+        
+        Returns:
+            Float tensor of shape (channels, height, width), or
+            (batch, channels, height, width) for a stack
+        """
+        tensor = torch.from_numpy(pixels).float().div_(255)
+        tensor = tensor.unsqueeze(-3) if self.mode == 'L' else tensor.movedim(-1, -3)
+        return (tensor - self.mean) / self.std
 
 class BarcodeNet(nn.Module):
     """Neural network for barcode detection and digit recognition"""
     
-    def __init__(self, num_digits=13):
+    def __init__(self, num_digits=13, in_channels=3, input_size=DEFAULT_INPUT_SIZE,
+                 layers=DEFAULT_LAYERS, width=DEFAULT_WIDTH, feature_dim=512, block_widths=None):
         """
         Initialize the barcode recognition network
         
         Args:
             num_digits: Maximum number of digits in barcode (default: 13 for EAN-13)
+            in_channels: Number of input channels (3 for RGB, 1 for grayscale)
+            input_size: Input image size as (height, width), e.g. (96, 320)
+                for a wide grayscale strip. The backbone pools globally, so
+                this only records the geometry the model is trained for.
+            layers: Residual blocks in each of the four backbone stages
+                (default: ResNet18). Fewer blocks give a shallower student.
+            width: Channels of the first stage, doubled at every later stage
+                (default: 64). Smaller widths give a narrower student.
+            feature_dim: Size of the shared feature vector read by the heads
+            block_widths: Inner channels of every residual block in order
+                (default: the block's output channels). Set by structured
+                pruning, see prune_model.py.
         """
         super(BarcodeNet, self).__init__()
         
-        # Use ResNet18 as backbone
-        self.backbone = resnet18(pretrained=False)
+        self.num_digits = num_digits
+        self.in_channels = in_channels
+        self.input_size = tuple(input_size)
+        self.layers = tuple(layers)
+        self.width = width
+        self.feature_dim = feature_dim
+        self.block_widths = list(block_widths) if block_widths is not None else None
+        
+        # ResNet18 backbone (by default), optionally shallower, narrower or pruned
+        self.backbone = ResNetBackbone(self.layers, width, in_channels,
+                                       block_widths=self.block_widths)
         
         # Replace the final layer for digit classification
         # Output: num_digits positions x 11 classes (0-9 + no digit)
         num_features = self.backbone.fc.in_features
-        self.backbone.fc = nn.Linear(num_features, 512)
+        self.backbone.fc = nn.Linear(num_features, feature_dim)
         
         # Digit prediction heads
         self.digit_heads = nn.ModuleList([
-            nn.Linear(512, 11) for _ in range(num_digits)
+            nn.Linear(feature_dim, 11) for _ in range(num_digits)
         ])
         
         # Barcode presence detector
-        self.presence_head = nn.Linear(512, 2)
+        self.presence_head = nn.Linear(feature_dim, 2)
+    
+    def residual_blocks(self):
+        """
+        Get the residual blocks of the backbone
+        
+        Returns:
+            List of BasicBlock modules in forward order
+        """
+        return [block for stage in (self.backbone.layer1, self.backbone.layer2,
+                                    self.backbone.layer3, self.backbone.layer4)
+                for block in stage]
+    
+    def get_config(self):
+        """
+        Get the constructor arguments needed to rebuild this network
+        
+        Returns:
+            Dictionary of BarcodeNet keyword arguments
+        """
+        return {
+            'num_digits': self.num_digits,
+            'in_channels': self.in_channels,
+            'input_size': list(self.input_size),
+            'layers': list(self.layers),
+            'width': self.width,
+            'feature_dim': self.feature_dim,
+            'block_widths': self.block_widths
+        }
     
     def forward(self, x):
         """
@@ -45,7 +790,7 @@ class BarcodeNet(nn.Module):
         
         Args:
             x: Input image tensor
-            
+        
         Returns:
             Tuple of (presence_logits, digit_logits)
         """
@@ -59,37 +804,167 @@ class BarcodeNet(nn.Module):
         
         return presence, torch.stack(digits, dim=1)
 
+def _calibration_batches(model, num_batches=4, batch_size=16, seed=0):
+    """
+    Render synthetic barcodes matching a model's input for quantization
+    
+    Args:
+        model: BarcodeNet to calibrate
+        num_batches: Number of batches
+        batch_size: Images per batch
+        seed: Random seed, the same calibration data every time
+    
+    Returns:
+        List of normalized input tensors
+    """
+    from barcode_renderer import BarcodeBatchRenderer, to_model_input
+    
+    height, width = model.input_size
+    renderer = BarcodeBatchRenderer(image_size=(width, height))
+    rng = np.random.default_rng(seed)
+    batches = []
+    for _ in range(num_batches):
+        digits, lengths = renderer.random_labels(batch_size, rng)
+        batches.append(to_model_input(renderer.render(digits, lengths, rng), model.in_channels))
+    return batches
+
+def build_runner(model, backend='eager', calibration=None):
+    """
+    Wrap a BarcodeNet in an execution backend
+    
+    Args:
+        model: BarcodeNet in eval mode
+        backend: One of BACKENDS:
+            'eager': the PyTorch module as is
+            'channels_last': eager with NHWC weights and inputs
+            'torchscript': traced and frozen TorchScript graph
+            'quantized': static int8 quantization (FX graph mode, CPU only)
+            'onnxruntime': ONNX export run by onnxruntime (CPU only, needs
+                the onnxruntime package)
+        calibration: Input batches for 'quantized' (default: synthetic barcodes)
+    
+    Returns:
+        Callable mapping an input batch to (presence_logits, digit_logits)
+    """
+    height, width = model.input_size
+    example = torch.zeros(1, model.in_channels, height, width,
+                          device=next(model.parameters()).device)
+    
+    if backend == 'eager':
+        return model
+    
+    if backend == 'channels_last':
+        model.to(memory_format=torch.channels_last)
+        return lambda x: model(x.contiguous(memory_format=torch.channels_last))
+    
+    if backend == 'torchscript':
+        with torch.no_grad():
+            return torch.jit.freeze(torch.jit.trace(model, example))
+    
+    if backend == 'quantized':
+        from torch.ao.quantization import get_default_qconfig_mapping
+        from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+        
+        prepared = prepare_fx(copy.deepcopy(model).cpu().eval(),
+                              get_default_qconfig_mapping('x86'), (example.cpu(),))
+        with torch.no_grad():
+            for batch in calibration or _calibration_batches(model):
+                prepared(batch)
+        return convert_fx(prepared)
+    
+    if backend == 'onnxruntime':
+        import onnxruntime
+        
+        buffer = io.BytesIO()
+        torch.onnx.export(copy.deepcopy(model).cpu(), example.cpu(), buffer,
+                          input_names=['image'], output_names=['presence', 'digits'],
+                          dynamic_axes={name: {0: 'batch'} for name in
+                                        ('image', 'presence', 'digits')},
+                          opset_version=17)
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = torch.get_num_threads()
+        session = onnxruntime.InferenceSession(buffer.getvalue(), options,
+                                               providers=['CPUExecutionProvider'])
+        
+        def run(x):
+            presence, digits = session.run(None, {'image': x.cpu().numpy()})
+            return torch.from_numpy(presence), torch.from_numpy(digits)
+        return run
+    
+    raise ValueError(f"Unknown backend: {backend}")
+
 class BarcodeDetector:
     """Barcode detector using PyTorch neural network"""
     
-    def __init__(self, model_path=None):
+    def __init__(self, model_path=None, decode_mode='greedy', top_k=3, min_confidence=0.0,
+                 frame_gate=None, backend='eager', strict=False, tta=None):
         """
         Initialize the barcode detector
         
         Args:
             model_path: Path to pre-trained model (optional)
+            decode_mode: 'greedy' for per-position argmax, or 'checksum' to
+                return the most probable sequence with a valid EAN-13, EAN-8
+                or UPC-A check digit
+            top_k: Candidate digits per position searched in checksum mode
+            min_confidence: Minimum sequence probability accepted in checksum mode
+            frame_gate: FrameQualityGate applied to camera frames before
+                inference (optional)
+            backend: Execution backend of the model, one of BACKENDS
+                (see build_runner)
+            strict: Raise when model_path cannot be loaded instead of
+                falling back to an untrained model
+            tta: TestTimeAugmentation retrying images the plain pass does
+                not read confidently (optional)
         """
+        if decode_mode not in ('greedy', 'checksum'):
+            raise ValueError(f"Unknown decode mode: {decode_mode}")
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend: {backend}")
+        
+        self.decode_mode = decode_mode
+        self.top_k = top_k
+        self.min_confidence = min_confidence
+        self.frame_gate = frame_gate
+        self.tta = tta
+        self.last_rejection = None
+        self._last_result = None
+        self.backend = backend
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        if backend in ('quantized', 'onnxruntime'):
+            self.device = torch.device('cpu')
         self.model = BarcodeNet()
         
         if model_path:
             try:
-                self.model.load_state_dict(torch.load(model_path, map_location=self.device))
+                self.model = load_model(model_path, map_location=self.device)
                 print(f"Loaded model from {model_path}")
             except Exception as e:
+                if strict:
+                    raise
                 print(f"Could not load model from {model_path}: {e}")
                 print("Using untrained model")
         
         self.model.to(self.device)
         self.model.eval()
+        self.runner = build_runner(self.model, backend)
         
-        # Image preprocessing
-        self.transform = transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                               std=[0.229, 0.224, 0.225])
-        ])
+        # Image preprocessing for the model's input geometry
+        self.transform = ImageTransform(self.model.input_size, self.model.in_channels)
+    
+    def open_image(self, source, max_pixels=MAX_IMAGE_PIXELS):
+        """
+        Decode an image file at the resolution and mode the model needs
+        
+        Args:
+            source: File path or binary file object
+            max_pixels: Largest accepted decoded image (width x height)
+        
+        Returns:
+            PIL Image (see decode_image)
+        """
+        return decode_image(source, self.model.input_size, self.model.in_channels == 1,
+                            max_pixels)
     
     def detect_barcode(self, image_data, size):
         """
@@ -98,7 +973,7 @@ class BarcodeDetector:
         Args:
             image_data: Raw image pixel data
             size: Tuple of (width, height)
-            
+        
         Returns:
             Barcode number as string, or None if not detected
         """
@@ -109,31 +984,43 @@ class BarcodeDetector:
             if image is None:
                 return None
             
-            # Transform image
-            image_tensor = self.transform(image).unsqueeze(0).to(self.device)
-            
-            # Run inference
-            with torch.no_grad():
-                presence_logits, digit_logits = self.model(image_tensor)
-            
-            # Check if barcode is present
-            presence_probs = torch.softmax(presence_logits, dim=1)
-            if presence_probs[0, 1] < 0.5:  # Not confident about barcode presence
+            # Skip inference on frames that cannot give a new reading
+            self.last_rejection = self.check_frame(image)
+            if self.last_rejection == FrameQualityGate.UNCHANGED:
+                return self._last_result
+            if self.last_rejection is not None:
                 return None
             
-            # Decode digits
-            barcode_number = self._decode_digits(digit_logits)
+            # Transform image, run inference and decode, with test-time
+            # augmentation when configured
+            image_tensor = self.transform(image).unsqueeze(0)
+            barcode_number = self.detect_tensor(image_tensor)[0]
             
             # Validate barcode
-            if barcode_number and len(barcode_number) >= 8:
-                return barcode_number
-            
-            return None
+            if not barcode_number or len(barcode_number) < 8:
+                barcode_number = None
             
+            self._last_result = barcode_number
+            return barcode_number
+        
         except Exception as e:
             print(f"Error detecting barcode: {e}")
             return None
     
+    def check_frame(self, image):
+        """
+        Run the frame quality gate on an image
+        
+        Args:
+            image: PIL Image
+        
+        Returns:
+            Rejection reason code, or None if the frame should be processed
+        """
+        if self.frame_gate is None:
+            return None
+        return self.frame_gate.check(image)
+    
     def _process_image_data(self, image_data, size):
         """
         Process raw image data to PIL Image
@@ -141,7 +1028,7 @@ class BarcodeDetector:
         Args:
             image_data: Raw pixel data
             size: Tuple of (width, height)
-            
+        
         Returns:
             PIL Image or None
         """
@@ -168,18 +1055,48 @@ class BarcodeDetector:
             # Create PIL Image
             image = Image.fromarray(arr, mode='RGB')
             return image
-            
+        
         except Exception as e:
             print(f"Error processing image data: {e}")
             return None
     
+    def _decode(self, digit_logits):
+        """
+        Decode digit predictions with the configured decode mode
+        
+        Args:
+            digit_logits: Tensor of digit predictions
+        
+        Returns:
+            Barcode number as string, or None
+        """
+        if self.decode_mode == 'checksum':
+            barcode, confidence = self._decode_digits_checksum(digit_logits)
+            if barcode is None or confidence < self.min_confidence:
+                return None
+            return barcode
+        
+        return self._decode_digits(digit_logits)
+    
+    def _decode_digits_checksum(self, digit_logits):
+        """
+        Decode the most probable checksum-valid barcode number
+        
+        Args:
+            digit_logits: Tensor of digit predictions
+        
+        Returns:
+            Tuple of (barcode number or None, sequence probability)
+        """
+        return decode_checksum(digit_logits[:1], top_k=self.top_k)[0]
+    
     def _decode_digits(self, digit_logits):
         """
         Decode digit predictions to barcode number
         
         Args:
             digit_logits: Tensor of digit predictions
-            
+        
         Returns:
             Barcode number as string
         """
@@ -202,30 +1119,191 @@ class BarcodeDetector:
         
         Args:
             image_path: Path to image file
-            
+        
         Returns:
             Barcode number as string, or None if not detected
         """
         try:
-            image = Image.open(image_path).convert('RGB')
-            
-            # Transform image
-            image_tensor = self.transform(image).unsqueeze(0).to(self.device)
-            
-            # Run inference
-            with torch.no_grad():
-                presence_logits, digit_logits = self.model(image_tensor)
-            
-            # Check if barcode is present
-            presence_probs = torch.softmax(presence_logits, dim=1)
-            if presence_probs[0, 1] < 0.5:
-                return None
-            
-            # Decode digits
-            barcode_number = self._decode_digits(digit_logits)
-            
-            return barcode_number
-            
+            image = self.open_image(image_path)
+            return self.detect_image(image)
+        
         except Exception as e:
             print(f"Error detecting barcode from file: {e}")
             return None
+    
+    def detect_image(self, image, timings=None):
+        """
+        Detect barcode in a decoded image
+        
+        Args:
+            image: PIL Image
+            timings: Dictionary receiving the seconds spent in the
+                'preprocess', 'forward' and 'decode' stages (optional)
+        
+        Returns:
+            Barcode number as string, or None if not detected
+        """
+        return self.detect_images([image], timings)[0]
+    
+    def detect_images(self, images, timings=None):
+        """
+        Detect barcodes in several decoded images with one forward pass
+        
+        Args:
+            images: List of PIL Images
+            timings: Dictionary receiving the seconds spent in the
+                'preprocess', 'forward' and 'decode' stages (optional)
+        
+        Returns:
+            List with a barcode number or None for every image
+        """
+        start = time.perf_counter()
+        
+        # Transform images
+        image_tensor = torch.stack([self.transform(image) for image in images])
+        preprocessed = time.perf_counter()
+        
+        barcodes = self.detect_tensor(image_tensor, timings)
+        if timings is not None:
+            timings['preprocess'] = preprocessed - start
+        
+        return barcodes
+    
+    def detect_tensor(self, image_tensor, timings=None):
+        """
+        Detect barcodes in a batch of preprocessed images
+        
+        Args:
+            image_tensor: Tensor of shape (batch, channels, height, width)
+                produced by self.transform
+            timings: Dictionary receiving the seconds spent in the
+                'forward' and 'decode' stages (optional)
+        
+        Returns:
+            List with a barcode number or None for every image
+        """
+        start = time.perf_counter()
+        
+        # Run inference
+        with torch.no_grad():
+            presence_logits, digit_logits = self.runner(image_tensor.to(self.device))
+        if timings is not None and self.device.type == 'cuda':
+            torch.cuda.synchronize()
+        forwarded = time.perf_counter()
+        
+        augmented = 0.0
+        if self.tta is not None:
+            barcodes, augmented = self._detect_augmented(image_tensor, presence_logits,
+                                                         digit_logits)
+        else:
+            # Decode digits of the images a barcode is present in
+            presence_probs = torch.softmax(presence_logits, dim=1)[:, 1].tolist()
+            barcodes = [self._decode(digit_logits[idx:idx + 1]) if probability >= 0.5 else None
+                        for idx, probability in enumerate(presence_probs)]
+        
+        if timings is not None:
+            timings['forward'] = forwarded - start
+            timings['decode'] = time.perf_counter() - forwarded - augmented
+            if self.tta is not None:
+                timings['tta'] = augmented
+        
+        return barcodes
+    
+    def _detect_augmented(self, image_tensor, presence_logits, digit_logits):
+        """
+        Decode a batch with test-time augmentation
+        
+        Images whose plain pass already reads confidently with a valid check
+        digit in the decode mode, or clearly holds no barcode, are done. The others run through the
+        augmentation stages, one forward call per stage for all of them,
+        until their averaged probabilities settle either way; whatever is
+        left is decoded from the average of every pass.
+        
+        Args:
+            image_tensor: Preprocessed input batch
+            presence_logits: Presence logits of the plain pass
+            digit_logits: Digit logits of the plain pass
+        
+        Returns:
+            Tuple of (list with a barcode number or None for every image,
+            seconds spent building and running the variants)
+        """
+        tta = self.tta
+        augmented = 0.0
+        
+        # Running sums of the probabilities of every pass, per image
+        presence_sum = torch.softmax(presence_logits.float(), dim=1)[:, 1].cpu()
+        digit_sum = torch.softmax(digit_logits.float(), dim=2).cpu()
+        passes = torch.ones(len(image_tensor))
+        barcodes = [None] * len(image_tensor)
+        
+        pending = list(range(len(image_tensor)))
+        stages = iter(tta.stages)
+        while True:
+            # Stop early for the images that now read confidently, and for
+            # those that clearly hold no barcode
+            average = digit_sum[pending] / passes[pending].view(-1, 1, 1)
+            presence = presence_sum[pending] / passes[pending]
+            readings = self._confident_readings(average)
+            remaining = []
+            for idx, (barcode, confidence), probability in zip(pending, readings,
+                                                               presence.tolist()):
+                if probability < tta.presence_floor:
+                    continue
+                if barcode is not None and confidence >= tta.min_confidence and probability >= 0.5:
+                    barcodes[idx] = barcode
+                else:
+                    remaining.append(idx)
+            pending = remaining
+            
+            stage = next(stages, None)
+            if not pending or stage is None:
+                break
+            
+            stage_start = time.perf_counter()
+            variants = TestTimeAugmentation.variants(image_tensor[pending].to(self.device), stage,
+                                                     self.transform.mean, self.transform.std)
+            with torch.no_grad():
+                stage_presence, stage_digits = self.runner(variants)
+            augmented += time.perf_counter() - stage_start
+            stage_presence = torch.softmax(stage_presence.float(), dim=1)[:, 1].cpu()
+            stage_digits = torch.softmax(stage_digits.float(), dim=2).cpu()
+            index = torch.tensor(pending)
+            presence_sum[index] += stage_presence.view(len(pending), -1).sum(dim=1)
+            digit_sum[index] += stage_digits.view(len(pending), len(stage),
+                                                  *stage_digits.shape[1:]).sum(dim=1)
+            passes[index] += len(stage)
+        
+        # Best effort with the configured decode mode for the rest
+        for idx in pending:
+            if presence_sum[idx] / passes[idx] >= 0.5:
+                average = digit_sum[idx:idx + 1] / passes[idx]
+                barcodes[idx] = self._decode(average.clamp_min(1e-12).log())
+        
+        return barcodes, augmented
+    
+    def _confident_readings(self, digit_probs):
+        """
+        Read averaged digit probabilities in the configured decode mode
+        
+        Args:
+            digit_probs: Tensor of shape (batch, positions, 11)
+        
+        Returns:
+            List of (barcode or None, sequence probability) tuples; a barcode
+            is only given where _decode would return the same one and its
+            check digit is valid
+        """
+        if self.decode_mode == 'checksum':
+            readings = decode_checksum(digit_probs.clamp_min(1e-12).log(), top_k=self.top_k)
+            return [(barcode if confidence >= self.min_confidence else None, confidence)
+                    for barcode, confidence in readings]
+        
+        # Greedy: the per-position argmax and its probability, which only
+        # ends the augmentation when its check digit is valid
+        confidences = digit_probs.max(dim=2).values.prod(dim=1).tolist()
+        readings = []
+        for idx, confidence in enumerate(confidences):
+            barcode = self._decode_digits(digit_probs[idx:idx + 1])
+            readings.append((barcode if is_valid_checksum(barcode) else None, confidence))
+        return readings
@@ -0,0 +1,165 @@
+"""
+Pre-rendered barcode dataset shards
+Writes synthetic samples once to memory-mapped uint8 .npy shards, so training
+epochs read them instead of rendering every image again
+
+Usage:
+    python barcode_shards.py data/train --samples 1000000
+    python barcode_shards.py data/val --samples 10000 --seed 1
+"""
+
+import os
+import json
+import argparse
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+from barcode_renderer import BarcodeBatchRenderer, to_model_input
+
+INDEX_FILE = 'index.json'
+
+def build_shards(output_dir, num_samples, shard_size=50000, image_size=(224, 224), seed=0,
+                 render_batch_size=256):
+    """
+    Render synthetic barcodes into memory-mapped shards
+    
+    Each shard is written through np.lib.format.open_memmap, so memory use
+    stays at one render batch whatever the number of samples.
+    
+    Args:
+        output_dir: Directory receiving the shards and index.json
+        num_samples: Total number of samples
+        shard_size: Maximum number of samples per shard
+        image_size: Size of generated images as (width, height)
+        seed: Random seed, the same seed always builds the same shards
+        render_batch_size: Number of samples rendered at once
+    
+    Returns:
+        Path to the written index file
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    width, height = image_size
+    renderer = BarcodeBatchRenderer(image_size=image_size)
+    
+    shards = []
+    for shard_idx, start in enumerate(range(0, num_samples, shard_size)):
+        count = min(shard_size, num_samples - start)
+        name = f"shard_{shard_idx:05d}"
+        images = np.lib.format.open_memmap(os.path.join(output_dir, f"{name}_images.npy"),
+                                           mode='w+', dtype=np.uint8,
+                                           shape=(count, height, width))
+        digits = np.lib.format.open_memmap(os.path.join(output_dir, f"{name}_digits.npy"),
+                                           mode='w+', dtype=np.uint8, shape=(count, 13))
+        
+        for offset in range(0, count, render_batch_size):
+            size = min(render_batch_size, count - offset)
+            rng = np.random.default_rng([seed, shard_idx, offset])
+            batch_digits, lengths = renderer.random_labels(size, rng)
+            images[offset:offset + size] = renderer.render(batch_digits, lengths, rng)
+            digits[offset:offset + size] = batch_digits
+        
+        images.flush()
+        digits.flush()
+        del images, digits
+        shards.append({'name': name, 'count': count})
+        print(f"Wrote {name}: {count} samples")
+    
+    index_path = os.path.join(output_dir, INDEX_FILE)
+    with open(index_path, 'w') as f:
+        json.dump({
+            'num_samples': num_samples,
+            'image_size': [width, height],
+            'seed': seed,
+            'shards': shards
+        }, f, indent=2)
+    
+    print(f"Dataset index written to {index_path}")
+    return index_path
+
+class ShardedBarcodeDataset(Dataset):
+    """Read pre-rendered barcode shards through memory maps"""
+    
+    def __init__(self, data_dir, in_channels=3):
+        """
+        Initialize the sharded dataset
+        
+        Args:
+            data_dir: Directory written by build_shards
+            in_channels: 3 for RGB model input, 1 for grayscale model input.
+                Shards are stored as grayscale and expanded when loaded.
+        """
+        self.data_dir = data_dir
+        self.in_channels = in_channels
+        
+        with open(os.path.join(data_dir, INDEX_FILE)) as f:
+            index = json.load(f)
+        
+        self.image_size = tuple(index['image_size'])
+        self.shard_names = [shard['name'] for shard in index['shards']]
+        self.offsets = np.cumsum([0] + [shard['count'] for shard in index['shards']])
+        
+        # Memory maps are opened lazily, so every DataLoader worker maps the
+        # files itself instead of inheriting them through pickling
+        self._images = None
+        self._digits = None
+    
+    def _open(self):
+        """Memory-map all shards"""
+        self._images = []
+        self._digits = []
+        for name in self.shard_names:
+            path = os.path.join(self.data_dir, name)
+            # Copy-on-write maps give writable arrays without copying the file
+            self._images.append(np.load(f"{path}_images.npy", mmap_mode='c'))
+            self._digits.append(np.load(f"{path}_digits.npy", mmap_mode='c'))
+    
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_images'] = None
+        state['_digits'] = None
+        return state
+    
+    def __len__(self):
+        return int(self.offsets[-1])
+    
+    def __getitem__(self, idx):
+        """
+        Read one sample
+        
+        Args:
+            idx: Sample index, or (epoch, index) pair from EpochSampler
+        
+        Returns:
+            Tuple of (image_tensor, presence_label, digit_labels)
+        """
+        if isinstance(idx, tuple):
+            _, idx = idx
+        if idx < 0 or idx >= len(self):
+            raise IndexError(idx)
+        if self._images is None:
+            self._open()
+        
+        shard = int(np.searchsorted(self.offsets, idx, side='right')) - 1
+        local = idx - self.offsets[shard]
+        image = self._images[shard][local:local + 1]
+        digits = self._digits[shard][local]
+        
+        return (to_model_input(image, self.in_channels)[0], 1,
+                torch.from_numpy(digits).long())
+
+def main():
+    """Build a dataset from the command line"""
+    parser = argparse.ArgumentParser(description="Pre-render synthetic barcode dataset shards")
+    parser.add_argument('output_dir', help="Directory receiving the shards")
+    parser.add_argument('--samples', type=int, default=5000, help="Number of samples")
+    parser.add_argument('--shard-size', type=int, default=50000, help="Samples per shard")
+    parser.add_argument('--width', type=int, default=224, help="Image width")
+    parser.add_argument('--height', type=int, default=224, help="Image height")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+    
+    build_shards(args.output_dir, args.samples, shard_size=args.shard_size,
+                 image_size=(args.width, args.height), seed=args.seed)
+
+if __name__ == '__main__':
+    main()
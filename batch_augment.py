@@ -0,0 +1,302 @@
+"""
+Batched tensor augmentation for barcode training
+Applies camera-like distortions to a whole batch with tensor operations
+after it has been loaded, instead of per-image PIL operations
+"""
+
+import math
+import torch
+import torch.nn.functional as F
+from barcode_detector import get_normalization
+
+# Standard JPEG luminance quantization table (quality 50)
+JPEG_LUMA_TABLE = [
+    [16, 11, 10, 16, 24, 40, 51, 61],
+    [12, 12, 14, 19, 26, 58, 60, 55],
+    [14, 13, 16, 24, 40, 57, 69, 56],
+    [14, 17, 22, 29, 51, 87, 80, 62],
+    [18, 22, 37, 56, 68, 109, 103, 77],
+    [24, 35, 55, 64, 81, 104, 113, 92],
+    [49, 64, 78, 87, 103, 121, 120, 101],
+    [72, 92, 95, 98, 112, 100, 103, 99]
+]
+
+# Half size of the bars of the synthetic barcodes, as a fraction of the half
+# width and half height of the image (bars start one bar width in from the
+# left and span the middle half of the height)
+BAR_EXTENT = (0.93, 0.5)
+
+# Distortion strengths tried for a warp until the bars stay in frame
+WARP_STRENGTHS = (1.0, 0.5, 0.25, 0.125, 0.0)
+
+def _dct_matrix(size=8):
+    """Orthonormal DCT-II matrix"""
+    n = torch.arange(size, dtype=torch.float32)
+    matrix = torch.cos(math.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size))
+    matrix[0] *= 1 / math.sqrt(2)
+    return matrix * math.sqrt(2 / size)
+
+class BatchAugmenter:
+    """Random geometric and photometric distortions for normalized image batches"""
+    
+    def __init__(self, max_rotation=12.0, max_scale=0.15, max_translate=0.08, max_shear=0.1,
+                 max_perspective=0.15, max_blur=1.5, max_noise=0.06, max_brightness=0.25,
+                 max_contrast=0.35, jpeg_quality=(20, 80), prob=0.5, bar_extent=BAR_EXTENT):
+        """
+        Initialize the augmenter
+        
+        Args:
+            max_rotation: Maximum rotation in degrees
+            max_scale: Maximum relative zoom in or out
+            max_translate: Maximum shift as a fraction of the image size
+            max_shear: Maximum horizontal shear factor
+            max_perspective: Maximum perspective distortion
+            max_blur: Maximum gaussian blur sigma in pixels
+            max_noise: Maximum gaussian noise standard deviation (0-1 range)
+            max_brightness: Maximum brightness offset (0-1 range)
+            max_contrast: Maximum relative contrast change
+            jpeg_quality: (min, max) quality of the simulated JPEG compression
+            prob: Probability of applying each distortion to a sample
+            bar_extent: (x, y) half size of the centered region the warp
+                keeps in frame, in normalized coordinates (None: no limit)
+        """
+        self.max_rotation = max_rotation
+        self.max_scale = max_scale
+        self.max_translate = max_translate
+        self.max_shear = max_shear
+        self.max_perspective = max_perspective
+        self.max_blur = max_blur
+        self.max_noise = max_noise
+        self.max_brightness = max_brightness
+        self.max_contrast = max_contrast
+        self.jpeg_quality = jpeg_quality
+        self.prob = prob
+        self.bar_extent = bar_extent
+        self._dct = _dct_matrix()
+        self._jpeg_table = torch.tensor(JPEG_LUMA_TABLE, dtype=torch.float32)
+    
+    def __call__(self, images, generator=None):
+        """
+        Augment a batch
+        
+        Args:
+            images: Normalized tensor of shape (batch, channels, height, width)
+            generator: torch.Generator for reproducible augmentation (optional)
+        
+        Returns:
+            Augmented tensor with the same shape and normalization
+        """
+        mean, std = get_normalization(images.shape[1])
+        mean = torch.tensor(mean, device=images.device).view(1, -1, 1, 1)
+        std = torch.tensor(std, device=images.device).view(1, -1, 1, 1)
+        self._generator = generator
+        
+        with torch.no_grad():
+            x = images.float() * std + mean
+            x = self.warp(x)
+            x = self.blur(x)
+            x = self.color(x)
+            x = self.jpeg(x)
+            x = self.noise(x)
+            x = x.clamp_(0.0, 1.0)
+        
+        return ((x - mean) / std).to(images.dtype)
+    
+    def _uniform(self, batch_size, limit, device):
+        """Uniform samples in [-limit, limit]"""
+        values = torch.rand(batch_size, generator=self._generator) * 2 - 1
+        return (values * limit).to(device)
+    
+    def _mask(self, batch_size, device):
+        """Per-sample mask selecting the samples a distortion is applied to"""
+        return (torch.rand(batch_size, generator=self._generator) < self.prob).to(device)
+    
+    def _select(self, batch_size):
+        """Indices of the samples a distortion is applied to"""
+        return torch.nonzero(self._mask(batch_size, 'cpu')).flatten()
+    
+    def warp(self, x):
+        """
+        Random affine transform followed by a perspective distortion
+        
+        A warp that would move part of the bar region out of the frame is
+        scaled down, by halving the strength of every distortion until the
+        bars stay in, down to no warp at all.
+        """
+        selected = self._select(x.shape[0])
+        if len(selected) == 0:
+            return x
+        
+        subset = x[selected.to(x.device)]
+        count, _, height, width = subset.shape
+        device = x.device
+        params = torch.stack([
+            self._uniform(count, math.radians(self.max_rotation), device),
+            self._uniform(count, self.max_scale, device),
+            self._uniform(count, self.max_shear, device),
+            self._uniform(count, self.max_translate * 2, device),
+            self._uniform(count, self.max_translate * 2, device),
+            self._uniform(count, self.max_perspective, device),
+            self._uniform(count, self.max_perspective, device)
+        ], dim=1)
+        
+        if self.bar_extent is not None:
+            # Strongest warp of each sample that keeps the bars in frame
+            strengths = torch.tensor(WARP_STRENGTHS, device=device)
+            candidates = params[:, None, :] * strengths[None, :, None]
+            inside = self._keeps_in_frame(candidates.view(-1, params.shape[1]), width / height)
+            first = inside.view(count, len(WARP_STRENGTHS)).float().argmax(dim=1)
+            params = candidates[torch.arange(count, device=device), first]
+        
+        theta, perspective = self._warp_transform(params, width / height)
+        grid = F.affine_grid(theta, subset.shape, align_corners=False)
+        
+        # Perspective: divide by a random plane through the output coordinates
+        base = F.affine_grid(torch.eye(2, 3, device=device).expand(count, 2, 3),
+                             subset.shape, align_corners=False)
+        grid = grid / (1 + (base * perspective.view(-1, 1, 1, 2)).sum(dim=-1)).unsqueeze(-1)
+        
+        # Sample the inverted image so the area outside the frame is white
+        x[selected.to(device)] = 1 - F.grid_sample(1 - subset, grid, mode='bilinear',
+                                                   padding_mode='zeros', align_corners=False)
+        return x
+    
+    @staticmethod
+    def _warp_transform(params, aspect):
+        """
+        Build the warp of sampled distortions
+        
+        Args:
+            params: Tensor (count, 7) of rotation, zoom, shear, x and y shift,
+                x and y perspective
+            aspect: Image width / height
+        
+        Returns:
+            Tuple of (affine output to input mapping (count, 2, 3) in
+            normalized coordinates, perspective plane (count, 2))
+        """
+        angle, zoom, shear, tx, ty = params[:, :5].unbind(dim=1)
+        
+        # The aspect ratio correction keeps rotations rigid on non-square images
+        scale = 1 + zoom
+        cos, sin = torch.cos(angle) / scale, torch.sin(angle) / scale
+        theta = torch.stack([
+            torch.stack([cos, (cos * shear - sin) / aspect, tx], dim=1),
+            torch.stack([sin * aspect, sin * shear + cos, ty], dim=1)
+        ], dim=1)
+        return theta, params[:, 5:]
+    
+    def _keeps_in_frame(self, params, aspect):
+        """
+        Check that warps keep the bar region in frame
+        
+        The frame is warped onto a quadrilateral of the input image; the
+        bars stay visible if the corners of their region lie inside it.
+        
+        Args:
+            params: Tensor (count, 7) of distortions (see _warp_transform)
+            aspect: Image width / height
+        
+        Returns:
+            Boolean tensor (count,)
+        """
+        theta, perspective = self._warp_transform(params, aspect)
+        frame = torch.tensor([[-1.0, -1.0], [1.0, -1.0], [1.0, 1.0], [-1.0, 1.0]],
+                             device=params.device)
+        
+        # Input positions of the frame corners, in order around the frame
+        corners = (frame[None] @ theta[:, :, :2].transpose(1, 2) + theta[:, None, :, 2])
+        corners = corners / (1 + perspective[:, None, :] @ frame.T).transpose(1, 2)
+        
+        # A point is inside the convex quadrilateral if it lies on the inner
+        # side of every edge
+        bar_x, bar_y = self.bar_extent
+        bars = torch.tensor([[-bar_x, -bar_y], [bar_x, -bar_y], [bar_x, bar_y], [-bar_x, bar_y]],
+                            device=params.device)
+        edges = corners.roll(-1, dims=1) - corners
+        offsets = bars[None, None, :, :] - corners[:, :, None, :]
+        cross = (edges[:, :, None, 0] * offsets[..., 1] - edges[:, :, None, 1] * offsets[..., 0])
+        return (cross >= 0).all(dim=2).all(dim=1)
+    
+    def blur(self, x):
+        """Separable gaussian blur with a random sigma per sample"""
+        selected = self._select(x.shape[0])
+        if self.max_blur <= 0 or len(selected) == 0:
+            return x
+        
+        subset = x[selected.to(x.device)]
+        count, channels, height, width = subset.shape
+        device = x.device
+        sigma = (torch.rand(count, generator=self._generator) * self.max_blur).to(device)
+        
+        radius = int(math.ceil(3 * self.max_blur))
+        offsets = torch.arange(-radius, radius + 1, device=device, dtype=x.dtype)
+        kernel = torch.exp(-offsets[None, :] ** 2 / (2 * sigma[:, None].clamp(min=1e-3) ** 2))
+        kernel = kernel / kernel.sum(dim=1, keepdim=True)
+        kernel = kernel.repeat_interleave(channels, dim=0)
+        
+        # One group per (sample, channel) applies every sample's own kernel
+        flat = subset.reshape(1, count * channels, height, width)
+        flat = F.conv2d(F.pad(flat, (radius, radius, 0, 0), mode='replicate'),
+                        kernel.view(-1, 1, 1, 2 * radius + 1), groups=count * channels)
+        flat = F.conv2d(F.pad(flat, (0, 0, radius, radius), mode='replicate'),
+                        kernel.view(-1, 1, 2 * radius + 1, 1), groups=count * channels)
+        
+        x[selected.to(device)] = flat.view(count, channels, height, width)
+        return x
+    
+    def color(self, x):
+        """Random brightness and contrast"""
+        batch_size = x.shape[0]
+        device = x.device
+        mask = self._mask(batch_size, device).view(-1, 1, 1, 1)
+        brightness = self._uniform(batch_size, self.max_brightness, device).view(-1, 1, 1, 1)
+        contrast = 1 + self._uniform(batch_size, self.max_contrast, device).view(-1, 1, 1, 1)
+        adjusted = (x - 0.5) * contrast + 0.5 + brightness
+        return torch.where(mask, adjusted, x)
+    
+    def jpeg(self, x):
+        """
+        JPEG-like compression artifacts
+        
+        Quantizes the DCT coefficients of 8x8 blocks with the standard
+        luminance table scaled to a random quality per sample.
+        """
+        selected = self._select(x.shape[0])
+        if len(selected) == 0:
+            return x
+        
+        subset = x[selected.to(x.device)]
+        count, channels, height, width = subset.shape
+        device = x.device
+        low, high = self.jpeg_quality
+        quality = (low + torch.rand(count, generator=self._generator) * (high - low)).to(device)
+        factor = torch.where(quality < 50, 50 / quality, 2 - quality / 50)
+        step = (self._jpeg_table.to(device)[None] * factor.view(-1, 1, 1)).clamp(min=1) / 255
+        
+        pad_h, pad_w = -height % 8, -width % 8
+        padded = F.pad(subset, (0, pad_w, 0, pad_h), mode='replicate')
+        blocks = padded.unfold(2, 8, 8).unfold(3, 8, 8)
+        dct = self._dct.to(device)
+        
+        coeffs = dct @ (blocks - 0.5) @ dct.T
+        step = step.view(count, 1, 1, 1, 8, 8)
+        coeffs = torch.round(coeffs / step) * step
+        blocks = dct.T @ coeffs @ dct + 0.5
+        
+        # (count, channels, rows, cols, 8, 8) -> (count, channels, height, width)
+        restored = blocks.permute(0, 1, 2, 4, 3, 5).reshape(padded.shape)
+        x[selected.to(device)] = restored[:, :, :height, :width]
+        return x
+    
+    def noise(self, x):
+        """Additive gaussian sensor noise"""
+        selected = self._select(x.shape[0])
+        if self.max_noise <= 0 or len(selected) == 0:
+            return x
+        
+        shape = (len(selected),) + tuple(x.shape[1:])
+        sigma = torch.rand(len(selected), generator=self._generator) * self.max_noise
+        noise = torch.randn(shape, generator=self._generator) * sigma.view(-1, 1, 1, 1)
+        x[selected.to(x.device)] += noise.to(x.device)
+        return x
@@ -0,0 +1,262 @@
+"""
+Image sources of the bulk detection endpoint
+Turns a multipart upload, a zip or tar archive or an NDJSON body into a
+stream of (name, image bytes) pairs, reading one image at a time so memory
+does not grow with the size of the upload
+"""
+
+import json
+import base64
+import tarfile
+import zipfile
+import tempfile
+from werkzeug.sansio.multipart import (NEED_DATA, Data, Epilogue, Field, File,
+                                       MultipartDecoder)
+
+# Content types of the supported request bodies
+MULTIPART_TYPES = ('multipart/form-data',)
+ZIP_TYPES = ('application/zip', 'application/x-zip-compressed')
+TAR_TYPES = ('application/x-tar', 'application/gzip', 'application/x-gzip',
+             'application/x-gtar', 'application/x-bzip2', 'application/x-xz')
+NDJSON_TYPES = ('application/x-ndjson', 'application/jsonl', 'application/json-lines')
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp', '.tif', '.tiff')
+
+# Bytes read from the request body at a time
+READ_BYTES = 64 * 1024
+
+# Archives are spooled to disk past this size (zip needs a seekable file)
+SPOOL_BYTES = 8 * 1024 * 1024
+
+# Largest zip archive spooled by default
+MAX_ARCHIVE_BYTES = 512 * 1024 * 1024
+
+class BatchInputError(ValueError):
+    """Malformed entry of a bulk upload"""
+
+class UploadTooLarge(BatchInputError):
+    """Bulk upload larger than the accepted size"""
+
+def is_image_name(name):
+    """Whether an archive member looks like an image"""
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+def iter_multipart(stream, boundary, max_bytes):
+    """
+    Iterate over the files of a multipart/form-data body
+    
+    The body is parsed incrementally, so files are neither spooled nor
+    held in memory beyond the one being read.
+    
+    Args:
+        stream: Readable binary stream of the body
+        boundary: Multipart boundary from the Content-Type header
+        max_bytes: Largest accepted image in bytes
+    
+    Yields:
+        Tuples of (name, image bytes), or (name, BatchInputError)
+    """
+    decoder = MultipartDecoder(boundary.encode('latin-1'))
+    name = None
+    parts = []
+    size = 0
+    while True:
+        chunk = stream.read(READ_BYTES)
+        decoder.receive_data(chunk or None)
+        event = decoder.next_event()
+        while event is not NEED_DATA and not isinstance(event, Epilogue):
+            if isinstance(event, File):
+                name = event.filename or event.name
+                parts = []
+                size = 0
+            elif isinstance(event, Field):
+                # Plain form fields are not images
+                name = None
+            elif isinstance(event, Data) and name is not None:
+                size += len(event.data)
+                if size <= max_bytes:
+                    parts.append(event.data)
+                if not event.more_data:
+                    if size > max_bytes:
+                        yield name, BatchInputError(f"image larger than {max_bytes} bytes")
+                    else:
+                        yield name, b''.join(parts)
+                    name = None
+                    parts = []
+            event = decoder.next_event()
+        if isinstance(event, Epilogue):
+            return
+        if not chunk:
+            raise BatchInputError("truncated multipart body")
+
+def iter_zip(stream, max_bytes, max_archive_bytes=MAX_ARCHIVE_BYTES):
+    """
+    Iterate over the images of a zip archive
+    
+    The central directory is at the end of a zip, so the whole archive is
+    spooled (to disk past SPOOL_BYTES) before the first image is read. The
+    spooling happens in this call rather than on iteration, so an oversized
+    archive is refused before any response is started.
+    
+    Args:
+        stream: Readable binary stream of the archive
+        max_bytes: Largest accepted image in bytes (uncompressed)
+        max_archive_bytes: Largest accepted archive in bytes
+    
+    Returns:
+        Iterator of (name, image bytes) or (name, BatchInputError) tuples
+    
+    Raises:
+        UploadTooLarge: The archive is larger than max_archive_bytes
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    try:
+        size = 0
+        while True:
+            chunk = stream.read(READ_BYTES)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_archive_bytes:
+                raise UploadTooLarge(f"archive larger than {max_archive_bytes} bytes")
+            spool.write(chunk)
+        spool.seek(0)
+    except BaseException:
+        spool.close()
+        raise
+    return _iter_zip_members(spool, max_bytes)
+
+def _iter_zip_members(spool, max_bytes):
+    """Iterate over the images of a spooled zip archive, closing it at the end"""
+    with spool, zipfile.ZipFile(spool) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not is_image_name(info.filename):
+                continue
+            # The declared size is checked first and the read is capped,
+            # so a zip bomb cannot inflate past max_bytes
+            if info.file_size > max_bytes:
+                yield info.filename, BatchInputError(f"image larger than {max_bytes} bytes")
+                continue
+            with archive.open(info) as member:
+                data = member.read(max_bytes + 1)
+            if len(data) > max_bytes:
+                yield info.filename, BatchInputError(f"image larger than {max_bytes} bytes")
+            else:
+                yield info.filename, data
+
+def iter_tar(stream, max_bytes):
+    """
+    Iterate over the images of a tar archive, optionally compressed
+    
+    The archive is read sequentially from the stream, without buffering it.
+    
+    Args:
+        stream: Readable binary stream of the archive
+        max_bytes: Largest accepted image in bytes
+    
+    Yields:
+        Tuples of (name, image bytes), or (name, BatchInputError)
+    """
+    with tarfile.open(fileobj=stream, mode='r|*') as archive:
+        for member in archive:
+            if not member.isfile() or not is_image_name(member.name):
+                continue
+            if member.size > max_bytes:
+                yield member.name, BatchInputError(f"image larger than {max_bytes} bytes")
+                continue
+            yield member.name, archive.extractfile(member).read()
+
+def iter_ndjson(stream, max_bytes):
+    """
+    Iterate over an NDJSON body of {"id": ..., "image": "<base64>"} lines
+    
+    Args:
+        stream: Readable binary stream of the body
+        max_bytes: Largest accepted image in bytes (decoded)
+    
+    Yields:
+        Tuples of (name, image bytes), or (name, BatchInputError)
+    """
+    # Base64 inflates by 4/3, plus room for a data URL prefix and the id
+    max_line = max_bytes * 4 // 3 + 4096
+    line_number = 0
+    while True:
+        line = stream.readline(max_line + 1)
+        if not line:
+            break
+        line_number += 1
+        name = str(line_number)
+        
+        if len(line) > max_line and not line.endswith(b'\n'):
+            # Skip the rest of the oversized line
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(max_line + 1)
+            yield name, BatchInputError(f"image larger than {max_bytes} bytes")
+            continue
+        if not line.strip():
+            continue
+        
+        try:
+            entry = json.loads(line)
+            name = str(entry.get('id', name))
+            image_data = entry['image']
+            
+            # Remove data URL prefix if present
+            if ',' in image_data:
+                image_data = image_data.split(',')[1]
+            
+            yield name, base64.b64decode(image_data)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            yield name, BatchInputError("invalid NDJSON entry")
+
+def iter_uploads(content_type, stream, max_bytes, boundary=None,
+                 max_archive_bytes=MAX_ARCHIVE_BYTES):
+    """
+    Iterate over the images of a bulk upload
+    
+    Args:
+        content_type: MIME type of the request body, without parameters
+        stream: Readable binary stream of the body
+        max_bytes: Largest accepted image in bytes
+        boundary: Boundary of a multipart/form-data body
+        max_archive_bytes: Largest accepted zip archive, the one upload
+            that is spooled instead of streamed
+    
+    Returns:
+        Iterator of (name, image bytes or BatchInputError) tuples
+    
+    Raises:
+        UploadTooLarge: Zip archive larger than max_archive_bytes
+        BatchInputError: Unsupported content type or missing boundary
+    """
+    if content_type in MULTIPART_TYPES:
+        if not boundary:
+            raise BatchInputError("multipart body without boundary")
+        return iter_multipart(stream, boundary, max_bytes)
+    if content_type in ZIP_TYPES:
+        return iter_zip(stream, max_bytes, max_archive_bytes)
+    if content_type in TAR_TYPES:
+        return iter_tar(stream, max_bytes)
+    if content_type in NDJSON_TYPES:
+        return iter_ndjson(stream, max_bytes)
+    raise BatchInputError(f"unsupported content type {content_type or '(none)'}")
+
+def iter_chunks(items, size):
+    """
+    Group an iterator into lists of at most size items
+    
+    Args:
+        items: Iterable
+        size: Largest chunk
+    
+    Yields:
+        Lists of consecutive items
+    """
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,470 @@
+"""
+Benchmark and load-test suite for the barcode detector and server
+Measures the detector steps in-process and the server end to end under
+increasing concurrency, writes JSON results and checks them against a
+stored baseline
+
+Test images come from the synthetic barcode renderer with a fixed seed, so
+runs are reproducible offline.
+
+Usage:
+    python benchmark.py micro --output results.json
+    python benchmark.py load --concurrency 1 2 4 8 --output results.json
+    python benchmark.py startup --workers 4
+    python benchmark.py imports
+    python benchmark.py all --output results.json --baseline baseline.json
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import socket
+import base64
+import argparse
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+import numpy as np
+import torch
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from barcode_detector import (BarcodeDetector, BarcodeNet, TestTimeAugmentation, load_model,
+                              save_model)
+from barcode_renderer import make_labeled_images
+
+MODEL_PATH = 'barcode_model.pth'
+
+# Import statements timed by the import benchmark; the last one is what
+# importing the detector cost while it depended on torchvision
+IMPORT_TARGETS = {
+    'torch': 'import torch',
+    'barcode_detector': 'import barcode_detector',
+    'barcode_detector+torchvision': 'import barcode_detector, torchvision.models, '
+                                    'torchvision.transforms'
+}
+
+# Run in a fresh interpreter: times one import statement and reports the
+# peak RSS (ru_maxrss is in kilobytes on Linux)
+IMPORT_PROBE = """
+import time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+import sys, json, resource
+print(json.dumps({{'import_ms': 1000 * elapsed, 'modules': len(sys.modules),
+                  'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}}))
+"""
+
+def make_test_images(count=16, image_size=(640, 480), seed=0):
+    """
+    Render reproducible synthetic barcode images
+    
+    Args:
+        count: Number of images
+        image_size: Image size as (width, height), like a camera frame
+        seed: Random seed
+    
+    Returns:
+        List of RGB PIL images
+    """
+    return make_labeled_images(count, image_size, seed)[0]
+
+def summarize(timings):
+    """
+    Summarize durations
+    
+    Args:
+        timings: Durations in seconds
+    
+    Returns:
+        Dictionary with mean and percentile latencies in milliseconds and
+        operations per second
+    """
+    timings = np.asarray(timings) * 1000
+    return {
+        'mean_ms': float(timings.mean()),
+        'p50_ms': float(np.percentile(timings, 50)),
+        'p95_ms': float(np.percentile(timings, 95)),
+        'p99_ms': float(np.percentile(timings, 99)),
+        'ops_per_sec': float(1000 / timings.mean())
+    }
+
+def time_calls(function, inputs, runs, warmup=3):
+    """
+    Time a function over a cycle of inputs
+    
+    Args:
+        function: Callable taking one input
+        inputs: Inputs used in turn
+        runs: Timed calls
+        warmup: Untimed calls before measuring
+    
+    Returns:
+        Summary of the timed calls (see summarize)
+    """
+    timings = []
+    for run in range(warmup + runs):
+        value = inputs[run % len(inputs)]
+        start = time.perf_counter()
+        function(value)
+        if run >= warmup:
+            timings.append(time.perf_counter() - start)
+    return summarize(timings)
+
+def run_micro(model_path=MODEL_PATH, runs=50):
+    """
+    Micro-benchmark the detector entry points and pipeline steps
+    
+    Args:
+        model_path: Model to load (an untrained model if missing)
+        runs: Timed calls per benchmark
+    
+    Returns:
+        Dictionary of summaries keyed by benchmark name
+    """
+    detector = BarcodeDetector(model_path=model_path if os.path.exists(model_path) else None)
+    tta_detector = BarcodeDetector(model_path=model_path if os.path.exists(model_path) else None,
+                                   tta=TestTimeAugmentation())
+    images = make_test_images()
+    width, height = images[0].size
+    
+    # Camera frames as raw RGBA pixels, as passed by the Kivy app
+    frames = [np.asarray(image.convert('RGBA')).tobytes() for image in images]
+    
+    tensors = [detector.transform(image).unsqueeze(0).to(detector.device) for image in images]
+    with torch.no_grad():
+        logits = [detector.runner(tensor)[1] for tensor in tensors[:4]]
+    
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = []
+        for idx, image in enumerate(images):
+            path = os.path.join(tmp_dir, f'barcode_{idx}.jpg')
+            image.save(path, quality=90)
+            paths.append(path)
+        
+        benchmarks = [
+            ('detect_barcode', lambda frame: detector.detect_barcode(frame, (width, height)),
+             frames),
+            ('detect_from_file', detector.detect_from_file, paths),
+            ('detect_image_tta', tta_detector.detect_image, images),
+            ('image_decode', lambda path: Image.open(path).convert('RGB'), paths),
+            ('image_decode_draft', detector.open_image, paths),
+            ('preprocess', detector.transform, images),
+            ('forward', lambda tensor: detector.runner(tensor), tensors),
+            ('decode_greedy', detector._decode_digits, logits),
+            ('decode_checksum', detector._decode_digits_checksum, logits)
+        ]
+        
+        with torch.no_grad():
+            for name, function, inputs in benchmarks:
+                results[name] = time_calls(function, inputs, runs)
+                print(f"{name:>18}: p50 {results[name]['p50_ms']:8.2f} ms, "
+                      f"p99 {results[name]['p99_ms']:8.2f} ms")
+    
+    return results
+
+def start_server(port):
+    """
+    Start server.py in a subprocess and wait until it is healthy
+    
+    Args:
+        port: Port to listen on
+    
+    Returns:
+        subprocess.Popen of the server
+    """
+    import requests
+    
+    env = dict(os.environ, PORT=str(port))
+    server = subprocess.Popen([sys.executable, 'server.py'], env=env,
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/api/health", timeout=1)
+            return server
+        except requests.RequestException:
+            time.sleep(0.5)
+    
+    server.terminate()
+    raise RuntimeError("Server did not become healthy within 120 seconds")
+
+def run_load(url=None, concurrency=(1, 2, 4, 8), requests_per_level=200):
+    """
+    Load-test the /api/detect endpoint with increasing concurrency
+    
+    Args:
+        url: Base URL of a running server (default: start server.py locally)
+        concurrency: Concurrent client counts, one ramp step each
+        requests_per_level: Requests sent at every concurrency level
+    
+    Returns:
+        Dictionary of results keyed by 'concurrency_<n>'
+    """
+    import requests
+    
+    server = None
+    if url is None:
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        server = start_server(port)
+        url = f"http://127.0.0.1:{port}"
+    
+    payloads = []
+    for image in make_test_images():
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=90)
+        payloads.append({'image': 'data:image/jpeg;base64,'
+                                  + base64.b64encode(buffer.getvalue()).decode()})
+    
+    def send(idx):
+        start = time.perf_counter()
+        try:
+            response = session.post(f"{url}/api/detect", json=payloads[idx % len(payloads)],
+                                    timeout=30)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+    
+    results = {}
+    try:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(concurrency))
+        session.mount('http://', adapter)
+        
+        # Warm up the model and the connection pool
+        for idx in range(5):
+            send(idx)
+        
+        for clients in concurrency:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=clients) as pool:
+                outcomes = list(pool.map(send, range(requests_per_level)))
+            elapsed = time.perf_counter() - start
+            
+            result = summarize([duration for duration, _ in outcomes])
+            result['throughput_rps'] = requests_per_level / elapsed
+            result['errors'] = sum(1 for _, ok in outcomes if not ok)
+            del result['ops_per_sec']
+            results[f'concurrency_{clients}'] = result
+            print(f"{clients:>3} clients: {result['throughput_rps']:7.1f} req/s, "
+                  f"p50 {result['p50_ms']:7.1f} ms, p95 {result['p95_ms']:7.1f} ms, "
+                  f"p99 {result['p99_ms']:7.1f} ms, errors {result['errors']}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    
+    return results
+
+def _memory_usage():
+    """RSS and PSS of this process in MB from /proc (Linux only, else None)"""
+    usage = {'rss_mb': None, 'pss_mb': None}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('Rss', 'Pss'):
+                    usage[key.lower() + '_mb'] = int(value.split()[0]) / 1024
+    except OSError:
+        pass
+    return usage
+
+def _startup_worker(model_path, loaded, done, results):
+    """Load a detector, then report its cost once every worker has loaded"""
+    start = time.perf_counter()
+    detector = BarcodeDetector(model_path=model_path, strict=True)
+    load_seconds = time.perf_counter() - start
+    
+    # One forward pass touches every weight, as serving would
+    model = detector.model
+    with torch.no_grad():
+        detector.runner(torch.zeros(1, model.in_channels, *model.input_size))
+    
+    # Measured while all workers are alive, so shared pages are split
+    loaded.wait()
+    results.put(dict(_memory_usage(), load_ms=1000 * load_seconds))
+    done.wait()
+
+def run_startup(model_path=MODEL_PATH, workers=4):
+    """
+    Compare model startup cost of the torch checkpoint and flat formats
+    
+    Starts several worker processes loading the same model file at once,
+    like gunicorn workers, and reports load time and per-worker memory. PSS
+    counts shared pages once across the workers, so it shows what the
+    memory-mapped flat format saves.
+    
+    Args:
+        model_path: Model to convert to both formats (an untrained model if missing)
+        workers: Concurrent worker processes
+    
+    Returns:
+        Dictionary of results keyed by 'pth' and 'safetensors'
+    """
+    model = load_model(model_path) if os.path.exists(model_path) else BarcodeNet()
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for extension in ('pth', 'safetensors'):
+            path = os.path.join(tmp_dir, f'model.{extension}')
+            save_model(model, path)
+            
+            loaded = context.Barrier(workers)
+            done = context.Barrier(workers + 1)
+            queue = context.Queue()
+            processes = [context.Process(target=_startup_worker, args=(path, loaded, done, queue))
+                         for _ in range(workers)]
+            for process in processes:
+                process.start()
+            reports = [queue.get(timeout=300) for _ in processes]
+            done.wait()
+            for process in processes:
+                process.join()
+            
+            result = {'load_ms': float(np.median([r['load_ms'] for r in reports]))}
+            for key in ('rss_mb', 'pss_mb'):
+                if reports[0][key] is not None:
+                    result[key] = float(np.mean([r[key] for r in reports]))
+            results[extension] = result
+            memory = ', '.join(f"{key[:3].upper()} {result[key]:.0f} MB"
+                               for key in ('rss_mb', 'pss_mb') if key in result)
+            print(f"{extension:>12}: load {result['load_ms']:7.1f} ms, {memory} per worker")
+    
+    return results
+
+def run_imports(runs=5):
+    """
+    Measure the cold import cost of the inference module
+    
+    Every import runs in a new interpreter, so nothing is cached in
+    sys.modules; the operating system's file cache is warm after the first
+    run, like for server workers.
+    
+    Args:
+        runs: Interpreters started per import statement
+    
+    Returns:
+        Dictionary of median import time, peak RSS and loaded module count
+        keyed by IMPORT_TARGETS name
+    """
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for name, statement in IMPORT_TARGETS.items():
+        reports = []
+        for _ in range(runs):
+            output = subprocess.run([sys.executable, '-c', IMPORT_PROBE.format(statement=statement)],
+                                    cwd=cwd, capture_output=True, text=True, check=True).stdout
+            reports.append(json.loads(output.strip().splitlines()[-1]))
+        results[name] = {key: float(np.median([r[key] for r in reports]))
+                         for key in ('import_ms', 'rss_mb', 'modules')}
+        print(f"{name:>28}: {results[name]['import_ms']:7.1f} ms, "
+              f"RSS {results[name]['rss_mb']:.0f} MB, {results[name]['modules']:.0f} modules")
+    return results
+
+def check_regressions(results, baseline, threshold=0.2):
+    """
+    Compare results with a baseline
+    
+    Latencies (*_ms) may grow and throughputs (ops_per_sec, throughput_rps)
+    may drop by at most the threshold. Benchmarks missing from either side
+    are skipped.
+    
+    Args:
+        results: Results of this run
+        baseline: Stored results of a reference run
+        threshold: Allowed relative change, e.g. 0.2 for 20%
+    
+    Returns:
+        List of regression descriptions, empty if there is none
+    """
+    regressions = []
+    for suite in ('micro', 'load', 'startup', 'imports'):
+        for name, metrics in results.get(suite, {}).items():
+            reference = baseline.get(suite, {}).get(name)
+            if reference is None:
+                continue
+            for metric, value in metrics.items():
+                if metric not in reference or reference[metric] <= 0:
+                    continue
+                change = value / reference[metric] - 1
+                if metric.endswith('_ms') and change > threshold:
+                    regressions.append(f"{suite}/{name} {metric}: {reference[metric]:.2f} -> "
+                                       f"{value:.2f} (+{100 * change:.0f}%)")
+                elif metric in ('ops_per_sec', 'throughput_rps') and change < -threshold:
+                    regressions.append(f"{suite}/{name} {metric}: {reference[metric]:.2f} -> "
+                                       f"{value:.2f} ({100 * change:.0f}%)")
+    return regressions
+
+def main():
+    """Run the benchmarks from the command line"""
+    parser = argparse.ArgumentParser(description="Benchmark the barcode detector and server")
+    parser.add_argument('suite', choices=['micro', 'load', 'startup', 'imports', 'all'],
+                        help="Benchmarks to run")
+    parser.add_argument('--model', default=MODEL_PATH, help="Model for the micro-benchmarks")
+    parser.add_argument('--runs', type=int, default=50, help="Timed calls per micro-benchmark")
+    parser.add_argument('--url', help="Load-test a running server instead of starting one")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help="Concurrent clients of every load step")
+    parser.add_argument('--requests', type=int, default=200, help="Requests per load step")
+    parser.add_argument('--workers', type=int, default=4,
+                        help="Concurrent processes of the startup benchmark")
+    parser.add_argument('--output', help="JSON file receiving the results")
+    parser.add_argument('--baseline', help="JSON results to check for regressions")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="Allowed relative regression (default: 0.2)")
+    args = parser.parse_args()
+    
+    results = {
+        'environment': {
+            'python': platform.python_version(),
+            'torch': torch.__version__,
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'threads': torch.get_num_threads()
+        }
+    }
+    if args.suite in ('micro', 'all'):
+        print("Micro-benchmarks:")
+        results['micro'] = run_micro(args.model, runs=args.runs)
+    if args.suite in ('load', 'all'):
+        print("Load test:")
+        results['load'] = run_load(args.url, concurrency=args.concurrency,
+                                   requests_per_level=args.requests)
+    if args.suite in ('startup', 'all'):
+        print("Model startup:")
+        results['startup'] = run_startup(args.model, workers=args.workers)
+    if args.suite in ('imports', 'all'):
+        print("Import cost:")
+        results['imports'] = run_imports()
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = check_regressions(results, baseline, args.threshold)
+        if regressions:
+            print(f"✗ {len(regressions)} regression(s) beyond {100 * args.threshold:.0f}%:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"✓ No regression beyond {100 * args.threshold:.0f}% of {args.baseline}")
+    
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -20,7 +20,7 @@ version = 1.0
 
 # (list) Application requirements
 # comma separated e.g. requirements = sqlite3,kivy
-requirements = python3,kivy==2.2.1,kivymd==1.1.1,pillow,numpy,torch,torchvision,opencv
+requirements = python3,kivy==2.2.1,kivymd==1.1.1,pillow,numpy,torch,opencv
 
 # (str) Supported orientation (landscape, portrait or all)
 orientation = portrait
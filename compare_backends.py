@@ -0,0 +1,216 @@
+"""
+Backend comparison matrix for BarcodeDetector
+Runs one model through every available execution backend on the same
+seeded synthetic images (plus an optional directory of real images) at
+several batch sizes and thread counts, and reports latency, throughput,
+peak RSS and accuracy relative to eager fp32
+
+Every backend runs in its own process, so its peak RSS is measured in
+isolation and a backend that fails to build does not affect the others.
+
+Usage:
+    python compare_backends.py barcode_model.pth --report backends.json
+    python compare_backends.py barcode_model.pth --images photos/ --threads 1 4
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+import torch
+from barcode_detector import BACKENDS, NO_DIGIT, BarcodeDetector
+from barcode_renderer import load_image_set
+
+def _peak_rss_mb():
+    """Peak resident set size of this process in MB, None if unknown"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def measure_backend(model_path, backend, thread_counts, batch_sizes, num_synthetic=64,
+                    image_dir=None, runs=20):
+    """
+    Measure one backend; runs in a child process of compare_backends
+    
+    Args:
+        model_path: Trained BarcodeNet checkpoint
+        backend: Execution backend, one of BACKENDS
+        thread_counts: Intra-op thread counts to measure
+        batch_sizes: Batch sizes to measure
+        num_synthetic: Number of seeded synthetic images
+        image_dir: Directory of real images (optional)
+        runs: Timed forward passes per configuration
+    
+    Returns:
+        Dictionary with 'timings', 'predictions' and 'peak_rss_mb', or
+        'error' if the backend is not available
+    """
+    images, _ = load_image_set(num_synthetic, image_dir)
+    result = {'backend': backend, 'timings': []}
+    
+    try:
+        for threads in thread_counts:
+            torch.set_num_threads(threads)
+            start = time.perf_counter()
+            detector = BarcodeDetector(model_path=model_path, backend=backend)
+            result['build_seconds'] = time.perf_counter() - start
+            inputs = torch.stack([detector.transform(image) for image in images])
+            
+            with torch.no_grad():
+                for batch_size in batch_sizes:
+                    batch = inputs[torch.arange(batch_size) % len(inputs)].to(detector.device)
+                    for _ in range(3):
+                        detector.runner(batch)
+                    timings = []
+                    for _ in range(runs):
+                        start = time.perf_counter()
+                        detector.runner(batch)
+                        timings.append(time.perf_counter() - start)
+                    timings.sort()
+                    latency = timings[len(timings) // 2]
+                    result['timings'].append({
+                        'threads': threads,
+                        'batch_size': batch_size,
+                        'latency_ms': 1000 * latency,
+                        'images_per_sec': batch_size / latency
+                    })
+        
+        # Predictions are the same for every thread count
+        with torch.no_grad():
+            chunk = max(batch_sizes)
+            predictions = [detector.runner(inputs[i:i + chunk].to(detector.device))[1]
+                           .argmax(dim=2).cpu() for i in range(0, len(inputs), chunk)]
+        result['predictions'] = torch.cat(predictions).tolist()
+    except Exception as e:
+        return {'backend': backend, 'error': f"{type(e).__name__}: {e}"}
+    
+    result['peak_rss_mb'] = _peak_rss_mb()
+    return result
+
+def _accuracy(predictions, references):
+    """Percentages of equal digit positions and of fully equal rows"""
+    predictions = torch.tensor(predictions)
+    references = torch.tensor(references)
+    matches = predictions == references
+    return 100.0 * matches.float().mean().item(), 100.0 * matches.all(dim=1).float().mean().item()
+
+def compare_backends(model_path, backends=BACKENDS, thread_counts=None, batch_sizes=(1, 8, 32),
+                     num_synthetic=64, image_dir=None, runs=20, min_agreement=99.0,
+                     report_path=None):
+    """
+    Run the backend matrix and print the comparison
+    
+    Args:
+        model_path: Trained BarcodeNet checkpoint
+        backends: Backends to compare, eager is always measured as reference
+        thread_counts: Intra-op thread counts (default: 1, 2, 4 and all cores)
+        batch_sizes: Batch sizes to measure
+        num_synthetic: Number of seeded synthetic images
+        image_dir: Directory of real images (optional)
+        runs: Timed forward passes per configuration
+        min_agreement: Minimum barcode agreement with eager fp32 (percent)
+            for a configuration to be recommended
+        report_path: JSON file receiving the results (optional)
+    
+    Returns:
+        Dictionary with per-backend 'results' and the 'recommendation'
+    """
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(model_path)
+    if thread_counts is None:
+        cpus = os.cpu_count() or 1
+        thread_counts = sorted({n for n in (1, 2, 4, cpus) if n <= cpus})
+    backends = ['eager'] + [backend for backend in backends if backend != 'eager']
+    
+    _, labels = load_image_set(num_synthetic, image_dir)
+    labeled = [idx for idx, label in enumerate(labels) if label is not None]
+    targets = [[int(d) for d in labels[idx]] + [NO_DIGIT] * (13 - len(labels[idx]))
+               for idx in labeled]
+    
+    # Spawned processes start clean, so peak RSS belongs to one backend
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for backend in backends:
+        print(f"Measuring {backend}...")
+        with context.Pool(1) as pool:
+            results.append(pool.apply(measure_backend, (model_path, backend, thread_counts,
+                                                        batch_sizes, num_synthetic, image_dir,
+                                                        runs)))
+    
+    reference = results[0].get('predictions')
+    if reference is None:
+        raise RuntimeError(f"Eager reference failed: {results[0]['error']}")
+    
+    for result in results:
+        if 'error' in result:
+            continue
+        predictions = result.pop('predictions')
+        result['digit_agreement'], result['barcode_agreement'] = _accuracy(predictions, reference)
+        if labeled:
+            result['digit_accuracy'], result['barcode_accuracy'] = _accuracy(
+                [predictions[idx] for idx in labeled], targets)
+    
+    print(f"\n{'Backend':<14} {'Threads':>7} {'Batch':>6} {'Latency ms':>11} {'Images/s':>9}")
+    for result in results:
+        for timing in result.get('timings', []):
+            print(f"{result['backend']:<14} {timing['threads']:>7} {timing['batch_size']:>6} "
+                  f"{timing['latency_ms']:>11.2f} {timing['images_per_sec']:>9.1f}")
+    
+    print(f"\n{'Backend':<14} {'Peak RSS MB':>11} {'Digit agree %':>14} {'Barcode agree %':>16} "
+          f"{'Digit acc %':>12} {'Barcode acc %':>14}")
+    for result in results:
+        if 'error' in result:
+            print(f"{result['backend']:<14} unavailable: {result['error']}")
+            continue
+        rss = result['peak_rss_mb']
+        print(f"{result['backend']:<14} {rss if rss is None else round(rss):>11} "
+              f"{result['digit_agreement']:>14.2f} {result['barcode_agreement']:>16.2f} "
+              f"{result.get('digit_accuracy', float('nan')):>12.2f} "
+              f"{result.get('barcode_accuracy', float('nan')):>14.2f}")
+    
+    # Fastest single-image configuration that reads the same barcodes as eager
+    candidates = [(timing['latency_ms'], result['backend'], timing['threads'])
+                  for result in results if result.get('barcode_agreement', 0) >= min_agreement
+                  for timing in result['timings'] if timing['batch_size'] == 1]
+    recommendation = None
+    if candidates:
+        latency, backend, threads = min(candidates)
+        recommendation = {'backend': backend, 'threads': threads, 'latency_ms': latency}
+        print(f"\nRecommended: PYBAR_BACKEND={backend} PYBAR_NUM_THREADS={threads} "
+              f"({latency:.2f} ms per image)")
+    
+    report = {'model': model_path, 'results': results, 'recommendation': recommendation}
+    if report_path:
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {report_path}")
+    
+    return report
+
+def main():
+    """Compare backends from the command line"""
+    parser = argparse.ArgumentParser(description="Compare BarcodeDetector execution backends")
+    parser.add_argument('model', nargs='?', default='barcode_model.pth', help="Trained model")
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS),
+                        help="Backends to compare")
+    parser.add_argument('--threads', type=int, nargs='+', help="Thread counts to measure")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32],
+                        help="Batch sizes to measure")
+    parser.add_argument('--synthetic', type=int, default=64, help="Synthetic test images")
+    parser.add_argument('--images', help="Directory of real images, named by barcode number")
+    parser.add_argument('--runs', type=int, default=20, help="Timed runs per configuration")
+    parser.add_argument('--report', help="JSON file receiving the results")
+    args = parser.parse_args()
+    
+    compare_backends(args.model, backends=args.backends, thread_counts=args.threads,
+                     batch_sizes=args.batch_sizes, num_synthetic=args.synthetic,
+                     image_dir=args.images, runs=args.runs, report_path=args.report)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,7 @@
+"""
+pytest configuration
+test_server.py checks a running server (python test_server.py [URL]); its
+test functions take the server URL, so pytest does not collect them
+"""
+
+collect_ignore = ['test_server.py']
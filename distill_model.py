@@ -0,0 +1,205 @@
+"""
+Knowledge distillation of BarcodeNet into a compact student model
+Trains a shallower and narrower BarcodeNet on the soft presence and digit
+predictions of a trained model, then compares their latency and accuracy
+
+Usage:
+    python distill_model.py --teacher barcode_model.pth --output barcode_model_small.pth
+    python distill_model.py --compare barcode_model.pth barcode_model_small.pth
+"""
+
+import os
+import json
+import time
+import argparse
+import torch
+from barcode_detector import load_model
+from barcode_renderer import SyntheticBarcodeBatchDataset
+from train_model import train_distributed
+
+# Student architecture: one block per stage at half width, about 1.3M
+# parameters instead of 11.5M
+STUDENT_ARCHITECTURE = {
+    'layers': [1, 1, 1, 1],
+    'width': 32,
+    'feature_dim': 256
+}
+
+def evaluate_model(model, num_samples=1000, batch_size=64, seed=1234):
+    """
+    Measure the accuracy of a model on synthetic barcodes
+    
+    Args:
+        model: BarcodeNet in eval mode
+        num_samples: Number of evaluation samples
+        batch_size: Evaluation batch size
+        seed: Seed of the evaluation samples, fixed so models are compared
+            on the same images
+    
+    Returns:
+        Dictionary with 'presence_accuracy', 'digit_accuracy' (per position)
+        and 'sequence_accuracy' (whole barcode correct) in percent
+    """
+    height, width = model.input_size
+    dataset = SyntheticBarcodeBatchDataset(num_samples=num_samples, batch_size=batch_size,
+                                           image_size=(width, height),
+                                           in_channels=model.in_channels, seed=seed)
+    correct_presence = 0
+    correct_digits = 0
+    correct_sequences = 0
+    
+    with torch.no_grad():
+        for idx in range(len(dataset)):
+            images, presence_labels, digit_labels = dataset[idx]
+            presence_logits, digit_logits = model(images)
+            
+            correct_presence += (presence_logits.argmax(dim=1) == presence_labels).sum().item()
+            matches = digit_logits.argmax(dim=2) == digit_labels
+            correct_digits += matches.sum().item()
+            correct_sequences += matches.all(dim=1).sum().item()
+    
+    return {
+        'presence_accuracy': 100.0 * correct_presence / num_samples,
+        'digit_accuracy': 100.0 * correct_digits / (num_samples * model.num_digits),
+        'sequence_accuracy': 100.0 * correct_sequences / num_samples
+    }
+
+def measure_latency(model, batch_size=1, warmup=5, runs=50):
+    """
+    Measure the inference time of a model on the CPU
+    
+    Args:
+        model: BarcodeNet in eval mode
+        batch_size: Images per forward pass
+        warmup: Untimed forward passes before measuring
+        runs: Timed forward passes
+    
+    Returns:
+        Median time per forward pass in milliseconds
+    """
+    height, width = model.input_size
+    images = torch.randn(batch_size, model.in_channels, height, width)
+    timings = []
+    
+    with torch.no_grad():
+        for run in range(warmup + runs):
+            start = time.perf_counter()
+            model(images)
+            if run >= warmup:
+                timings.append(time.perf_counter() - start)
+    
+    timings.sort()
+    return 1000 * timings[len(timings) // 2]
+
+def compare_models(model_paths, num_samples=1000, report_path=None):
+    """
+    Print a latency and accuracy comparison of saved models
+    
+    Args:
+        model_paths: Checkpoint paths, the first one is the reference
+        num_samples: Number of evaluation samples
+        report_path: JSON file receiving the results (optional)
+    
+    Returns:
+        List with one result dictionary per model
+    """
+    results = []
+    for path in model_paths:
+        model = load_model(path)
+        model.eval()
+        
+        result = {
+            'model': path,
+            'config': model.get_config(),
+            'parameters': sum(p.numel() for p in model.parameters()),
+            'size_mb': os.path.getsize(path) / (1024 * 1024),
+            'latency_ms': measure_latency(model),
+            'batch_latency_ms': measure_latency(model, batch_size=32, runs=10)
+        }
+        result.update(evaluate_model(model, num_samples=num_samples))
+        results.append(result)
+    
+    reference = results[0]
+    print(f"{'Model':<32} {'Params':>10} {'Size MB':>8} {'Latency ms':>11} "
+          f"{'Speedup':>8} {'Images/s':>9} {'Digit %':>8} {'Barcode %':>10}")
+    for result in results:
+        print(f"{os.path.basename(result['model']):<32} {result['parameters']:>10,} "
+              f"{result['size_mb']:>8.1f} {result['latency_ms']:>11.2f} "
+              f"{reference['latency_ms'] / result['latency_ms']:>7.1f}x "
+              f"{32000 / result['batch_latency_ms']:>9.1f} "
+              f"{result['digit_accuracy']:>8.2f} {result['sequence_accuracy']:>10.2f}")
+    
+    if report_path:
+        with open(report_path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Report written to {report_path}")
+    
+    return results
+
+def distill_model(teacher_path='barcode_model.pth', save_path='barcode_model_small.pth',
+                  architecture=None, num_epochs=20, batch_size=32, learning_rate=0.001,
+                  temperature=4.0, distill_weight=0.7, processes=1, **kwargs):
+    """
+    Distill a trained model into a smaller student
+    
+    The student is trained by train_model, so it gets the same data
+    pipeline, augmentation, checkpointing and multi-process options. It is
+    saved with its architecture, so BarcodeDetector loads it like any
+    other model.
+    
+    Args:
+        teacher_path: Trained BarcodeNet checkpoint
+        save_path: Path to save the student model
+        architecture: BarcodeNet arguments of the student
+            (default: STUDENT_ARCHITECTURE)
+        num_epochs: Number of training epochs
+        batch_size: Training batch size
+        learning_rate: Learning rate for optimizer
+        temperature: Softmax temperature of the soft targets
+        distill_weight: Share of the soft target loss
+        processes: Data-parallel training processes
+        **kwargs: Further train_model arguments
+    """
+    teacher = load_model(teacher_path)
+    
+    # The student reads the same input as the teacher
+    train_distributed(processes, num_epochs=num_epochs, batch_size=batch_size,
+                      learning_rate=learning_rate, save_path=save_path,
+                      input_size=teacher.input_size, in_channels=teacher.in_channels,
+                      architecture=architecture or STUDENT_ARCHITECTURE,
+                      teacher_path=teacher_path, temperature=temperature,
+                      distill_weight=distill_weight, **kwargs)
+
+def main():
+    """Distill or compare models from the command line"""
+    parser = argparse.ArgumentParser(description="Distill BarcodeNet into a compact student")
+    parser.add_argument('--teacher', default='barcode_model.pth', help="Trained teacher model")
+    parser.add_argument('--output', default='barcode_model_small.pth', help="Student model path")
+    parser.add_argument('--epochs', type=int, default=20, help="Number of training epochs")
+    parser.add_argument('--layers', type=int, nargs=4, default=STUDENT_ARCHITECTURE['layers'],
+                        help="Residual blocks per stage of the student")
+    parser.add_argument('--width', type=int, default=STUDENT_ARCHITECTURE['width'],
+                        help="Channels of the first student stage")
+    parser.add_argument('--feature-dim', type=int, default=STUDENT_ARCHITECTURE['feature_dim'],
+                        help="Size of the student feature vector")
+    parser.add_argument('--temperature', type=float, default=4.0, help="Softmax temperature")
+    parser.add_argument('--processes', type=int, default=1, help="Data-parallel processes")
+    parser.add_argument('--resume', action='store_true', help="Continue from the checkpoint")
+    parser.add_argument('--compare', nargs='+', metavar='MODEL',
+                        help="Only compare the given models")
+    parser.add_argument('--report', help="JSON file receiving the comparison")
+    args = parser.parse_args()
+    
+    if args.compare:
+        compare_models(args.compare, report_path=args.report)
+        return
+    
+    distill_model(args.teacher, args.output,
+                  architecture={'layers': args.layers, 'width': args.width,
+                                'feature_dim': args.feature_dim},
+                  num_epochs=args.epochs, temperature=args.temperature,
+                  processes=args.processes, resume=args.resume)
+    compare_models([args.teacher, args.output], report_path=args.report)
+
+if __name__ == '__main__':
+    main()
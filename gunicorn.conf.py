@@ -0,0 +1,28 @@
+"""
+Gunicorn settings for the Flask server
+gunicorn reads this file from its working directory, so the hooks below
+apply to any `gunicorn ... server:app` command started there
+"""
+
+import os
+
+# Threaded workers: the server sheds overload with 503s only while a thread
+# is free to answer them, see server.admission_limits
+worker_class = 'gthread'
+threads = int(os.environ.get('PYBAR_THREADS', '8'))
+
+def post_fork(server, worker):
+    """
+    Load the model and start the model file watcher in each worker
+    
+    Importing the app has no side effects, so the watcher thread runs in the
+    worker that serves the requests, with or without --preload. Admission
+    control is sized from the worker's --threads.
+    
+    Args:
+        server: The gunicorn arbiter
+        worker: The forked worker
+    """
+    import server as pybar_server
+    pybar_server.set_request_threads(worker.cfg.threads)
+    pybar_server.init_detector()
@@ -17,7 +17,7 @@ from kivy.graphics.texture import Texture
 from kivy.core.camera import Camera as CoreCamera
 from kivy.logger import Logger
 import torch
-from barcode_detector import BarcodeDetector
+from barcode_detector import BarcodeDetector, FrameQualityGate
 
 class BarcodeScanner(BoxLayout):
     """Main widget for barcode scanning interface"""
@@ -28,7 +28,7 @@ class BarcodeScanner(BoxLayout):
         
         # Initialize barcode detector
         try:
-            self.detector = BarcodeDetector()
+            self.detector = BarcodeDetector(frame_gate=FrameQualityGate())
             Logger.info("PyBar: BarcodeDetector initialized successfully")
         except Exception as e:
             Logger.error(f"PyBar: Failed to initialize BarcodeDetector: {e}")
@@ -95,9 +95,13 @@ class BarcodeScanner(BoxLayout):
             self.result_label.text = 'Processing...'
             barcode_number = self.detector.detect_barcode(pixels, size)
             
+            rejection = self.detector.last_rejection
             if barcode_number:
                 self.result_label.text = f'Barcode: {barcode_number}'
                 Logger.info(f"PyBar: Detected barcode: {barcode_number}")
+            elif rejection and rejection != FrameQualityGate.UNCHANGED:
+                self.result_label.text = f'Frame skipped ({rejection}), hold steady and retry'
+                Logger.info(f"PyBar: Frame rejected: {rejection}")
             else:
                 self.result_label.text = 'No barcode detected'
                 Logger.info("PyBar: No barcode detected")
@@ -0,0 +1,205 @@
+"""
+Minimal Prometheus metrics for the detection server
+Thread-safe counters, gauges and histograms rendered in the Prometheus text
+exposition format, without depending on prometheus_client
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Latency buckets in seconds, from sub-millisecond decoding to slow uploads
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+def _format_value(value):
+    """Format a sample value the way Prometheus expects"""
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _format_labels(names, values, extra=None):
+    """Format a label set such as {stage="forward",le="0.01"}"""
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = [(name, str(value).replace('\\', '\\\\').replace('"', '\\"')
+                .replace('\n', '\\n')) for name, value in pairs]
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+class _Metric:
+    """Base class of metrics with optional labels"""
+    
+    kind = None
+    
+    def __init__(self, name, documentation, labels=()):
+        """
+        Initialize the metric
+        
+        Args:
+            name: Metric name, e.g. 'pybar_requests_total'
+            documentation: Help text
+            labels: Names of the labels every sample carries
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def _key(self, labels):
+        """Label values in declaration order"""
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, "
+                             f"got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+    
+    def render(self):
+        """
+        Render the metric
+        
+        Returns:
+            List of exposition format lines
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in self._snapshot():
+            lines.extend(self._render_sample(key, value))
+        return lines
+    
+    def _snapshot(self):
+        """Copy of the (label values, value) pairs, taken under the lock"""
+        with self._lock:
+            return sorted(self._values.items())
+    
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"]
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    
+    kind = 'counter'
+    
+    def inc(self, amount=1, **labels):
+        """Increase the counter of a label set"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+    
+    kind = 'gauge'
+    
+    def set(self, value, **labels):
+        """Set the gauge of a label set"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+    
+    def inc(self, amount=1, **labels):
+        """Increase the gauge of a label set"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def dec(self, amount=1, **labels):
+        """Decrease the gauge of a label set"""
+        self.inc(-amount, **labels)
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+    
+    kind = 'histogram'
+    
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        """
+        Initialize the histogram
+        
+        Args:
+            name: Metric name, e.g. 'pybar_stage_duration_seconds'
+            documentation: Help text
+            labels: Names of the labels every sample carries
+            buckets: Increasing upper bounds of the buckets
+        """
+        super(Histogram, self).__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+    
+    def observe(self, value, **labels):
+        """Record a value for a label set"""
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0}
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][idx] += 1
+                    break
+            state['sum'] += value
+    
+    @contextmanager
+    def time(self, **labels):
+        """Context manager observing the duration of its block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+    
+    def _render_sample(self, key, state):
+        labels = _format_labels(self.label_names, key)
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state['counts']):
+            cumulative += count
+            bucket_labels = _format_labels(self.label_names, key, ('le', _format_value(bound)))
+            lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+        lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+    
+    def _snapshot(self):
+        # Bucket lists are copied so rendering never races updates
+        with self._lock:
+            return sorted((key, {'counts': list(state['counts']), 'sum': state['sum']})
+                          for key, state in self._values.items())
+
+class MetricsRegistry:
+    """Collection of metrics rendered together"""
+    
+    def __init__(self):
+        self._metrics = []
+    
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+    
+    def counter(self, name, documentation, labels=()):
+        """Create and register a Counter"""
+        return self._register(Counter(name, documentation, labels))
+    
+    def gauge(self, name, documentation, labels=()):
+        """Create and register a Gauge"""
+        return self._register(Gauge(name, documentation, labels))
+    
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        """Create and register a Histogram"""
+        return self._register(Histogram(name, documentation, labels, buckets))
+    
+    def render(self):
+        """
+        Render all metrics
+        
+        Returns:
+            Prometheus text exposition format string
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,234 @@
+"""
+Zero-downtime model reload for the detection server
+Watches the model file (or takes an explicit reload call), loads and warms
+the new weights in a background thread, checks them on a canary set of
+labeled images and only then hands them to the server, which swaps its
+detector in one assignment. Requests in flight finish on the model they
+started with.
+"""
+
+import os
+import time
+import hashlib
+import threading
+import torch
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """
+    SHA-256 of a file
+    
+    Args:
+        path: File path
+        chunk_size: Bytes read at a time
+    
+    Returns:
+        Hex digest
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def canary_accuracy(detector, images, labels, batch_size=8):
+    """
+    Fraction of the labeled canary images a detector reads exactly
+    
+    Args:
+        detector: BarcodeDetector
+        images: List of PIL images
+        labels: Barcode numbers, or None for unlabeled images
+        batch_size: Images per forward pass
+    
+    Returns:
+        Accuracy between 0 and 1, or None if no image is labeled
+    """
+    correct = 0
+    labeled = 0
+    for start in range(0, len(images), batch_size):
+        batch = torch.stack([detector.transform(image)
+                             for image in images[start:start + batch_size]])
+        for label, barcode in zip(labels[start:start + batch_size],
+                                  detector.detect_tensor(batch)):
+            if label is not None:
+                labeled += 1
+                correct += barcode == label
+    return correct / labeled if labeled else None
+
+class ModelReloader:
+    """Reload the detection model when its file changes or on request"""
+    
+    def __init__(self, model_path, load_detector, on_swap, canary_images=(), canary_labels=(),
+                 max_accuracy_drop=0.05, poll_interval=5.0, on_reload=None):
+        """
+        Initialize the reloader
+        
+        Args:
+            model_path: Model file to watch
+            load_detector: Function building a BarcodeDetector from a path,
+                raising if the file cannot be loaded
+            on_swap: Function called with (detector, info) to make a
+                validated detector live
+            canary_images: PIL images the new model is checked on
+            canary_labels: Barcode number (or None) of every canary image
+            max_accuracy_drop: Largest canary accuracy drop against the live
+                model before a new model is rejected
+            poll_interval: Seconds between checks of the model file, 0 to
+                only reload on request
+            on_reload: Function called with the outcome of every reload
+                (optional)
+        """
+        self.model_path = model_path
+        self.load_detector = load_detector
+        self.on_swap = on_swap
+        self.canary_images = list(canary_images)
+        self.canary_labels = list(canary_labels)
+        self.max_accuracy_drop = max_accuracy_drop
+        self.poll_interval = poll_interval
+        self.on_reload = on_reload
+        
+        self.detector = None
+        self.info = {}
+        self.last_reload = None
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+    
+    def _stat(self):
+        """(mtime, size) of the model file, or None if it is missing"""
+        try:
+            stat = os.stat(self.model_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+    
+    def activate(self, detector, sha256=None, accuracy=None):
+        """
+        Make a detector live and record its version
+        
+        Args:
+            detector: BarcodeDetector to serve with
+            sha256: SHA-256 of its model file, None for an untrained model
+            accuracy: Its canary accuracy, if known
+        """
+        self.detector = detector
+        self.info = {
+            'path': self.model_path,
+            'sha256': sha256,
+            'version': sha256[:12] if sha256 else 'untrained',
+            'loaded_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'canary_accuracy': accuracy
+        }
+        self.on_swap(detector, dict(self.info))
+    
+    def reload(self, force=False):
+        """
+        Load, warm and validate the model file, and swap it in if it passes
+        
+        Runs in the calling thread; use reload_async from request handlers.
+        Concurrent calls return immediately with status 'busy'.
+        
+        Args:
+            force: Reload even if the file hash has not changed
+        
+        Returns:
+            Dictionary describing the outcome: status is 'swapped',
+            'unchanged', 'rejected', 'failed' or 'busy'
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return {'status': 'busy'}
+        
+        start = time.perf_counter()
+        try:
+            sha256 = file_sha256(self.model_path)
+            if sha256 == self.info.get('sha256') and not force:
+                return self._finish({'status': 'unchanged', 'sha256': sha256}, start)
+            
+            detector = self.load_detector(self.model_path)
+            
+            # Warm up the backend (TorchScript optimizes on the first runs)
+            # and catch weights that only produce NaN or infinity
+            model = detector.model
+            dummy = torch.zeros(1, model.in_channels, *model.input_size, device=detector.device)
+            with torch.no_grad():
+                for _ in range(3):
+                    outputs = detector.runner(dummy)
+            if not all(torch.isfinite(output).all() for output in outputs):
+                raise RuntimeError("model produces non-finite outputs")
+            
+            accuracy = None
+            if self.canary_images:
+                accuracy = canary_accuracy(detector, self.canary_images, self.canary_labels)
+                live = self.info.get('canary_accuracy')
+                if live is None and self.detector is not None:
+                    live = self.info['canary_accuracy'] = canary_accuracy(
+                        self.detector, self.canary_images, self.canary_labels)
+                if accuracy is not None and live is not None \
+                        and accuracy < live - self.max_accuracy_drop:
+                    return self._finish({
+                        'status': 'rejected', 'sha256': sha256,
+                        'error': f"canary accuracy {accuracy:.3f} below live model {live:.3f}"
+                    }, start)
+            
+            self.activate(detector, sha256, accuracy)
+            return self._finish({'status': 'swapped', 'sha256': sha256,
+                                 'canary_accuracy': accuracy}, start)
+        except Exception as e:
+            return self._finish({'status': 'failed', 'error': f"{type(e).__name__}: {e}"}, start)
+        finally:
+            self._reload_lock.release()
+    
+    def _finish(self, outcome, start):
+        """Record the outcome of a reload"""
+        outcome['seconds'] = time.perf_counter() - start
+        outcome['at'] = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+        self.last_reload = outcome
+        print(f"Model reload {outcome['status']}: "
+              f"{outcome.get('error') or outcome.get('sha256', '')[:12]}")
+        if self.on_reload is not None:
+            self.on_reload(outcome)
+        return outcome
+    
+    def reload_async(self, force=False):
+        """
+        Reload in a background thread
+        
+        Args:
+            force: Reload even if the file hash has not changed
+        
+        Returns:
+            False if a reload is already running
+        """
+        if self._reload_lock.locked():
+            return False
+        threading.Thread(target=self.reload, args=(force,), daemon=True,
+                         name='model-reload').start()
+        return True
+    
+    def start(self):
+        """Start watching the model file (no-op if poll_interval is 0)"""
+        if self.poll_interval <= 0 or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, daemon=True, name='model-watcher')
+        self._watcher.start()
+    
+    def stop(self):
+        """Stop watching the model file"""
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+    
+    def _watch(self):
+        """Poll the model file and reload once a change has settled"""
+        seen = self._stat()
+        while not self._stop.wait(self.poll_interval):
+            stat = self._stat()
+            if stat is None or stat == seen:
+                continue
+            # Wait for one more unchanged poll so a file still being
+            # copied is not read half-written
+            if self._stop.wait(self.poll_interval) or self._stat() != stat:
+                continue
+            seen = stat
+            self.reload()
@@ -0,0 +1,178 @@
+"""
+Structured channel pruning for BarcodeNet
+Removes whole filters from the inner convolution of every residual block,
+fine-tunes the pruned model with train_model and exports it as a smaller
+dense model, then reports CPU latency against accuracy per pruning level
+
+Usage:
+    python prune_model.py barcode_model.pth --ratios 0.25 0.5 0.75
+    python prune_model.py barcode_model.pth --latency-budget 8
+"""
+
+import os
+import argparse
+import torch
+from barcode_detector import BarcodeNet, load_model, save_model
+from distill_model import compare_models, measure_latency
+from train_model import train_distributed
+
+def channel_importance(block):
+    """
+    Score the inner channels of a residual block
+    
+    A channel matters as much as its batch norm scale times the L1 norm of
+    the weights reading it in the second convolution.
+    
+    Args:
+        block: BasicBlock
+    
+    Returns:
+        Tensor with one score per inner channel
+    """
+    scale = block.bn1.weight.detach().abs()
+    fan_out = block.conv2.weight.detach().abs().sum(dim=(0, 2, 3))
+    return scale * fan_out
+
+def prune_channels(model, ratio, multiple=8):
+    """
+    Remove the least important inner channels of every residual block
+    
+    Only the channels between the two convolutions of a block are removed,
+    so the residual connections keep their shape. The result is a dense
+    BarcodeNet with narrower convolutions, not a masked copy.
+    
+    Args:
+        model: BarcodeNet to prune (left unchanged)
+        ratio: Fraction of the inner channels to remove from every block
+        multiple: Kept channel counts are rounded to a multiple of this,
+            which suits the CPU convolution kernels
+    
+    Returns:
+        Pruned BarcodeNet with the remaining weights copied over
+    """
+    blocks = model.residual_blocks()
+    state_dict = model.state_dict()
+    block_widths = []
+    
+    for block_idx, block in enumerate(blocks):
+        channels = block.conv1.out_channels
+        keep = int(round(channels * (1 - ratio) / multiple)) * multiple
+        keep = min(max(keep, multiple), channels)
+        block_widths.append(keep)
+        
+        kept = torch.argsort(channel_importance(block), descending=True)[:keep]
+        kept = torch.sort(kept).values
+        prefix = _block_prefix(model, block_idx)
+        state_dict[prefix + 'conv1.weight'] = state_dict[prefix + 'conv1.weight'][kept]
+        for name in ('weight', 'bias', 'running_mean', 'running_var'):
+            state_dict[prefix + 'bn1.' + name] = state_dict[prefix + 'bn1.' + name][kept]
+        state_dict[prefix + 'conv2.weight'] = state_dict[prefix + 'conv2.weight'][:, kept]
+    
+    config = model.get_config()
+    config['block_widths'] = block_widths
+    pruned = BarcodeNet(**config)
+    pruned.load_state_dict(state_dict)
+    return pruned
+
+def _block_prefix(model, block_idx):
+    """State dict prefix of a residual block, e.g. 'backbone.layer2.1.'"""
+    for stage in range(4):
+        stage_blocks = len(getattr(model.backbone, f'layer{stage + 1}'))
+        if block_idx < stage_blocks:
+            return f'backbone.layer{stage + 1}.{block_idx}.'
+        block_idx -= stage_blocks
+    raise IndexError(block_idx)
+
+def select_ratio(model, latency_budget, ratios=(0.25, 0.375, 0.5, 0.625, 0.75, 0.875)):
+    """
+    Find the smallest pruning ratio meeting a latency budget
+    
+    Args:
+        model: BarcodeNet to prune
+        latency_budget: Maximum single-image CPU latency in milliseconds
+        ratios: Candidate ratios, tried in increasing order
+    
+    Returns:
+        Pruning ratio, the largest candidate if none meets the budget
+    """
+    model.eval()
+    for ratio in sorted(ratios):
+        pruned = prune_channels(model, ratio)
+        pruned.eval()
+        latency = measure_latency(pruned)
+        print(f"Pruning {ratio:.0%}: {latency:.2f} ms")
+        if latency <= latency_budget:
+            return ratio
+    
+    print(f"No pruning level meets {latency_budget} ms, using {max(ratios):.0%}")
+    return max(ratios)
+
+def prune_model(model_path='barcode_model.pth', ratios=(0.25, 0.5, 0.75), latency_budget=None,
+                num_epochs=3, batch_size=32, learning_rate=0.0001, distill=True, processes=1,
+                report_path=None, **kwargs):
+    """
+    Prune a trained model at several levels, fine-tune and compare them
+    
+    Every level is saved next to the original, e.g. barcode_model_pruned50.pth,
+    with its block widths in the checkpoint config, so BarcodeDetector loads
+    it like any other model.
+    
+    Args:
+        model_path: Trained BarcodeNet checkpoint
+        ratios: Fractions of the inner block channels to remove
+        latency_budget: Single-image CPU latency in milliseconds; when given,
+            only the smallest ratio meeting it is exported
+        num_epochs: Fine-tuning epochs per level
+        batch_size: Fine-tuning batch size
+        learning_rate: Fine-tuning learning rate
+        distill: Fine-tune on the soft targets of the unpruned model
+        processes: Data-parallel training processes
+        report_path: JSON file receiving the comparison (optional)
+        **kwargs: Further train_model arguments
+    
+    Returns:
+        List of comparison results, the unpruned model first
+    """
+    model = load_model(model_path)
+    model.eval()
+    if latency_budget is not None:
+        ratios = [select_ratio(model, latency_budget)]
+    
+    output_paths = []
+    for ratio in ratios:
+        output_path = f"{os.path.splitext(model_path)[0]}_pruned{int(round(100 * ratio))}.pth"
+        pruned = prune_channels(model, ratio)
+        save_model(pruned, output_path)
+        print(f"Pruned {ratio:.0%} of the block channels: {output_path}")
+        
+        if num_epochs > 0:
+            train_distributed(processes, num_epochs=num_epochs, batch_size=batch_size,
+                              learning_rate=learning_rate, save_path=output_path,
+                              input_size=model.input_size, in_channels=model.in_channels,
+                              init_path=output_path,
+                              teacher_path=model_path if distill else None, **kwargs)
+        output_paths.append(output_path)
+    
+    return compare_models([model_path] + output_paths, report_path=report_path)
+
+def main():
+    """Prune a model from the command line"""
+    parser = argparse.ArgumentParser(description="Structured channel pruning for BarcodeNet")
+    parser.add_argument('model', nargs='?', default='barcode_model.pth', help="Trained model")
+    parser.add_argument('--ratios', type=float, nargs='+', default=[0.25, 0.5, 0.75],
+                        help="Fractions of the block channels to remove")
+    parser.add_argument('--latency-budget', type=float,
+                        help="Target single-image latency in ms instead of --ratios")
+    parser.add_argument('--epochs', type=int, default=3, help="Fine-tuning epochs per level")
+    parser.add_argument('--no-distill', action='store_true',
+                        help="Fine-tune on hard labels only")
+    parser.add_argument('--processes', type=int, default=1, help="Data-parallel processes")
+    parser.add_argument('--report', help="JSON file receiving the comparison")
+    args = parser.parse_args()
+    
+    prune_model(args.model, ratios=args.ratios, latency_budget=args.latency_budget,
+                num_epochs=args.epochs, distill=not args.no_distill, processes=args.processes,
+                report_path=args.report)
+
+if __name__ == '__main__':
+    main()
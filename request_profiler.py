@@ -0,0 +1,122 @@
+"""
+Sampled torch.profiler tracing for production requests
+Captures Chrome-trace JSON with operator-level CPU time and memory
+allocations for a random sample of requests, or for the next requests on
+demand, into a directory that keeps only the newest traces
+"""
+
+import os
+import time
+import random
+import itertools
+import threading
+from contextlib import contextmanager
+from torch.profiler import profile, ProfilerActivity
+
+class RequestProfiler:
+    """Profile a sample of requests with torch.profiler"""
+    
+    def __init__(self, trace_dir='traces', sample_rate=0.0, max_traces=20):
+        """
+        Initialize the request profiler
+        
+        Args:
+            trace_dir: Directory receiving the traces
+            sample_rate: Fraction of requests profiled (0 only profiles on demand)
+            max_traces: Number of newest traces kept, older ones are deleted
+        """
+        self.trace_dir = trace_dir
+        self.sample_rate = sample_rate
+        self.max_traces = max_traces
+        self._pending = 0
+        self._rng = random.Random()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        
+        # torch.profiler supports one active profiler per process, so
+        # concurrent requests are never profiled at the same time
+        self._active = threading.Lock()
+    
+    def request(self, count=1):
+        """
+        Profile the next requests regardless of the sample rate
+        
+        Args:
+            count: Number of requests to profile
+        
+        Returns:
+            Number of requests waiting to be profiled
+        """
+        with self._lock:
+            self._pending += count
+            return self._pending
+    
+    def pending(self):
+        """Number of requests waiting to be profiled on demand"""
+        with self._lock:
+            return self._pending
+    
+    def _select(self):
+        """Decide whether the current request is profiled"""
+        with self._lock:
+            if self._pending > 0:
+                self._pending -= 1
+                return True
+        return self.sample_rate > 0 and self._rng.random() < self.sample_rate
+    
+    @contextmanager
+    def profile(self, name='request'):
+        """
+        Context manager profiling its block if the request is selected
+        
+        Unselected requests only pay for one random number.
+        
+        Args:
+            name: Name included in the trace file name
+        
+        Yields:
+            Path of the trace being written, or None if not profiled
+        """
+        if not self._select() or not self._active.acquire(blocking=False):
+            yield None
+            return
+        
+        try:
+            os.makedirs(self.trace_dir, exist_ok=True)
+            timestamp = time.strftime('%Y%m%d-%H%M%S')
+            path = os.path.join(self.trace_dir,
+                                f"{timestamp}-{next(self._sequence) % 10000:04d}-{name}.json")
+            with profile(activities=[ProfilerActivity.CPU], record_shapes=True,
+                         profile_memory=True) as prof:
+                yield path
+            
+            prof.export_chrome_trace(path)
+            
+            # Operator summary next to the trace for a quick look
+            with open(os.path.splitext(path)[0] + '.txt', 'w') as f:
+                f.write(prof.key_averages().table(sort_by='self_cpu_time_total', row_limit=25))
+            
+            self._rotate()
+        finally:
+            self._active.release()
+    
+    def traces(self):
+        """
+        List the stored traces
+        
+        Returns:
+            Trace file names, newest first
+        """
+        if not os.path.isdir(self.trace_dir):
+            return []
+        return sorted((name for name in os.listdir(self.trace_dir) if name.endswith('.json')),
+                      reverse=True)
+    
+    def _rotate(self):
+        """Delete the oldest traces beyond max_traces"""
+        for name in self.traces()[self.max_traces:]:
+            for path in (name, os.path.splitext(name)[0] + '.txt'):
+                try:
+                    os.remove(os.path.join(self.trace_dir, path))
+                except OSError:
+                    pass
@@ -0,0 +1,305 @@
+"""
+Offline barcode scanner for image corpora
+Runs BarcodeDetector over a directory, a glob pattern or a tar/zip archive:
+images are decoded and resized in a process pool, read in batches by the
+model and the results streamed to a CSV or JSONL file
+
+Finished images are appended to a resume file, so a run that crashed or was
+interrupted skips them when started again with the same arguments.
+
+Usage:
+    python scan_images.py photos/ --output results.csv
+    python scan_images.py 'scans/**/*.jpg' --output results.jsonl --workers 8
+    python scan_images.py archive.tar.gz --output results.jsonl --batch-size 32
+"""
+
+import io
+import os
+import csv
+import glob
+import json
+import time
+import tarfile
+import zipfile
+import argparse
+import multiprocessing
+from collections import deque
+import numpy as np
+import torch
+from barcode_detector import BACKENDS, BarcodeDetector, decode_image
+from batch_inputs import is_image_name, iter_chunks
+
+OUTPUT_FIELDS = ('name', 'barcode', 'status', 'error')
+
+def iter_source(source, skip=()):
+    """
+    Iterate over the images of a directory, glob pattern or archive
+    
+    Args:
+        source: Directory (walked recursively), glob pattern such as
+            'scans/**/*.jpg', or .tar/.tar.gz/.tgz/.zip archive
+        skip: Names to leave out, checked before an archive member is read
+    
+    Yields:
+        Tuples of (name, path) for files, or (name, image bytes) for
+        archive members, in a stable order
+    """
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if is_image_name(name):
+                    path = os.path.join(root, name)
+                    relative = os.path.relpath(path, source)
+                    if relative not in skip:
+                        yield relative, path
+    elif os.path.isfile(source) and zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if (not info.is_dir() and is_image_name(info.filename)
+                        and info.filename not in skip):
+                    yield info.filename, archive.read(info)
+    elif os.path.isfile(source) and tarfile.is_tarfile(source):
+        # Streaming mode reads members in order without an index
+        with tarfile.open(source, mode='r|*') as archive:
+            for member in archive:
+                if member.isfile() and is_image_name(member.name) and member.name not in skip:
+                    yield member.name, archive.extractfile(member).read()
+    elif os.path.isfile(source):
+        if source not in skip:
+            yield source, source
+    else:
+        for path in sorted(glob.iglob(source, recursive=True)):
+            if os.path.isfile(path) and is_image_name(path) and path not in skip:
+                yield path, path
+
+# Preprocessing of the detector: (transform, input size, grayscale)
+_preprocessing = None
+
+def _init_worker(preprocessing):
+    """Set up a decoding worker process"""
+    global _preprocessing
+    _preprocessing = preprocessing
+    # The workers are the parallelism, one intra-op thread each
+    torch.set_num_threads(1)
+
+def _decode(item):
+    """
+    Decode one image and resize it to the model input
+    
+    Workers return uint8 pixels, a quarter of the bytes of a normalized
+    float32 input to send back; the batch is normalized in the main process.
+    
+    Args:
+        item: Tuple of (name, path or image bytes)
+    
+    Returns:
+        Tuple of (name, uint8 array or None, error or None)
+    """
+    name, data = item
+    transform, input_size, grayscale = _preprocessing
+    try:
+        source = data if isinstance(data, str) else io.BytesIO(data)
+        array = transform.pixels(decode_image(source, input_size, grayscale))
+        return name, array, None
+    except Exception as e:
+        return name, None, f"{type(e).__name__}: {e}"
+
+def _imap_bounded(pool, function, items, max_pending):
+    """
+    Ordered pool map that keeps at most max_pending tasks in flight
+    
+    Pool.imap would read the whole input ahead, which for archives means
+    holding every image in memory.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(pool.apply_async(function, (item,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+def load_finished(resume_path):
+    """
+    Read the names recorded in a resume file
+    
+    Args:
+        resume_path: Resume file, one finished image name per line
+    
+    Returns:
+        Set of finished names (empty if the file does not exist)
+    """
+    if not os.path.exists(resume_path):
+        return set()
+    with open(resume_path, encoding='utf-8') as f:
+        return {line.rstrip('\n') for line in f if line.strip()}
+
+class ResultWriter:
+    """Append scan results to a CSV or JSONL file"""
+    
+    def __init__(self, path, output_format, append=False):
+        """
+        Open the output file
+        
+        Args:
+            path: Output file
+            output_format: 'csv' or 'jsonl'
+            append: Keep the results of a previous run
+        """
+        self.output_format = output_format
+        write_header = not (append and os.path.exists(path) and os.path.getsize(path) > 0)
+        self.file = open(path, 'a' if append else 'w', encoding='utf-8', newline='')
+        if output_format == 'csv':
+            self.writer = csv.DictWriter(self.file, fieldnames=OUTPUT_FIELDS)
+            if write_header:
+                self.writer.writeheader()
+    
+    def write(self, result):
+        """Write one result dictionary"""
+        if self.output_format == 'csv':
+            self.writer.writerow({field: result.get(field) or '' for field in OUTPUT_FIELDS})
+        else:
+            self.file.write(json.dumps(result) + '\n')
+    
+    def flush(self):
+        """Write buffered results through to the disk"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+    
+    def close(self):
+        """Close the output file"""
+        self.file.close()
+
+def scan(source, output, model_path='barcode_model.pth', backend='eager', batch_size=16,
+         workers=None, threads=None, output_format=None, resume_path=None,
+         progress_interval=10.0):
+    """
+    Scan a corpus of images for barcodes
+    
+    Args:
+        source: Directory, glob pattern or archive (see iter_source)
+        output: CSV or JSONL file receiving one result per image
+        model_path: Trained BarcodeNet checkpoint; a missing or unreadable
+            model raises instead of scanning with an untrained one
+        backend: Execution backend, one of BACKENDS
+        batch_size: Images per forward pass
+        workers: Decoding processes (default: CPU count - 1, 0 decodes in
+            this process)
+        threads: Intra-op threads of the model in this process (default:
+            the CPU count less the decoding workers, at least 1)
+        output_format: 'csv' or 'jsonl' (default: from the output extension)
+        resume_path: Resume file (default: output + '.resume')
+        progress_interval: Seconds between progress reports
+    
+    Returns:
+        Dictionary with the numbers of scanned, detected, failed and
+        skipped images and the throughput
+    """
+    if output_format is None:
+        output_format = 'csv' if output.lower().endswith('.csv') else 'jsonl'
+    if resume_path is None:
+        resume_path = output + '.resume'
+    if workers is None:
+        workers = max(1, (os.cpu_count() or 1) - 1)
+    if threads is None:
+        threads = max(1, (os.cpu_count() or 1) - workers)
+    # The model shares the cores with the decoding workers
+    torch.set_num_threads(threads)
+    
+    finished = load_finished(resume_path)
+    if finished:
+        print(f"Resuming: {len(finished)} images already scanned")
+    
+    detector = BarcodeDetector(model_path=model_path, backend=backend, strict=True)
+    items = iter_source(source, skip=finished)
+    stats = {'scanned': 0, 'detected': 0, 'failed': 0, 'skipped': len(finished)}
+    
+    preprocessing = (detector.transform, detector.model.input_size,
+                     detector.model.in_channels == 1)
+    pool = None
+    if workers > 0:
+        # Spawned workers do not inherit the parent's OpenMP state
+        pool = multiprocessing.get_context('spawn').Pool(
+            workers, initializer=_init_worker, initargs=(preprocessing,))
+        decoded = _imap_bounded(pool, _decode, items, max_pending=4 * batch_size)
+    else:
+        global _preprocessing
+        _preprocessing = preprocessing
+        decoded = map(_decode, items)
+    
+    writer = ResultWriter(output, output_format, append=bool(finished))
+    start = last_report = time.perf_counter()
+    try:
+        with open(resume_path, 'a', encoding='utf-8') as resume:
+            for chunk in iter_chunks(decoded, batch_size):
+                arrays = [array for _, array, _ in chunk if array is not None]
+                barcodes = iter(detector.detect_tensor(detector.transform.normalize(
+                    np.stack(arrays))) if arrays else [])
+                
+                for name, array, error in chunk:
+                    if array is None:
+                        result = {'name': name, 'barcode': None, 'status': 'error',
+                                  'error': error}
+                        stats['failed'] += 1
+                    else:
+                        barcode = next(barcodes)
+                        result = {'name': name, 'barcode': barcode,
+                                  'status': 'detected' if barcode else 'not_detected',
+                                  'error': None}
+                        stats['detected'] += bool(barcode)
+                    writer.write(result)
+                
+                # Results reach the disk before they are marked finished, so a
+                # crash can repeat a batch but never lose one
+                writer.flush()
+                resume.write(''.join(name + '\n' for name, _, _ in chunk))
+                resume.flush()
+                stats['scanned'] += len(chunk)
+                
+                now = time.perf_counter()
+                if now - last_report >= progress_interval:
+                    last_report = now
+                    print(f"{stats['scanned']} images, {stats['detected']} barcodes, "
+                          f"{stats['failed']} errors, "
+                          f"{stats['scanned'] / (now - start):.1f} images/s", flush=True)
+    finally:
+        writer.close()
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    
+    elapsed = time.perf_counter() - start
+    stats['seconds'] = elapsed
+    stats['images_per_sec'] = stats['scanned'] / elapsed if elapsed > 0 else 0.0
+    print(f"Scanned {stats['scanned']} images in {elapsed:.1f}s "
+          f"({stats['images_per_sec']:.1f} images/s): {stats['detected']} barcodes, "
+          f"{stats['failed']} errors, {stats['skipped']} skipped")
+    return stats
+
+def main():
+    """Scan images from the command line"""
+    parser = argparse.ArgumentParser(description="Scan a corpus of images for barcodes")
+    parser.add_argument('source', help="Directory, glob pattern or tar/zip archive")
+    parser.add_argument('--output', '-o', required=True, help="CSV or JSONL results file")
+    parser.add_argument('--format', choices=['csv', 'jsonl'],
+                        help="Output format (default: from the output extension)")
+    parser.add_argument('--model', default='barcode_model.pth', help="Trained model")
+    parser.add_argument('--backend', choices=BACKENDS, default='eager',
+                        help="Execution backend (default: eager)")
+    parser.add_argument('--batch-size', type=int, default=16, help="Images per forward pass")
+    parser.add_argument('--workers', type=int,
+                        help="Decoding processes (default: CPU count - 1, 0 for none)")
+    parser.add_argument('--threads', type=int,
+                        help="Model threads (default: CPU count less the workers, at least 1)")
+    parser.add_argument('--resume', help="Resume file (default: <output>.resume)")
+    parser.add_argument('--progress', type=float, default=10.0,
+                        help="Seconds between progress reports")
+    args = parser.parse_args()
+    
+    scan(args.source, args.output, model_path=args.model, backend=args.backend,
+         batch_size=args.batch_size, workers=args.workers, threads=args.threads,
+         output_format=args.format, resume_path=args.resume, progress_interval=args.progress)
+
+if __name__ == '__main__':
+    main()
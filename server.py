@@ -3,93 +3,288 @@ Flask server for barcode detection
 Receives images from web app and returns detected barcode numbers
 """
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, abort, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 import torch
-from barcode_detector import BarcodeDetector
-from PIL import Image
+from admission import AdmissionController, AdmissionRejected
+from barcode_detector import (MAX_IMAGE_PIXELS, BarcodeDetector, FrameQualityGate, ImageTooLarge,
+                              TestTimeAugmentation)
+from barcode_renderer import load_image_set
+from batch_inputs import (ZIP_TYPES, BatchInputError, UploadTooLarge, iter_chunks,
+                          iter_uploads)
+from metrics import CONTENT_TYPE, MetricsRegistry
+from model_reloader import ModelReloader, file_sha256
+from request_profiler import RequestProfiler
+from static_assets import build_assets
 import io
 import os
+import json
+import hmac
+import time
 import base64
-import tempfile
 
-app = Flask(__name__, static_folder='static', static_url_path='')
-CORS(app)  # Enable CORS for cross-origin requests
+app = Flask(__name__, static_folder=None)
+CORS(app, expose_headers=['Retry-After'])  # Enable CORS for cross-origin requests
 
-# Initialize the barcode detector with pre-trained model
-MODEL_PATH = 'barcode_model.pth'
+# The web app, with content-hashed asset names and precompressed variants,
+# built in memory once per worker (see static_assets.py)
+STATIC_ASSETS = build_assets(os.path.join(app.root_path, 'static'))
+
+# Initialize the barcode detector with pre-trained model. A .safetensors
+# model is memory-mapped, so gunicorn workers share one copy of the weights.
+MODEL_PATH = os.environ.get('PYBAR_MODEL_PATH', 'barcode_model.pth')
 detector = None
 
+# Execution backend and intra-op threads, e.g. as recommended by
+# compare_backends.py
+BACKEND = os.environ.get('PYBAR_BACKEND', 'eager')
+NUM_THREADS = os.environ.get('PYBAR_NUM_THREADS')
+
+# Hot reload: the model file is checked every PYBAR_RELOAD_INTERVAL seconds
+# (0 disables the watcher, /admin/model/reload still works) and new weights
+# must read a canary set of PYBAR_CANARY_SIZE synthetic images, plus the
+# labeled photos of PYBAR_CANARY_DIR, about as well as the live model
+RELOAD_INTERVAL = float(os.environ.get('PYBAR_RELOAD_INTERVAL', '5'))
+CANARY_SIZE = int(os.environ.get('PYBAR_CANARY_SIZE', '16'))
+CANARY_DIR = os.environ.get('PYBAR_CANARY_DIR')
+reloader = None
+
+# Optional quality gate to skip inference on blurry or badly exposed images.
+# Uploads come from many clients, so the frame-difference check is disabled.
+frame_gate = None
+if os.environ.get('PYBAR_FRAME_GATE') == '1':
+    frame_gate = FrameQualityGate(min_change=None)
+
+# Optional test-time augmentation: images the plain pass does not read
+# confidently are retried as a batch of rotated, zoomed and contrast
+# stretched variants, instead of the user recapturing
+tta = TestTimeAugmentation() if os.environ.get('PYBAR_TTA') == '1' else None
+
+# Opt-in torch.profiler traces for a sample of detection requests, and on
+# demand through the admin endpoints when PYBAR_ADMIN_TOKEN is set
+profiler = RequestProfiler(trace_dir=os.environ.get('PYBAR_PROFILE_DIR', 'traces'),
+                           sample_rate=float(os.environ.get('PYBAR_PROFILE_RATE', '0')),
+                           max_traces=int(os.environ.get('PYBAR_PROFILE_KEEP', '20')))
+ADMIN_TOKEN = os.environ.get('PYBAR_ADMIN_TOKEN')
+
+# Admission control: at most PYBAR_MAX_INFLIGHT requests decode and run the
+# model at once, PYBAR_MAX_QUEUE more may wait, everything else gets a 503.
+# Requests carry a deadline (X-Request-Deadline-Ms header or deadline_ms
+# field, capped at PYBAR_DEADLINE_MS) and are dropped once it has passed.
+# Both limits together stay below the request threads of the process
+# (PYBAR_THREADS, under gunicorn its --threads): requests beyond the threads
+# wait in the WSGI server's own queue, where they are never shed.
+THREADS = int(os.environ.get('PYBAR_THREADS', '8'))
+MAX_INFLIGHT = int(os.environ.get('PYBAR_MAX_INFLIGHT', '2'))
+MAX_QUEUE = os.environ.get('PYBAR_MAX_QUEUE')
+DEADLINE_MS = float(os.environ.get('PYBAR_DEADLINE_MS', '10000'))
+
+def admission_limits(threads):
+    """
+    In-flight and queue limits for a process serving on `threads` threads
+    
+    One thread is kept free to answer the 503s; the queue gets the remaining
+    threads unless PYBAR_MAX_QUEUE asks for fewer.
+    
+    Args:
+        threads: Request threads of the process
+    
+    Returns:
+        Tuple of (max_inflight, max_queue)
+    """
+    max_inflight = max(1, min(MAX_INFLIGHT, threads - 1))
+    spare = max(0, threads - 1 - max_inflight)
+    if MAX_QUEUE is None:
+        return max_inflight, spare
+    if int(MAX_QUEUE) > spare:
+        print(f"Warning: PYBAR_MAX_QUEUE={MAX_QUEUE} does not fit in {threads} threads, "
+              f"using {spare}")
+    return max_inflight, min(int(MAX_QUEUE), spare)
+
+admission = AdmissionController(*admission_limits(THREADS))
+
+def set_request_threads(threads):
+    """
+    Size admission control for the request threads of this process
+    
+    Args:
+        threads: Request threads, e.g. gunicorn's --threads
+    """
+    global admission
+    admission = AdmissionController(*admission_limits(threads))
+    print(f"Admission: {admission.max_inflight} in flight, {admission.max_queue} queued "
+          f"on {threads} threads")
+
+# Bulk detection: images per forward pass, and how long a batch may wait
+# for an inference slot before the stream ends with "done": false
+BATCH_SIZE = int(os.environ.get('PYBAR_BATCH_SIZE', '8'))
+BATCH_WAIT_MS = float(os.environ.get('PYBAR_BATCH_WAIT_MS', '60000'))
+
+# Ingest limits: largest encoded image, and largest decoded image in pixels
+# (JPEGs are measured after draft scaling to the model input, so only huge
+# photos or other formats hit it). Oversized /api/detect bodies are refused
+# from their Content-Length before being read.
+MAX_IMAGE_BYTES = int(os.environ.get('PYBAR_MAX_IMAGE_BYTES', str(20 * 1024 * 1024)))
+MAX_PIXELS = int(os.environ.get('PYBAR_MAX_IMAGE_PIXELS', str(MAX_IMAGE_PIXELS)))
+MAX_UPLOAD_BYTES = MAX_IMAGE_BYTES * 4 // 3 + 64 * 1024
+
+# Largest zip archive of /api/detect/batch, which is spooled to disk before
+# it can be read; the other bulk formats are streamed and not limited
+MAX_ARCHIVE_BYTES = int(os.environ.get('PYBAR_MAX_ARCHIVE_BYTES', str(512 * 1024 * 1024)))
+
+# Content types /api/detect accepts as a raw image body instead of JSON;
+# the web client uploads its cropped, model-sized frame this way
+IMAGE_UPLOAD_TYPES = ('image/jpeg', 'image/png', 'image/webp')
+
+# Prometheus metrics served at /metrics
+metrics = MetricsRegistry()
+request_counter = metrics.counter('pybar_requests_total',
+                                  'Detection requests by outcome', ['outcome'])
+stage_latency = metrics.histogram('pybar_stage_duration_seconds',
+                                  'Time spent in each detection pipeline stage', ['stage'])
+batch_size_gauge = metrics.gauge('pybar_batch_size',
+                                 'Number of images in the most recent inference batch')
+queue_depth = metrics.gauge('pybar_queue_depth',
+                            'Detection requests waiting for an inference slot')
+inflight_requests = metrics.gauge('pybar_inflight_requests',
+                                  'Detection requests holding an inference slot')
+batch_images = metrics.counter('pybar_batch_images_total',
+                               'Images of bulk detection requests by outcome', labels=('outcome',))
+model_load_seconds = metrics.gauge('pybar_model_load_seconds',
+                                   'Time taken to load the detection model')
+model_reloads = metrics.counter('pybar_model_reloads_total',
+                                'Model reload attempts by status', ['status'])
+
+# Outcomes are reported from the start so rate alerts see zero, not no data
+REQUEST_OUTCOMES = ('detected', 'not_detected', 'rejected', 'bad_request', 'too_large',
+                    'overloaded', 'deadline_exceeded', 'error')
+for outcome in REQUEST_OUTCOMES:
+    request_counter.inc(0, outcome=outcome)
+for outcome in ('detected', 'not_detected', 'error'):
+    batch_images.inc(0, outcome=outcome)
+for status in ('swapped', 'unchanged', 'rejected', 'failed'):
+    model_reloads.inc(0, status=status)
+
 def init_detector():
-    """Initialize the barcode detector"""
-    global detector
+    """Initialize the barcode detector and start watching the model file"""
+    global reloader
+    start = time.perf_counter()
+    if NUM_THREADS:
+        torch.set_num_threads(int(NUM_THREADS))
+    
+    canary_images, canary_labels = [], []
+    if CANARY_SIZE > 0 or CANARY_DIR:
+        canary_images, canary_labels = load_image_set(CANARY_SIZE, CANARY_DIR)
+    reloader = ModelReloader(MODEL_PATH, load_detector, swap_detector, canary_images,
+                             canary_labels, poll_interval=RELOAD_INTERVAL,
+                             on_reload=record_reload)
+    
     if os.path.exists(MODEL_PATH):
-        detector = BarcodeDetector(model_path=MODEL_PATH)
-        print(f"Loaded pre-trained model from {MODEL_PATH}")
+        reloader.activate(BarcodeDetector(model_path=MODEL_PATH, backend=BACKEND, tta=tta),
+                          file_sha256(MODEL_PATH))
+        print(f"Loaded pre-trained model from {MODEL_PATH} ({BACKEND} backend)")
     else:
-        detector = BarcodeDetector()
+        reloader.activate(BarcodeDetector(backend=BACKEND, tta=tta))
         print("Warning: No pre-trained model found, using untrained model")
+    model_load_seconds.set(time.perf_counter() - start)
+    reloader.start()
+
+def load_detector(path):
+    """Build a detector for a reload, failing instead of falling back"""
+    start = time.perf_counter()
+    new_detector = BarcodeDetector(model_path=path, backend=BACKEND, strict=True, tta=tta)
+    model_load_seconds.set(time.perf_counter() - start)
+    return new_detector
+
+def swap_detector(new_detector, info):
+    """
+    Make a validated detector live
+    
+    A single assignment: requests that already hold the previous detector
+    finish with it, the next ones use the new one.
+    """
+    global detector
+    detector = new_detector
+    print(f"Serving model version {info['version']}")
+
+def record_reload(outcome):
+    """Count reload outcomes for /metrics"""
+    if outcome['status'] != 'busy':
+        model_reloads.inc(status=outcome['status'])
 
-@app.route('/')
-def index():
-    """Serve the main web application"""
-    return send_from_directory('static', 'index.html')
+@app.route('/', defaults={'path': ''})
+@app.route('/<path:path>')
+def static_asset(path):
+    """
+    Serve the web application from the prebuilt assets
+    Content-hashed files are cached for a year, the page, the service worker
+    and unhashed names are revalidated with their ETag (304 when unchanged).
+    Bodies come precompressed from memory, so this costs no disk reads or
+    compression per request.
+    """
+    asset = STATIC_ASSETS.get('/' + path)
+    if asset is None:
+        abort(404)
+    
+    coding, body, etag = asset.select(request.accept_encodings)
+    response = Response(body, mimetype=asset.content_type)
+    response.headers['Cache-Control'] = asset.cache_control
+    response.headers['Vary'] = 'Accept-Encoding'
+    if coding:
+        response.headers['Content-Encoding'] = coding
+    response.set_etag(etag)
+    return response.make_conditional(request)
 
 @app.route('/api/detect', methods=['POST'])
 def detect_barcode():
     """
     API endpoint to detect barcode from uploaded image
-    Expects: JSON with base64 encoded image data
+    Expects: JSON with base64 encoded image data, or the image itself as an
+    image/jpeg, image/png or image/webp body
     Returns: JSON with detected barcode number or error
     """
+    start = time.perf_counter()
+    arrival = request_arrival()
+    outcome = 'error'
     try:
+        if request.content_length is not None and request.content_length > MAX_UPLOAD_BYTES:
+            outcome = 'too_large'
+            return jsonify({'error': f'Upload larger than {MAX_UPLOAD_BYTES} bytes'}), 413
+        
         # Get image data from request
-        data = request.get_json()
+        with stage_latency.time(stage='body_read'):
+            body = read_body(MAX_UPLOAD_BYTES)
+            if request.mimetype in IMAGE_UPLOAD_TYPES:
+                data = {'image': body}
+            else:
+                try:
+                    data = json.loads(body) if request.is_json else None
+                except ValueError:
+                    data = None
         
-        if not data or 'image' not in data:
+        if not isinstance(data, dict) or not data.get('image'):
+            outcome = 'bad_request'
             return jsonify({'error': 'No image data provided'}), 400
         
-        # Decode base64 image
-        image_data = data['image']
-        
-        # Remove data URL prefix if present
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
-        
-        image_bytes = base64.b64decode(image_data)
-        
-        # Open image with PIL
-        image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-        
-        # Save temporarily for processing
-        import tempfile
-        temp_file = tempfile.NamedTemporaryFile(mode='wb', suffix='.jpg', delete=False)
-        temp_path = temp_file.name
-        temp_file.close()
-        image.save(temp_path)
-        
-        # Detect barcode
-        if detector is None:
-            return jsonify({'error': 'Detector not initialized'}), 500
-        
-        barcode_number = detector.detect_from_file(temp_path)
-        
-        # Clean up temp file
-        try:
-            os.remove(temp_path)
-        except OSError:
-            pass
-        
-        if barcode_number:
-            return jsonify({
-                'success': True,
-                'barcode': barcode_number
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'message': 'No barcode detected in image'
-            })
+        deadline = arrival + request_budget_ms(data) / 1000
+        with admission.admit(deadline):
+            response, outcome = run_detection(data['image'], deadline)
+        return response
+    
+    except AdmissionRejected as rejection:
+        outcome = rejection.reason
+        response = jsonify({
+            'success': False,
+            'error': 'Server busy, please retry later',
+            'reason': rejection.reason
+        })
+        response.status_code = 503
+        response.headers['Retry-After'] = str(rejection.retry_after)
+        return response
+    
+    except (ImageTooLarge, UploadTooLarge) as e:
+        outcome = 'too_large'
+        return jsonify({'error': str(e)}), 413
     
     except Exception as e:
         print(f"Error processing image: {e}")
@@ -97,18 +292,386 @@ def detect_barcode():
         traceback.print_exc()
         # Don't expose internal error details to client in production
         return jsonify({'error': 'Internal server error processing image'}), 500
+    
+    finally:
+        request_counter.inc(outcome=outcome)
+        stage_latency.observe(time.perf_counter() - start, stage='total')
+
+def read_body(max_bytes):
+    """
+    Read the request body, up to max_bytes
+    
+    Chunked uploads carry no Content-Length, so the size is checked while
+    reading rather than only from the header.
+    
+    Args:
+        max_bytes: Largest accepted body in bytes
+    
+    Returns:
+        The body as bytes
+    
+    Raises:
+        UploadTooLarge: The body is larger than max_bytes
+    """
+    chunks = []
+    size = 0
+    while True:
+        chunk = request.stream.read(min(64 * 1024, max_bytes + 1 - size))
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLarge(f"Upload larger than {max_bytes} bytes")
+    return b''.join(chunks)
+
+def request_arrival():
+    """
+    time.monotonic() value at which the request reached the front proxy
+    
+    A proxy that stamps X-Request-Start (t= followed by seconds, milliseconds
+    or microseconds since the epoch, e.g. nginx's t=${msec} or Heroku's
+    router) makes the time queued in the proxy and in gunicorn count against
+    the request's deadline. Without the header the request arrives now.
+    
+    Returns:
+        Arrival time on the time.monotonic() clock
+    """
+    now = time.monotonic()
+    stamp = request.headers.get('X-Request-Start', '')
+    try:
+        started = float(stamp[2:] if stamp.startswith('t=') else stamp)
+    except ValueError:
+        return now
+    
+    # Scale milliseconds and microseconds since the epoch to seconds
+    while started > 1e11:
+        started /= 1000.0
+    queued = min(max(time.time() - started, 0.0), DEADLINE_MS / 1000)
+    return now - queued
+
+def request_budget_ms(data):
+    """
+    Time budget of a detection request in milliseconds
+    
+    Args:
+        data: Parsed JSON body (the image alone for raw image bodies)
+    
+    Returns:
+        Client-supplied budget capped at DEADLINE_MS, or DEADLINE_MS
+    """
+    budget = request.headers.get('X-Request-Deadline-Ms', data.get('deadline_ms'))
+    try:
+        return min(max(float(budget), 0.0), DEADLINE_MS)
+    except (TypeError, ValueError):
+        return DEADLINE_MS
+
+def run_detection(image_data, deadline):
+    """
+    Decode the uploaded image and run the detector on it
+    
+    Args:
+        image_data: Base64 image (optionally a data URL) from a JSON body,
+            or the bytes of a raw image body
+        deadline: time.monotonic() value after which the result is useless
+    
+    Returns:
+        Tuple of (response, outcome)
+    """
+    # Use the detector live when the request got here, even if a reload
+    # swaps it meanwhile
+    active = detector
+    if active is None:
+        return (jsonify({'error': 'Detector not initialized'}), 500), 'error'
+    
+    # Decode base64 image
+    if isinstance(image_data, bytes):
+        image_bytes = image_data
+    else:
+        with stage_latency.time(stage='base64_decode'):
+            # Remove data URL prefix if present
+            if ',' in image_data:
+                image_data = image_data.split(',')[1]
+            
+            image_bytes = base64.b64decode(image_data)
+    
+    # Open image with PIL, directly at about the model's input resolution
+    with stage_latency.time(stage='image_decode'):
+        image = active.open_image(io.BytesIO(image_bytes), MAX_PIXELS)
+    
+    # Reject images the model cannot read before running inference
+    if frame_gate is not None:
+        with stage_latency.time(stage='quality_gate'):
+            rejection = frame_gate.check(image)
+        if rejection:
+            return jsonify({
+                'success': False,
+                'message': f'Image rejected before detection: {rejection}',
+                'reason': rejection
+            }), 'rejected'
+    
+    # The client has given up on requests past their deadline
+    if time.monotonic() > deadline:
+        raise AdmissionRejected('deadline_exceeded', admission.retry_after())
+    
+    timings = {}
+    with profiler.profile('detect'):
+        barcode_number = active.detect_image(image, timings)
+    for stage, seconds in timings.items():
+        stage_latency.observe(seconds, stage=stage)
+    batch_size_gauge.set(1)
+    
+    if barcode_number:
+        return jsonify({
+            'success': True,
+            'barcode': barcode_number
+        }), 'detected'
+    else:
+        return jsonify({
+            'success': False,
+            'message': 'No barcode detected in image'
+        }), 'not_detected'
+
+@app.route('/api/detect/batch', methods=['POST'])
+def detect_batch():
+    """
+    Bulk barcode detection endpoint
+    Accepts image files as multipart/form-data, a zip or tar archive, or
+    NDJSON lines of {"id": ..., "image": "<base64>"}
+    Returns: NDJSON stream with one result line per image, written as soon as
+    its batch is processed, and a final summary line
+    """
+    if detector is None:
+        return jsonify({'error': 'Detector not initialized'}), 500
+    if (request.mimetype in ZIP_TYPES and request.content_length is not None
+            and request.content_length > MAX_ARCHIVE_BYTES):
+        return jsonify({'error': f'archive larger than {MAX_ARCHIVE_BYTES} bytes'}), 413
+    
+    try:
+        uploads = iter_uploads(request.mimetype, request.stream, MAX_IMAGE_BYTES,
+                               boundary=request.mimetype_params.get('boundary'),
+                               max_archive_bytes=MAX_ARCHIVE_BYTES)
+    except UploadTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    except BatchInputError as e:
+        return jsonify({'error': str(e)}), 415
+    
+    def generate():
+        summary = {'done': True, 'images': 0, 'detected': 0, 'not_detected': 0, 'errors': 0}
+        try:
+            for chunk in iter_chunks(uploads, BATCH_SIZE):
+                for result in detect_chunk(chunk, summary['images']):
+                    summary['images'] += 1
+                    outcome = ('error' if 'error' in result else
+                               'detected' if result['success'] else 'not_detected')
+                    summary['errors' if outcome == 'error' else outcome] += 1
+                    batch_images.inc(outcome=outcome)
+                    yield json.dumps(result) + '\n'
+        except AdmissionRejected as rejection:
+            # The headers are sent, so overload ends the stream instead of a 503
+            summary['done'] = False
+            summary['error'] = 'Server busy, please retry later'
+            summary['retry_after'] = rejection.retry_after
+        except Exception as e:
+            # Corrupt archives surface while iterating, after the headers
+            # are sent, so the failure is reported in the stream
+            print(f"Error reading bulk upload: {e}")
+            summary['done'] = False
+            summary['error'] = 'Invalid or truncated upload'
+        yield json.dumps(summary) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def detect_chunk(chunk, first_index):
+    """
+    Decode a chunk of uploaded images and detect barcodes in one forward pass
+    
+    Args:
+        chunk: List of (name, image bytes or BatchInputError) tuples
+        first_index: Position of the first image in the upload
+    
+    Returns:
+        List of result dictionaries, in upload order
+    
+    Raises:
+        AdmissionRejected: No inference slot freed up within BATCH_WAIT_MS
+    """
+    # Bulk uploads wait for a slot instead of failing half-way through the
+    # stream, so interactive requests keep their share of the model, but
+    # only for BATCH_WAIT_MS
+    give_up = time.monotonic() + BATCH_WAIT_MS / 1000
+    while True:
+        try:
+            with admission.admit(min(time.monotonic() + DEADLINE_MS / 1000, give_up)):
+                return run_chunk(chunk, first_index)
+        except AdmissionRejected as rejection:
+            remaining = give_up - time.monotonic()
+            if remaining <= 0:
+                raise
+            time.sleep(min(rejection.retry_after, remaining))
+
+def item_error(error):
+    """
+    Client-facing message of a per-image error of a bulk upload
+    
+    Exception texts can carry internal details, such as the repr of the
+    buffer PIL failed to identify, so every error class maps to a fixed
+    message.
+    
+    Args:
+        error: The BatchInputError of the upload, or the exception raised
+            while decoding the image
+    
+    Returns:
+        Error message
+    """
+    if isinstance(error, ImageTooLarge):
+        return f'image larger than {MAX_PIXELS} pixels'
+    if isinstance(error, BatchInputError):
+        # Raised by batch_inputs with messages of its own
+        return str(error)
+    return 'cannot decode image'
+
+
+def run_chunk(chunk, first_index):
+    """Decode and detect a chunk while holding an inference slot"""
+    active = detector
+    results = []
+    images = []
+    for offset, (name, data) in enumerate(chunk):
+        result = {'index': first_index + offset, 'name': name}
+        results.append(result)
+        if isinstance(data, BatchInputError):
+            result.update(success=False, error=item_error(data))
+            continue
+        try:
+            with stage_latency.time(stage='image_decode'):
+                images.append((result, active.open_image(io.BytesIO(data), MAX_PIXELS)))
+        except Exception as e:
+            result.update(success=False, error=item_error(e))
+    
+    if images:
+        timings = {}
+        with profiler.profile('detect_batch'):
+            barcodes = active.detect_images([image for _, image in images], timings)
+        for stage, seconds in timings.items():
+            stage_latency.observe(seconds, stage=stage)
+        batch_size_gauge.set(len(images))
+        
+        for (result, _), barcode_number in zip(images, barcodes):
+            if barcode_number:
+                result.update(success=True, barcode=barcode_number)
+            else:
+                result.update(success=False, message='No barcode detected in image')
+    
+    return results
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics endpoint"""
+    queue_depth.set(admission.waiting)
+    inflight_requests.set(admission.inflight)
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+def is_admin_request():
+    """Check the bearer token of an admin request"""
+    if not ADMIN_TOKEN:
+        return False
+    header = request.headers.get('Authorization', '')
+    token = header[len('Bearer '):] if header.startswith('Bearer ') else ''
+    return hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+@app.route('/admin/profile', methods=['GET', 'POST'])
+def admin_profile():
+    """
+    Admin endpoint for request profiling
+    GET lists the stored traces, POST with {"count": N} profiles the next
+    N detection requests
+    Requires: Authorization: Bearer <PYBAR_ADMIN_TOKEN>
+    """
+    if not is_admin_request():
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            count = int(data.get('count', 1))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'count must be an integer'}), 400
+        if not 1 <= count <= 100:
+            return jsonify({'error': 'count must be between 1 and 100'}), 400
+        profiler.request(count)
+    
+    return jsonify({
+        'pending': profiler.pending(),
+        'sample_rate': profiler.sample_rate,
+        'traces': profiler.traces()
+    })
+
+@app.route('/admin/profile/<path:name>', methods=['GET'])
+def admin_profile_trace(name):
+    """Download a stored trace (Chrome trace JSON or operator summary)"""
+    if not is_admin_request():
+        return jsonify({'error': 'Unauthorized'}), 401
+    return send_from_directory(os.path.abspath(profiler.trace_dir), name, as_attachment=True)
+
+@app.route('/admin/model', methods=['GET'])
+def admin_model():
+    """
+    Admin endpoint describing the live model and the last reload
+    Requires: Authorization: Bearer <PYBAR_ADMIN_TOKEN>
+    """
+    if not is_admin_request():
+        return jsonify({'error': 'Unauthorized'}), 401
+    if reloader is None:
+        return jsonify({'error': 'Detector not initialized'}), 500
+    
+    return jsonify({
+        'active': reloader.info,
+        'last_reload': reloader.last_reload,
+        'watch_interval': reloader.poll_interval
+    })
+
+@app.route('/admin/model/reload', methods=['POST'])
+def admin_model_reload():
+    """
+    Admin endpoint reloading the model file in the background
+    POST with {"force": true} reloads even if the file is unchanged
+    Requires: Authorization: Bearer <PYBAR_ADMIN_TOKEN>
+    Returns: 202 once the reload started, 409 if one is already running
+    """
+    if not is_admin_request():
+        return jsonify({'error': 'Unauthorized'}), 401
+    if reloader is None:
+        return jsonify({'error': 'Detector not initialized'}), 500
+    if not os.path.exists(MODEL_PATH):
+        return jsonify({'error': f'{MODEL_PATH} not found'}), 404
+    
+    data = request.get_json(silent=True) or {}
+    if not reloader.reload_async(force=bool(data.get('force'))):
+        return jsonify({'error': 'A reload is already running'}), 409
+    return jsonify({'status': 'reloading', 'active': reloader.info}), 202
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
+    info = reloader.info if reloader is not None else {}
+    active = detector
     return jsonify({
         'status': 'healthy',
-        'model_loaded': detector is not None,
-        'model_path': MODEL_PATH if os.path.exists(MODEL_PATH) else 'No model'
+        'model_loaded': active is not None,
+        # Input geometry the web client crops and scales its uploads to
+        'model_input_size': list(active.model.input_size) if active is not None else None,
+        'model_channels': active.model.in_channels if active is not None else None,
+        'model_path': MODEL_PATH if os.path.exists(MODEL_PATH) else 'No model',
+        'model_version': info.get('version'),
+        'model_sha256': info.get('sha256'),
+        'model_loaded_at': info.get('loaded_at')
     })
 
 if __name__ == '__main__':
-    # Initialize detector on startup
+    # Importing the app has no side effects; under gunicorn the post_fork
+    # hook in gunicorn.conf.py initializes the detector in each worker
     init_detector()
     
     # Run server
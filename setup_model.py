@@ -2,13 +2,19 @@
 """
 Script to train and generate the pre-trained barcode detection model
 This should be run before starting the server if barcode_model.pth doesn't exist
+
+Use --output barcode_model.safetensors for the memory-mapped flat format, or
+--convert barcode_model.pth --output barcode_model.safetensors to convert an
+existing model without retraining
 """
 
 import os
 import sys
+import argparse
 
 try:
-    from train_model import train_model
+    from train_model import train_distributed
+    from barcode_detector import load_model, save_model
 except ImportError as e:
     print(f"Error: Unable to import train_model module: {e}")
     print("Please ensure train_model.py exists and is accessible.")
@@ -16,11 +22,35 @@ except ImportError as e:
 
 MODEL_PATH = 'barcode_model.pth'
 
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Train the barcode detection model")
+    parser.add_argument('--epochs', type=int, default=20, help="Number of training epochs")
+    parser.add_argument('--processes', type=int, default=1,
+                        help="Data-parallel training processes on this machine (gloo backend)")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue an interrupted run from its last checkpoint")
+    parser.add_argument('--output', default=MODEL_PATH,
+                        help="Model file; a .safetensors file is saved in the memory-mapped "
+                             "flat format (default: %(default)s)")
+    parser.add_argument('--convert', metavar='MODEL',
+                        help="Convert an existing model to --output instead of training")
+    return parser.parse_args()
+
 def main():
     """Main function to setup the model"""
-    if os.path.exists(MODEL_PATH):
-        print(f"✓ Pre-trained model already exists: {MODEL_PATH}")
-        size_mb = os.path.getsize(MODEL_PATH) / (1024 * 1024)
+    args = parse_args()
+    model_path = args.output
+    
+    if args.convert:
+        save_model(load_model(args.convert), model_path)
+        size_mb = os.path.getsize(model_path) / (1024 * 1024)
+        print(f"✓ Converted {args.convert} to {model_path} ({size_mb:.1f} MB)")
+        return 0
+    
+    if os.path.exists(model_path) and not args.resume:
+        print(f"✓ Pre-trained model already exists: {model_path}")
+        size_mb = os.path.getsize(model_path) / (1024 * 1024)
         print(f"  Size: {size_mb:.1f} MB")
         
         response = input("\nDo you want to retrain the model? (y/N): ")
@@ -38,23 +68,29 @@ def main():
     try:
         # Train the model with appropriate settings
         print("Starting training...")
-        train_model(
-            num_epochs=20,
+        train_distributed(
+            args.processes,
+            num_epochs=args.epochs,
             batch_size=32,
             learning_rate=0.001,
-            save_path=MODEL_PATH
+            save_path=model_path,
+            resume=args.resume
         )
         
         print("\n" + "="*60)
         print("✓ Model training completed successfully!")
         print("="*60)
-        print(f"\nModel saved to: {MODEL_PATH}")
+        print(f"\nModel saved to: {model_path}")
         
-        if os.path.exists(MODEL_PATH):
-            size_mb = os.path.getsize(MODEL_PATH) / (1024 * 1024)
+        if os.path.exists(model_path):
+            size_mb = os.path.getsize(model_path) / (1024 * 1024)
             print(f"Model size: {size_mb:.1f} MB")
         
-        print("\nYou can now start the server with: python server.py")
+        if model_path == MODEL_PATH:
+            print("\nYou can now start the server with: python server.py")
+        else:
+            print(f"\nYou can now start the server with: PYBAR_MODEL_PATH={model_path} "
+                  "python server.py")
         return 0
         
     except Exception as e:
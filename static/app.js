@@ -7,6 +7,7 @@ const API_BASE_URL = window.location.origin;
 // DOM Elements
 const video = document.getElementById('video');
 const canvas = document.getElementById('canvas');
+const aimBox = document.getElementById('aim-box');
 const cameraContainer = document.getElementById('camera-container');
 const previewContainer = document.getElementById('preview-container');
 const previewImage = document.getElementById('preview-image');
@@ -17,8 +18,21 @@ const scanBtn = document.getElementById('scan-btn');
 const retryBtn = document.getElementById('retry-btn');
 const loading = document.getElementById('loading');
 
+// Time the server may spend on a scan, and retries when it is busy (503)
+const REQUEST_DEADLINE_MS = 10000;
+const MAX_BUSY_RETRIES = 3;
+
+// Uploads are the aiming box only, scaled down to the model input and
+// sent as a small grayscale JPEG instead of the full frame
+const AIM_BOX_FRACTION = 0.8;
+const UPLOAD_JPEG_QUALITY = 0.85;
+
 let stream = null;
 let capturedImageData = null;
+let capturedPreviewUrl = null;
+
+// Model input geometry, updated from /api/health
+let modelInput = { width: 224, height: 224 };
 
 // Initialize the application
 async function init() {
@@ -34,6 +48,7 @@ async function init() {
         
         stream = await navigator.mediaDevices.getUserMedia(constraints);
         video.srcObject = stream;
+        video.addEventListener('loadedmetadata', layoutAimBox);
         
         console.log('Camera initialized successfully');
     } catch (error) {
@@ -42,21 +57,93 @@ async function init() {
     }
 }
 
-// Capture image from video stream
-function captureImage() {
-    // Set canvas dimensions to match video
-    canvas.width = video.videoWidth;
-    canvas.height = video.videoHeight;
+// Region of the video frame under the aiming box, in video pixels. It has
+// the aspect ratio of the model input and fits AIM_BOX_FRACTION of the frame.
+function aimRegion() {
+    const frameWidth = video.videoWidth || 1280;
+    const frameHeight = video.videoHeight || 720;
+    const aspect = modelInput.width / modelInput.height;
+    let width = frameWidth * AIM_BOX_FRACTION;
+    let height = width / aspect;
+    if (height > frameHeight * AIM_BOX_FRACTION) {
+        height = frameHeight * AIM_BOX_FRACTION;
+        width = height * aspect;
+    }
+    return {
+        x: (frameWidth - width) / 2,
+        y: (frameHeight - height) / 2,
+        width: width,
+        height: height,
+        frameWidth: frameWidth,
+        frameHeight: frameHeight
+    };
+}
+
+// Place the aiming box over the video, in percent of the displayed frame
+function layoutAimBox() {
+    const region = aimRegion();
+    aimBox.style.left = `${100 * region.x / region.frameWidth}%`;
+    aimBox.style.top = `${100 * region.y / region.frameHeight}%`;
+    aimBox.style.width = `${100 * region.width / region.frameWidth}%`;
+    aimBox.style.height = `${100 * region.height / region.frameHeight}%`;
+}
+
+// Crop the aiming box out of the current frame and scale it to the model
+// input on the canvas. Large reductions are done by halving steps, since a
+// single bilinear draw skips pixels and loses thin bars.
+function drawAimRegion() {
+    const region = aimRegion();
+    let source = video;
+    let x = region.x;
+    let y = region.y;
+    let width = region.width;
+    let height = region.height;
+    
+    while (width / 2 >= modelInput.width && height / 2 >= modelInput.height) {
+        const step = document.createElement('canvas');
+        step.width = Math.round(width / 2);
+        step.height = Math.round(height / 2);
+        step.getContext('2d').drawImage(source, x, y, width, height, 0, 0, step.width, step.height);
+        source = step;
+        x = 0;
+        y = 0;
+        width = step.width;
+        height = step.height;
+    }
     
-    // Draw current video frame to canvas
+    canvas.width = modelInput.width;
+    canvas.height = modelInput.height;
     const context = canvas.getContext('2d');
-    context.drawImage(video, 0, 0, canvas.width, canvas.height);
+    context.imageSmoothingEnabled = true;
+    context.imageSmoothingQuality = 'high';
+    context.drawImage(source, x, y, width, height, 0, 0, canvas.width, canvas.height);
+    
+    // Grayscale (ITU-R BT.601 luma, as PIL's convert('L')): the model reads
+    // bars, not colors, and flat chroma makes the JPEG smaller
+    const pixels = context.getImageData(0, 0, canvas.width, canvas.height);
+    const data = pixels.data;
+    for (let i = 0; i < data.length; i += 4) {
+        const luma = 0.299 * data[i] + 0.587 * data[i + 1] + 0.114 * data[i + 2];
+        data[i] = data[i + 1] = data[i + 2] = luma;
+    }
+    context.putImageData(pixels, 0, 0);
+}
+
+// Capture image from video stream
+async function captureImage() {
+    drawAimRegion();
     
-    // Get image data as base64
-    capturedImageData = canvas.toDataURL('image/jpeg', 0.9);
+    // Get image data as a JPEG blob, uploaded as is
+    capturedImageData = await new Promise(resolve =>
+        canvas.toBlob(resolve, 'image/jpeg', UPLOAD_JPEG_QUALITY));
+    if (!capturedImageData) {
+        showError('Impossible de capturer l\'image');
+        return;
+    }
     
     // Show preview
-    previewImage.src = capturedImageData;
+    capturedPreviewUrl = URL.createObjectURL(capturedImageData);
+    previewImage.src = capturedPreviewUrl;
     cameraContainer.style.display = 'none';
     previewContainer.style.display = 'block';
     
@@ -82,16 +169,26 @@ async function scanBarcode() {
     retryBtn.disabled = true;
     
     try {
-        // Send image to server
-        const response = await fetch(`${API_BASE_URL}/api/detect`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                image: capturedImageData
-            })
-        });
+        // Send image to server, backing off while it sheds load
+        let response = null;
+        for (let attempt = 0; ; attempt++) {
+            response = await fetch(`${API_BASE_URL}/api/detect`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'image/jpeg',
+                    'X-Request-Deadline-Ms': String(REQUEST_DEADLINE_MS)
+                },
+                body: capturedImageData
+            });
+            
+            if (response.status !== 503 || attempt >= MAX_BUSY_RETRIES) {
+                break;
+            }
+            
+            const delay = retryDelay(response.headers.get('Retry-After'), attempt);
+            showMessage(`Serveur occupé, nouvel essai dans ${Math.ceil(delay / 1000)} s...`);
+            await new Promise(resolve => setTimeout(resolve, delay));
+        }
         
         const data = await response.json();
         
@@ -99,6 +196,8 @@ async function scanBarcode() {
             showSuccess(`Code-barres détecté: ${data.barcode}`);
         } else if (response.ok && !data.success) {
             showWarning(data.message || 'Aucun code-barres détecté');
+        } else if (response.status === 503) {
+            showError('Serveur surchargé, veuillez réessayer dans quelques instants');
         } else {
             showError(data.error || 'Erreur lors de l\'analyse');
         }
@@ -112,6 +211,19 @@ async function scanBarcode() {
     }
 }
 
+// Delay before retrying a 503, from Retry-After (seconds or HTTP date)
+// with jitter so clients turned away together do not return together
+function retryDelay(retryAfter, attempt) {
+    let seconds = Number(retryAfter);
+    if (retryAfter && isNaN(seconds)) {
+        seconds = (Date.parse(retryAfter) - Date.now()) / 1000;
+    }
+    if (!retryAfter || isNaN(seconds) || seconds < 0) {
+        seconds = 2 ** attempt;
+    }
+    return Math.round(seconds * 1000 * (1 + Math.random() * 0.5));
+}
+
 // Reset to camera view
 function retry() {
     // Show camera again
@@ -125,6 +237,10 @@ function retry() {
     
     // Clear captured data
     capturedImageData = null;
+    if (capturedPreviewUrl) {
+        URL.revokeObjectURL(capturedPreviewUrl);
+        capturedPreviewUrl = null;
+    }
     
     // Reset result
     showMessage('Pointez la caméra vers un code-barres');
@@ -170,6 +286,12 @@ async function checkServerHealth() {
         if (!data.model_loaded) {
             console.warn('Warning: Model not loaded on server');
         }
+        
+        if (data.model_input_size) {
+            const [height, width] = data.model_input_size;
+            modelInput = { width: width, height: height };
+            layoutAimBox();
+        }
     } catch (error) {
         console.error('Server health check failed:', error);
     }
@@ -179,6 +301,13 @@ async function checkServerHealth() {
 window.addEventListener('load', () => {
     init();
     checkServerHealth();
+    
+    // Cache the page and its assets for instant and offline loading
+    if ('serviceWorker' in navigator) {
+        navigator.serviceWorker.register('sw.js').catch(error => {
+            console.warn('Service worker registration failed:', error);
+        });
+    }
 });
 
 // Clean up on page unload
@@ -0,0 +1,65 @@
+// PyBar Service Worker
+// Serves the scanner page and its assets from cache, so the page opens
+// instantly and offline. The cache name and the precache list are filled
+// in by static_assets.py; a deployment changing any file changes this
+// script too, which installs the new assets and drops the old cache.
+
+const CACHE_NAME = '__PYBAR_CACHE_NAME__';
+const PRECACHE_URLS = __PYBAR_PRECACHE_URLS__;
+
+// Paths answered from the cache: the page and the hashed assets
+const PAGE_PATHS = [
+    new URL('./', self.location).pathname,
+    new URL('./index.html', self.location).pathname
+];
+const ASSET_PATHS = new Set(PRECACHE_URLS.map(url => new URL(url, self.location).pathname));
+
+self.addEventListener('install', event => {
+    event.waitUntil(
+        caches.open(CACHE_NAME)
+            .then(cache => cache.addAll(PRECACHE_URLS))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil(
+        caches.keys()
+            .then(names => Promise.all(names
+                .filter(name => name.startsWith('pybar-') && name !== CACHE_NAME)
+                .map(name => caches.delete(name))))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    const url = new URL(request.url);
+    
+    // API calls and other origins always go to the network
+    if (request.method !== 'GET' || url.origin !== self.location.origin) {
+        return;
+    }
+    
+    if (request.mode === 'navigate' && PAGE_PATHS.includes(url.pathname)) {
+        // Stale-while-revalidate: show the cached page at once and refresh
+        // the cache from the network for the next visit
+        event.respondWith(caches.open(CACHE_NAME).then(async cache => {
+            const cached = await cache.match('./');
+            const network = fetch(request).then(response => {
+                if (response.ok) {
+                    cache.put('./', response.clone());
+                }
+                return response;
+            });
+            if (cached) {
+                event.waitUntil(network.catch(() => {}));
+                return cached;
+            }
+            return network;
+        }));
+    } else if (ASSET_PATHS.has(url.pathname)) {
+        // Hashed assets never change: cache first
+        event.respondWith(caches.match(request).then(cached => cached || fetch(request)));
+    }
+});
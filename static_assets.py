@@ -0,0 +1,202 @@
+"""
+Static assets of the web app, prepared once for cheap serving
+Gives scripts, stylesheets and images content-hashed names, rewrites
+index.html to reference them, fills in the service worker's precache list
+and precompresses every text file with gzip (and brotli when the brotli
+package is installed). The server then answers asset requests from memory
+with long-lived cache headers and ETags, or a front-end web server serves
+the built files directly.
+
+Usage:
+    python static_assets.py --output static_build
+"""
+
+import os
+import re
+import gzip
+import json
+import hashlib
+import argparse
+import mimetypes
+
+# Served under their own names: the entry page, and the service worker whose
+# URL must not change between deployments
+ENTRY_PAGE = 'index.html'
+SERVICE_WORKER = 'sw.js'
+
+# Placeholders of the service worker filled in at build time
+CACHE_NAME_PLACEHOLDER = '__PYBAR_CACHE_NAME__'
+PRECACHE_PLACEHOLDER = '__PYBAR_PRECACHE_URLS__'
+
+# Hashed names never change content, everything else is revalidated with its ETag
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+# Only these are worth compressing; images are compressed already
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json',
+                      'image/svg+xml')
+
+def content_hash(data, length=8):
+    """Short SHA-256 hex digest of some bytes"""
+    return hashlib.sha256(data).hexdigest()[:length]
+
+def hashed_name(name, data):
+    """File name with its content hash, e.g. app.js -> app.1f2e3d4c.js"""
+    stem, extension = os.path.splitext(name)
+    return f"{stem}.{content_hash(data)}{extension}"
+
+def compress(data):
+    """
+    Precompress a file
+    
+    Args:
+        data: File contents
+    
+    Returns:
+        Dictionary of content coding ('br', 'gzip') to compressed bytes,
+        with only the codings that make the file smaller
+    """
+    encodings = {}
+    try:
+        import brotli
+        encodings['br'] = brotli.compress(data, quality=11)
+    except ImportError:
+        pass
+    # mtime=0 keeps the output, and so its ETag, the same across builds
+    encodings['gzip'] = gzip.compress(data, compresslevel=9, mtime=0)
+    return {coding: body for coding, body in encodings.items() if len(body) < len(data)}
+
+class Asset:
+    """One servable file with its precompressed variants"""
+    
+    def __init__(self, name, body, cache_control, encodings=None):
+        """
+        Initialize the asset
+        
+        Args:
+            name: File name, used for the content type
+            body: File contents
+            cache_control: Cache-Control header value
+            encodings: Content coding to compressed body (default: computed
+                for compressible types)
+        """
+        self.name = name
+        self.body = body
+        self.cache_control = cache_control
+        self.content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        if encodings is None:
+            encodings = compress(body) if self.content_type.startswith(COMPRESSIBLE_TYPES) else {}
+        self.encodings = encodings
+        self.etag = content_hash(body, 16)
+    
+    def select(self, accept_encodings):
+        """
+        Pick the variant for a request
+        
+        Args:
+            accept_encodings: werkzeug Accept of the Accept-Encoding header
+        
+        Returns:
+            Tuple of (content coding or None, body, ETag); every coding has
+            its own strong ETag
+        """
+        for coding in ('br', 'gzip'):
+            if coding in self.encodings and accept_encodings.quality(coding) > 0:
+                return coding, self.encodings[coding], f"{self.etag}-{coding}"
+        return None, self.body, self.etag
+
+def build_assets(source_dir, output_dir=None):
+    """
+    Prepare the web app's static files for serving
+    
+    Args:
+        source_dir: Directory of index.html, sw.js and the other assets
+        output_dir: Directory receiving the built files and their .gz/.br
+            variants for a front-end web server (optional)
+    
+    Returns:
+        Dictionary of URL path (e.g. '/app.1f2e3d4c.js') to Asset; '/' is
+        the entry page
+    """
+    names = sorted(os.path.relpath(os.path.join(root, name), source_dir).replace(os.sep, '/')
+                   for root, _, files in os.walk(source_dir) for name in files)
+    contents = {}
+    for name in names:
+        with open(os.path.join(source_dir, name), 'rb') as f:
+            contents[name] = f.read()
+    
+    assets = {}
+    hashed = {}
+    for name in names:
+        if name in (ENTRY_PAGE, SERVICE_WORKER):
+            continue
+        hashed[name] = hashed_name(name, contents[name])
+        assets['/' + hashed[name]] = Asset(name, contents[name], IMMUTABLE)
+        # The plain name stays available for pages cached before a deployment
+        assets['/' + name] = Asset(name, contents[name], REVALIDATE,
+                                   assets['/' + hashed[name]].encodings)
+    
+    if ENTRY_PAGE in contents:
+        page = contents[ENTRY_PAGE].decode('utf-8')
+        for name, new_name in hashed.items():
+            page = re.sub(r'''((?:src|href)=["'])(?:\./)?''' + re.escape(name) + r'''(["'])''',
+                          lambda match: match.group(1) + new_name + match.group(2), page)
+        assets['/'] = assets['/' + ENTRY_PAGE] = Asset(ENTRY_PAGE, page.encode('utf-8'),
+                                                       REVALIDATE)
+    
+    if SERVICE_WORKER in contents:
+        # A new cache for every deployment that changes the page or an asset
+        version = content_hash(json.dumps([assets['/'].etag if '/' in assets else None,
+                                           sorted(hashed.values())]).encode('utf-8'))
+        precache = ['./'] + [f'./{name}' for name in sorted(hashed.values())]
+        worker = (contents[SERVICE_WORKER].decode('utf-8')
+                  .replace(CACHE_NAME_PLACEHOLDER, f'pybar-{version}')
+                  .replace(PRECACHE_PLACEHOLDER, json.dumps(precache)))
+        assets['/' + SERVICE_WORKER] = Asset(SERVICE_WORKER, worker.encode('utf-8'), REVALIDATE)
+    
+    if output_dir:
+        write_assets(assets, output_dir, hashed)
+    return assets
+
+def write_assets(assets, output_dir, hashed):
+    """
+    Write built assets, their compressed variants and a manifest
+    
+    Args:
+        assets: Dictionary returned by build_assets
+        output_dir: Destination directory
+        hashed: Original to hashed file name
+    """
+    for path, asset in assets.items():
+        if path == '/':
+            continue
+        target = os.path.join(output_dir, *path.lstrip('/').split('/'))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        variants = [(target, asset.body)]
+        variants += [(f"{target}.{'gz' if coding == 'gzip' else coding}", body)
+                     for coding, body in asset.encodings.items()]
+        for variant, body in variants:
+            # Replaced atomically, so a web server never sends half a file
+            tmp_path = variant + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, variant)
+    
+    with open(os.path.join(output_dir, 'manifest.json'), 'w') as f:
+        json.dump(hashed, f, indent=2)
+
+def main():
+    """Build the static assets from the command line"""
+    parser = argparse.ArgumentParser(description="Build the web app's static assets")
+    parser.add_argument('--source', default='static', help="Static source directory")
+    parser.add_argument('--output', default='static_build', help="Output directory")
+    args = parser.parse_args()
+    
+    assets = build_assets(args.source, args.output)
+    for path, asset in sorted(assets.items()):
+        sizes = ', '.join(f"{coding} {len(body)}" for coding, body in asset.encodings.items())
+        print(f"{path:<28} {len(asset.body):>7} bytes" + (f" ({sizes})" if sizes else ""))
+    print(f"Assets written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""
+Test script for admission control of the detection server
+Tests the AdmissionController and drives concurrent requests through the
+Flask app to check load shedding
+"""
+
+import json
+import time
+import threading
+from flask import jsonify
+from admission import AdmissionController, AdmissionRejected
+from barcode_detector import BarcodeDetector
+import server
+
+def test_admission_control():
+    """Test load shedding of the admission controller"""
+    print("Testing admission control...")
+    
+    controller = AdmissionController(max_inflight=1, max_queue=1)
+    release = threading.Event()
+    admitted = threading.Event()
+    
+    def hold_slot():
+        with controller.admit(time.monotonic() + 10):
+            admitted.set()
+            release.wait(10)
+    
+    holder = threading.Thread(target=hold_slot)
+    holder.start()
+    admitted.wait(10)
+    
+    # A waiter fills the queue, so the next request is overloaded
+    waiter = threading.Thread(target=hold_slot)
+    waiter.start()
+    while controller.waiting == 0:
+        time.sleep(0.01)
+    try:
+        with controller.admit(time.monotonic() + 10):
+            raise AssertionError("Request admitted past the queue limit")
+    except AdmissionRejected as rejection:
+        assert rejection.reason == 'overloaded', f"Unexpected reason {rejection.reason}"
+        assert rejection.retry_after >= 1, "Retry-After must be at least one second"
+    
+    release.set()
+    holder.join()
+    waiter.join()
+    assert controller.inflight == 0 and controller.waiting == 0, "Slots not released"
+    
+    # A request whose deadline passes while waiting is shed
+    controller = AdmissionController(max_inflight=1, max_queue=4)
+    release.clear()
+    admitted.clear()
+    holder = threading.Thread(target=hold_slot)
+    holder.start()
+    admitted.wait(10)
+    controller._service_time = 0.01
+    try:
+        with controller.admit(time.monotonic() + 0.1):
+            raise AssertionError("Request admitted after its deadline")
+    except AdmissionRejected as rejection:
+        assert rejection.reason == 'deadline_exceeded', f"Unexpected reason {rejection.reason}"
+    release.set()
+    holder.join()
+    
+    print("✓ Admission control test passed!\n")
+
+def test_admission_limits():
+    """Test that the admission limits leave a request thread free"""
+    print("Testing admission limits...")
+    
+    for threads in (2, 4, 8, 16):
+        max_inflight, max_queue = server.admission_limits(threads)
+        assert max_inflight >= 1, "No request may run"
+        assert max_inflight + max_queue < threads, \
+            f"{max_inflight} in flight and {max_queue} queued do not fit in {threads} threads"
+    
+    print("✓ Admission limits test passed!\n")
+
+def test_server_sheds_overload():
+    """Test that requests past the admission limits get a 503 with Retry-After"""
+    print("Testing overload shedding through the app...")
+    
+    release = threading.Event()
+    
+    def blocked_detection(image_data, deadline):
+        release.wait(10)
+        return jsonify({'success': True}), 'detected'
+    
+    original_admission, original_detection = server.admission, server.run_detection
+    server.set_request_threads(4)
+    server.run_detection = blocked_detection
+    controller = server.admission
+    limit = controller.max_inflight + controller.max_queue
+    statuses = []
+    
+    def post():
+        response = server.app.test_client().post('/api/detect', json={'image': 'aGVsbG8='})
+        statuses.append(response.status_code)
+    
+    try:
+        # Requests run and wait up to both limits
+        clients = [threading.Thread(target=post) for _ in range(limit)]
+        for client in clients:
+            client.start()
+        wait_until = time.monotonic() + 10
+        while controller.inflight + controller.waiting < limit and time.monotonic() < wait_until:
+            time.sleep(0.01)
+        assert controller.waiting == controller.max_queue >= 1, "Limits not filled"
+        
+        # More concurrent requests than the limits are shed right away
+        for _ in range(3):
+            response = server.app.test_client().post('/api/detect', json={'image': 'aGVsbG8='})
+            assert response.status_code == 503, f"Expected 503, got {response.status_code}"
+            assert int(response.headers['Retry-After']) >= 1, "Retry-After missing"
+            assert response.get_json()['reason'] == 'overloaded', "Unexpected reason"
+        
+        release.set()
+        for client in clients:
+            client.join()
+        assert statuses == [200] * limit, f"Admitted requests failed: {statuses}"
+    finally:
+        release.set()
+        server.admission, server.run_detection = original_admission, original_detection
+    
+    print("✓ Overload shedding test passed!\n")
+
+def test_batch_gives_up_when_busy():
+    """Test that a bulk upload ends with done: false when no slot frees up"""
+    print("Testing bulk upload under overload...")
+    
+    body = b'{"id": "broken", "image": "aGVsbG8="}\n'
+    original = (server.detector, server.admission, server.BATCH_WAIT_MS)
+    server.detector = BarcodeDetector()
+    server.admission = AdmissionController(max_inflight=1, max_queue=0)
+    server.BATCH_WAIT_MS = 200
+    release = threading.Event()
+    admitted = threading.Event()
+    
+    def hold_slot():
+        with server.admission.admit(time.monotonic() + 10):
+            admitted.set()
+            release.wait(10)
+    
+    def post_batch():
+        response = server.app.test_client().post('/api/detect/batch', data=body,
+                                                 content_type='application/x-ndjson')
+        return [json.loads(line) for line in response.get_data().splitlines()]
+    
+    holder = threading.Thread(target=hold_slot)
+    try:
+        # Undecodable images get a fixed message, not the exception text
+        lines = post_batch()
+        assert lines[0]['error'] == 'cannot decode image', f"Unexpected error {lines[0]}"
+        assert lines[-1]['done'] is True, "Summary not done"
+        
+        holder.start()
+        admitted.wait(10)
+        start = time.monotonic()
+        lines = post_batch()
+        assert time.monotonic() - start < 5, "Bulk upload waited past PYBAR_BATCH_WAIT_MS"
+        assert lines == [lines[-1]] and lines[-1]['done'] is False, f"Unexpected stream {lines}"
+        assert lines[-1]['retry_after'] >= 1, "Retry-After missing from the summary"
+    finally:
+        release.set()
+        if holder.ident is not None:
+            holder.join()
+        server.detector, server.admission, server.BATCH_WAIT_MS = original
+    
+    print("✓ Bulk upload overload test passed!\n")
+
+def test_request_start_header():
+    """Test that proxy queue time stamped in X-Request-Start counts against the deadline"""
+    print("Testing X-Request-Start...")
+    
+    for stamp in ('t=%.3f', '%d'):
+        started = time.time() - 2.0
+        value = stamp % (started if stamp.startswith('t=') else started * 1000)
+        with server.app.test_request_context(headers={'X-Request-Start': value}):
+            queued = time.monotonic() - server.request_arrival()
+        assert 1.9 < queued < 2.5, f"Queue time {queued:.2f}s read from {value}"
+    
+    with server.app.test_request_context(headers={'X-Request-Start': 'garbage'}):
+        assert time.monotonic() - server.request_arrival() < 0.1, "Bad header not ignored"
+    
+    print("✓ X-Request-Start test passed!\n")
+
+def run_all_tests():
+    """Run all admission tests"""
+    print("=" * 60)
+    print("PyBar Admission Control Test Suite")
+    print("=" * 60)
+    print()
+    
+    try:
+        test_admission_control()
+        test_admission_limits()
+        test_server_sheds_overload()
+        test_batch_gives_up_when_busy()
+        test_request_start_header()
+        
+        print("=" * 60)
+        print("All tests completed successfully! ✓")
+        print("=" * 60)
+    
+    except Exception as e:
+        print(f"\n✗ Test failed with error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    
+    return True
+
+if __name__ == '__main__':
+    success = run_all_tests()
+    exit(0 if success else 1)
@@ -4,11 +4,26 @@ Tests the BarcodeDetector class with synthetic images
 """
 
 import torch
-from barcode_detector import BarcodeDetector, BarcodeNet
-from PIL import Image, ImageDraw
+from barcode_detector import (BarcodeDetector, BarcodeNet, FrameQualityGate, ImageTooLarge,
+                              ImageTransform, ResNetBackbone, decode_checksum, decode_image,
+                              get_normalization, is_valid_checksum, load_model, save_model)
+from PIL import Image, ImageDraw, ImageFilter
 import numpy as np
 import tempfile
 import os
+import json
+import time
+import io
+import base64
+import tarfile
+import zipfile
+import subprocess
+import sys
+from batch_inputs import BatchInputError, UploadTooLarge, iter_chunks, iter_uploads
+from request_profiler import RequestProfiler
+from scan_images import iter_source, scan
+import barcode_detector
+from model_reloader import ModelReloader, file_sha256
 
 def create_test_barcode_image(barcode_number, size=(224, 224)):
     """Create a simple test barcode image"""
@@ -59,6 +74,52 @@ def test_barcode_net():
     
     print("✓ BarcodeNet architecture test passed!\n")
 
+def test_grayscale_input_mode():
+    """Test the non-square grayscale input geometry round trip"""
+    print("Testing grayscale input mode...")
+    
+    model = BarcodeNet(in_channels=1, input_size=(96, 320))
+    presence_logits, digit_logits = model(torch.randn(2, 1, 96, 320))
+    assert digit_logits.shape == (2, 13, 11), "Digit output shape mismatch"
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_path = os.path.join(tmp_dir, 'model.pth')
+        save_model(model, model_path)
+        detector = BarcodeDetector(model_path=model_path)
+    
+    assert detector.model.in_channels == 1, "Input channels not restored"
+    assert detector.model.input_size == (96, 320), "Input size not restored"
+    
+    image_tensor = detector.transform(create_test_barcode_image("5901234123457"))
+    assert image_tensor.shape == (1, 96, 320), f"Unexpected input shape {image_tensor.shape}"
+    
+    print("✓ Grayscale input mode test passed!\n")
+
+def test_compact_model():
+    """Test that a compact student architecture loads transparently"""
+    print("Testing compact BarcodeNet variant...")
+    
+    model = BarcodeNet(layers=(1, 1, 1, 1), width=32, feature_dim=256)
+    presence_logits, digit_logits = model(torch.randn(2, 3, 224, 224))
+    assert presence_logits.shape == (2, 2), "Presence output shape mismatch"
+    assert digit_logits.shape == (2, 13, 11), "Digit output shape mismatch"
+    
+    num_params = sum(p.numel() for p in model.parameters())
+    assert num_params < sum(p.numel() for p in BarcodeNet().parameters()) / 4, \
+        "Compact model is not smaller"
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_path = os.path.join(tmp_dir, 'model.pth')
+        save_model(model, model_path)
+        detector = BarcodeDetector(model_path=model_path)
+    
+    assert detector.model.get_config() == model.get_config(), "Architecture not restored"
+    assert torch.equal(detector.model.presence_head.weight.cpu(), model.presence_head.weight), \
+        "Weights not restored"
+    
+    print(f"Parameters: {num_params}")
+    print("✓ Compact model test passed!\n")
+
 def test_detector_initialization():
     """Test BarcodeDetector initialization"""
     print("Testing BarcodeDetector initialization...")
@@ -163,6 +224,565 @@ def test_digit_decoding():
     
     print("✓ Digit decoding test passed!\n")
 
+def make_digit_logits(barcode, confidence=10.0):
+    """Create digit logits that predict the given barcode number"""
+    digit_logits = torch.zeros(1, 13, 11)
+    for i, digit in enumerate(barcode):
+        digit_logits[0, i, int(digit)] = confidence
+    digit_logits[0, len(barcode):, 10] = confidence
+    return digit_logits
+
+def test_checksum_validation():
+    """Test EAN-13, EAN-8 and UPC-A check digit validation"""
+    print("Testing checksum validation...")
+    
+    assert is_valid_checksum("5901234123457"), "Valid EAN-13 rejected"
+    assert is_valid_checksum("96385074"), "Valid EAN-8 rejected"
+    assert is_valid_checksum("036000291452"), "Valid UPC-A rejected"
+    assert not is_valid_checksum("5901234123458"), "Invalid EAN-13 accepted"
+    assert not is_valid_checksum("1234567890"), "Unsupported length accepted"
+    assert not is_valid_checksum(None), "Empty barcode accepted"
+    
+    print("✓ Checksum validation test passed!\n")
+
+def test_checksum_decoding():
+    """Test checksum-constrained decoding recovers a near-miss reading"""
+    print("Testing checksum decoding...")
+    
+    # Greedy reading has one wrong digit, the correct one is the runner-up
+    digit_logits = make_digit_logits("5901234123457")
+    digit_logits[0, 4, 2] = 10.0
+    digit_logits[0, 4, 7] = 11.0
+    
+    detector = BarcodeDetector(decode_mode='checksum')
+    greedy = detector._decode_digits(digit_logits)
+    barcode, confidence = detector._decode_digits_checksum(digit_logits)
+    
+    print(f"Greedy: {greedy}")
+    print(f"Checksum: {barcode} (confidence {confidence:.3f})")
+    
+    assert greedy == "5901734123457", f"Unexpected greedy result {greedy}"
+    assert barcode == "5901234123457", f"Checksum decoding mismatch: {barcode}"
+    assert 0.0 < confidence < 1.0, f"Confidence out of range: {confidence}"
+    assert detector._decode(digit_logits) == barcode
+    
+    # Batched decoding picks the right length per element
+    batch = torch.cat([make_digit_logits("96385074"), make_digit_logits("036000291452")])
+    results = decode_checksum(batch)
+    assert [r[0] for r in results] == ["96385074", "036000291452"], f"Batch mismatch: {results}"
+    
+    print("✓ Checksum decoding test passed!\n")
+
+def test_frame_quality_gate():
+    """Test the pre-inference frame quality gate"""
+    print("Testing frame quality gate...")
+    
+    gate = FrameQualityGate()
+    sharp = create_test_barcode_image("5901234123457", size=(640, 480))
+    blurry = sharp.filter(ImageFilter.GaussianBlur(12))
+    dark = Image.new('RGB', (640, 480), color=(5, 5, 5))
+    
+    assert gate.check(blurry) == FrameQualityGate.BLURRY, "Blurry frame accepted"
+    assert gate.check(dark) == FrameQualityGate.UNDEREXPOSED, "Dark frame accepted"
+    assert gate.check(sharp) is None, "Sharp frame rejected"
+    assert gate.check(sharp) == FrameQualityGate.UNCHANGED, "Unchanged frame accepted"
+    
+    # The detector skips inference and reports the reason
+    detector = BarcodeDetector(frame_gate=FrameQualityGate())
+    image_bytes = np.array(blurry).tobytes()
+    assert detector.detect_barcode(image_bytes, blurry.size) is None
+    assert detector.last_rejection == FrameQualityGate.BLURRY
+    
+    print("✓ Frame quality gate test passed!\n")
+
+def test_request_profiler():
+    """Test sampled request profiling and trace rotation"""
+    print("Testing request profiler...")
+    
+    model = BarcodeNet(layers=(1, 1, 1, 1), width=16)
+    model.eval()
+    images = torch.randn(1, 3, 64, 64)
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        profiler = RequestProfiler(trace_dir=tmp_dir, sample_rate=0.0, max_traces=2)
+        
+        # Without a sample rate only requested runs are profiled
+        with profiler.profile() as trace_path:
+            model(images)
+        assert trace_path is None, "Unrequested run was profiled"
+        
+        profiler.request(3)
+        for _ in range(3):
+            with profiler.profile('detect') as trace_path, torch.no_grad():
+                model(images)
+            assert trace_path is not None, "Requested run was not profiled"
+        
+        traces = profiler.traces()
+        assert profiler.pending() == 0, "Pending requests not consumed"
+        assert len(traces) == 2, f"Expected 2 traces after rotation, found {len(traces)}"
+        assert len(os.listdir(tmp_dir)) == 4, "Operator summaries not rotated"
+        
+        with open(os.path.join(tmp_dir, traces[0])) as f:
+            events = json.load(f)['traceEvents']
+        assert any('conv' in event.get('name', '') for event in events), \
+            "No convolution operators in trace"
+    
+    print("✓ Request profiler test passed!\n")
+
+def test_execution_backends():
+    """Test that the compiled backends reproduce the eager model"""
+    print("Testing execution backends...")
+    
+    model = BarcodeNet(in_channels=1, input_size=(48, 160), layers=(1, 1, 1, 1), width=16)
+    model.eval()
+    images = torch.randn(3, 1, 48, 160)
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_path = os.path.join(tmp_dir, 'model.pth')
+        save_model(model, model_path)
+        
+        with torch.no_grad():
+            expected = model(images)[1]
+            for backend in ('channels_last', 'torchscript', 'quantized'):
+                detector = BarcodeDetector(model_path=model_path, backend=backend)
+                _, digit_logits = detector.runner(images.to(detector.device))
+                assert digit_logits.shape == (3, 13, 11), f"{backend} output shape mismatch"
+                if backend != 'quantized':
+                    assert torch.allclose(digit_logits.cpu(), expected, atol=1e-4), \
+                        f"{backend} output differs from eager"
+    
+    print("✓ Execution backends test passed!\n")
+
+def test_batch_detection():
+    """Test bulk upload parsing and batched detection"""
+    print("Testing batch detection...")
+    
+    barcodes = ["1234567890123", "9876543210", "5901234123457"]
+    blobs = []
+    for barcode in barcodes:
+        buffer = io.BytesIO()
+        create_test_barcode_image(barcode).save(buffer, format='PNG')
+        blobs.append(buffer.getvalue())
+    names = [f"{barcode}.png" for barcode in barcodes]
+    
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, 'w') as archive:
+        for name, blob in zip(names, blobs):
+            archive.writestr(name, blob)
+        archive.writestr('notes.txt', 'skipped')
+    
+    tar_buffer = io.BytesIO()
+    with tarfile.open(fileobj=tar_buffer, mode='w:gz') as archive:
+        for name, blob in zip(names, blobs):
+            info = tarfile.TarInfo(name)
+            info.size = len(blob)
+            archive.addfile(info, io.BytesIO(blob))
+    
+    ndjson = b''.join(json.dumps({'id': name, 'image': base64_image}).encode() + b'\n'
+                      for name, base64_image in
+                      zip(names, (base64.b64encode(blob).decode() for blob in blobs)))
+    
+    multipart = b''.join(b'--XyZ\r\nContent-Disposition: form-data; name="images"; '
+                         + f'filename="{name}"'.encode() + b'\r\n'
+                         + b'Content-Type: image/png\r\n\r\n' + blob + b'\r\n'
+                         for name, blob in zip(names, blobs)) + b'--XyZ--\r\n'
+    
+    bodies = [
+        ('application/zip', zip_buffer.getvalue(), None),
+        ('application/gzip', tar_buffer.getvalue(), None),
+        ('application/x-ndjson', ndjson, None),
+        ('multipart/form-data', multipart, 'XyZ')
+    ]
+    for content_type, body, boundary in bodies:
+        uploads = list(iter_uploads(content_type, io.BytesIO(body), 1 << 20, boundary=boundary))
+        assert uploads == list(zip(names, blobs)), f"{content_type} upload parsed incorrectly"
+    
+    # Oversized images are reported, not read
+    uploads = list(iter_uploads('application/zip', io.BytesIO(zip_buffer.getvalue()), 100))
+    assert all(isinstance(data, BatchInputError) for _, data in uploads), "Size limit ignored"
+    
+    # Zip archives are spooled, up to a total size checked before iterating
+    try:
+        iter_uploads('application/zip', io.BytesIO(zip_buffer.getvalue()), 1 << 20,
+                     max_archive_bytes=len(zip_buffer.getvalue()) - 1)
+        raise AssertionError("Oversized archive accepted")
+    except UploadTooLarge:
+        pass
+    
+    try:
+        iter_uploads('text/plain', io.BytesIO(b''), 100)
+        raise AssertionError("Unsupported content type accepted")
+    except BatchInputError:
+        pass
+    
+    assert [len(chunk) for chunk in iter_chunks(range(10), 4)] == [4, 4, 2], "Bad chunking"
+    
+    # One batched forward pass gives the same readings as single images
+    detector = BarcodeDetector()
+    images = [Image.open(io.BytesIO(blob)).convert('RGB') for blob in blobs]
+    timings = {}
+    batched = detector.detect_images(images, timings)
+    assert batched == [detector.detect_image(image) for image in images], \
+        "Batched detection differs from single-image detection"
+    assert set(timings) == {'preprocess', 'forward', 'decode'}, "Missing stage timings"
+    
+    print("✓ Batch detection test passed!\n")
+
+def test_scan_images():
+    """Test the offline scanner and its resume file"""
+    print("Testing offline scanner...")
+    
+    model = BarcodeNet(layers=(1, 1, 1, 1), width=16)
+    barcodes = ["1234567890123", "9876543210", "5901234123457", "4006381333931"]
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_path = os.path.join(tmp_dir, 'model.pth')
+        save_model(model, model_path)
+        image_dir = os.path.join(tmp_dir, 'images')
+        os.makedirs(os.path.join(image_dir, 'sub'))
+        for idx, barcode in enumerate(barcodes):
+            folder = image_dir if idx % 2 else os.path.join(image_dir, 'sub')
+            create_test_barcode_image(barcode).save(os.path.join(folder, f"{barcode}.png"))
+        with open(os.path.join(image_dir, 'broken.jpg'), 'wb') as f:
+            f.write(b'not an image')
+        
+        output = os.path.join(tmp_dir, 'results.jsonl')
+        stats = scan(image_dir, output, model_path=model_path, batch_size=2, workers=0)
+        assert stats['scanned'] == 5 and stats['failed'] == 1, f"Unexpected stats {stats}"
+        
+        with open(output) as f:
+            results = [json.loads(line) for line in f]
+        assert len(results) == 5, "Missing results"
+        assert [r['status'] for r in results].count('error') == 1, "Broken image not reported"
+        
+        # A second run over the same corpus only skips
+        stats = scan(image_dir, output, model_path=model_path, batch_size=2, workers=0)
+        assert stats['scanned'] == 0 and stats['skipped'] == 5, "Resume file ignored"
+        with open(output) as f:
+            assert len(f.readlines()) == 5, "Resumed run rewrote results"
+        
+        # Finished archive members are skipped before they are read
+        archive_path = os.path.join(tmp_dir, 'images.zip')
+        with zipfile.ZipFile(archive_path, 'w') as archive:
+            for barcode in barcodes:
+                archive.writestr(f"{barcode}.png", b'')
+        reads = []
+        original_read = zipfile.ZipFile.read
+        zipfile.ZipFile.read = lambda archive, member: reads.append(member) or b''
+        try:
+            names = [name for name, _ in iter_source(archive_path, skip={"1234567890123.png"})]
+        finally:
+            zipfile.ZipFile.read = original_read
+        assert "1234567890123.png" not in names and len(names) == 3, f"Unexpected {names}"
+        assert len(reads) == 3, "Finished archive member read"
+        
+        # Scanning with a missing model fails instead of using an untrained one
+        try:
+            scan(image_dir, os.path.join(tmp_dir, 'missing.jsonl'),
+                 model_path=os.path.join(tmp_dir, 'missing.pth'), workers=0)
+            assert False, "Missing model accepted"
+        except FileNotFoundError:
+            pass
+    
+    print("✓ Offline scanner test passed!\n")
+
+def _reading_model(seed):
+    """Tiny model that always reports a barcode of 13 digits"""
+    torch.manual_seed(seed)
+    model = BarcodeNet(layers=(1, 1, 1, 1), width=16)
+    with torch.no_grad():
+        model.presence_head.bias.copy_(torch.tensor([-100.0, 100.0]))
+        for head in model.digit_heads:
+            head.bias[10] = -100.0
+    return model
+
+def test_model_reload():
+    """Test canary-validated model reloads and the file watcher"""
+    print("Testing model hot reload...")
+    
+    images = [create_test_barcode_image(barcode)
+              for barcode in ("1234567890123", "9876543210", "5901234123457")]
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_path = os.path.join(tmp_dir, 'model.pth')
+        save_model(_reading_model(0), model_path)
+        
+        def load(path):
+            return BarcodeDetector(model_path=path, strict=True)
+        
+        swaps = []
+        live = load(model_path)
+        # The canary labels are what the live model reads
+        labels = live.detect_images(images)
+        reloader = ModelReloader(model_path, load, lambda detector, info: swaps.append(info),
+                                 images, labels, poll_interval=0)
+        reloader.activate(live, file_sha256(model_path))
+        
+        assert reloader.reload()['status'] == 'unchanged', "Unchanged file reloaded"
+        
+        # A model reading the canaries differently is rejected
+        save_model(_reading_model(1), model_path)
+        outcome = reloader.reload()
+        assert outcome['status'] == 'rejected', f"Regressed model not rejected: {outcome}"
+        assert reloader.detector is live and len(swaps) == 1, "Rejected model went live"
+        
+        # A file that cannot be loaded keeps the live model
+        with open(model_path, 'wb') as f:
+            f.write(b'truncated')
+        assert reloader.reload()['status'] == 'failed', "Broken model file not reported"
+        assert reloader.detector is live, "Broken model went live"
+        
+        save_model(_reading_model(0), model_path)
+        outcome = reloader.reload(force=True)
+        assert outcome['status'] == 'swapped', f"Valid model not swapped: {outcome}"
+        assert swaps[-1]['sha256'] == file_sha256(model_path), "Swapped version not reported"
+        
+        # The watcher picks up a new file once it stops changing
+        watcher = ModelReloader(model_path, load, lambda detector, info: swaps.append(info),
+                                poll_interval=0.05)
+        watcher.activate(live, file_sha256(model_path))
+        watcher.start()
+        try:
+            save_model(_reading_model(2), model_path)
+            os.utime(model_path, ns=(0, 0))
+            expected = file_sha256(model_path)
+            deadline = time.time() + 30
+            while watcher.info['sha256'] != expected and time.time() < deadline:
+                time.sleep(0.05)
+        finally:
+            watcher.stop()
+        assert watcher.info['sha256'] == expected, "Watcher did not reload the changed file"
+    
+    print("✓ Model hot reload test passed!\n")
+
+def test_flat_model_format():
+    """Test the memory-mapped safetensors model format"""
+    print("Testing flat model format...")
+    
+    model = BarcodeNet(in_channels=1, input_size=(48, 160), layers=(1, 1, 1, 1), width=16,
+                       block_widths=[8, 16, 24, 64])
+    model.eval()
+    images = torch.randn(2, 1, 48, 160)
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'model.safetensors')
+        save_model(model, path)
+        assert os.listdir(tmp_dir) == ['model.safetensors'], "Temporary file left behind"
+        
+        # The layout is safetensors: header length, JSON header, contiguous data
+        with open(path, 'rb') as f:
+            header_size = int.from_bytes(f.read(8), 'little')
+            header = json.loads(f.read(header_size))
+        assert header_size % 8 == 0, "Data section not aligned"
+        metadata = header.pop('__metadata__')
+        assert json.loads(metadata['config']) == model.get_config(), "Config not stored"
+        ranges = sorted(entry['data_offsets'] for entry in header.values())
+        assert ranges[0][0] == 0 and all(a[1] == b[0] for a, b in zip(ranges, ranges[1:])), \
+            "Tensor data not contiguous"
+        assert os.path.getsize(path) == 8 + header_size + ranges[-1][1], "Unexpected file size"
+        
+        loaded = load_model(path)
+        loaded.eval()
+        assert loaded.get_config() == model.get_config(), "Architecture not restored"
+        assert not any(t.is_meta for t in list(loaded.parameters()) + list(loaded.buffers())), \
+            "Weights left on the meta device"
+        with torch.no_grad():
+            for expected, actual in zip(model(images), loaded(images)):
+                assert torch.equal(expected, actual), "Flat model output differs"
+        
+        detector = BarcodeDetector(model_path=path, strict=True)
+        assert detector.model.input_size == (48, 160), "Detector did not load the flat model"
+    
+    print("✓ Flat model format test passed!\n")
+
+def test_draft_decoding():
+    """Test reduced-resolution JPEG decoding and the pixel limit"""
+    print("Testing draft decoding...")
+    
+    photo = Image.new('RGB', (2000, 1600), 'white')
+    ImageDraw.Draw(photo).rectangle([400, 400, 1600, 1200], fill='black')
+    jpeg = io.BytesIO()
+    photo.save(jpeg, format='JPEG')
+    
+    # Draft scaling stops at the smallest size still covering the input
+    image = decode_image(io.BytesIO(jpeg.getvalue()), target_size=(128, 256))
+    assert image.mode == 'RGB', "Image not decoded to RGB"
+    assert image.size == (500, 400), f"Unexpected draft size {image.size}"
+    image = decode_image(io.BytesIO(jpeg.getvalue()), target_size=(128, 256), grayscale=True)
+    assert image.mode == 'L', "Image not decoded to grayscale"
+    assert decode_image(io.BytesIO(jpeg.getvalue())).size == (2000, 1600), \
+        "Image scaled without a target size"
+    
+    # The pixel limit applies after draft scaling, and formats without
+    # scaling are rejected from their header
+    image = decode_image(io.BytesIO(jpeg.getvalue()), (128, 256), max_pixels=500 * 400)
+    assert image.size == (500, 400), "Draft-scaled JPEG rejected"
+    png = io.BytesIO()
+    photo.save(png, format='PNG')
+    try:
+        decode_image(io.BytesIO(png.getvalue()), (128, 256), max_pixels=500 * 400)
+        assert False, "Oversized PNG accepted"
+    except ImageTooLarge:
+        pass
+    
+    # PIL's decompression bomb check, which fires while the header is read,
+    # gives the same error
+    bomb_limit = Image.MAX_IMAGE_PIXELS
+    Image.MAX_IMAGE_PIXELS = 1000 * 1000
+    try:
+        decode_image(io.BytesIO(png.getvalue()), (128, 256), max_pixels=10 ** 9)
+        assert False, "Decompression bomb accepted"
+    except ImageTooLarge:
+        pass
+    finally:
+        Image.MAX_IMAGE_PIXELS = bomb_limit
+    
+    detector = BarcodeDetector(model_path='nonexistent.pth')
+    image = detector.open_image(io.BytesIO(jpeg.getvalue()))
+    assert image.size[0] >= detector.model.input_size[1] \
+        and image.size[1] >= detector.model.input_size[0], "Image decoded below input size"
+    
+    print("✓ Draft decoding test passed!\n")
+
+def test_native_backbone():
+    """Test the torchvision-free backbone and preprocessing"""
+    print("Testing native backbone...")
+    
+    # Importing the detector must not load torchvision
+    code = "import sys, barcode_detector; sys.exit('torchvision' in sys.modules)"
+    assert subprocess.run([sys.executable, '-c', code]).returncode == 0, \
+        "barcode_detector imports torchvision"
+    
+    # torchvision is only needed for this comparison, as for training
+    from torchvision.models import resnet18
+    import torchvision.transforms as transforms
+    
+    reference = resnet18()
+    reference.eval()
+    backbone = ResNetBackbone()
+    backbone.eval()
+    assert list(backbone.state_dict()) == list(reference.state_dict()), \
+        "Parameter names differ from torchvision resnet18"
+    backbone.load_state_dict(reference.state_dict())
+    images = torch.randn(2, 3, 96, 128)
+    with torch.no_grad():
+        assert torch.equal(backbone(images), reference(images)), "Backbone output differs"
+    
+    image = Image.fromarray(np.random.default_rng(0).integers(0, 256, (120, 200, 3),
+                                                               dtype=np.uint8))
+    for in_channels, steps in ((3, []), (1, [transforms.Grayscale(num_output_channels=1)])):
+        expected = transforms.Compose(steps + [
+            transforms.Resize((48, 160)),
+            transforms.ToTensor(),
+            transforms.Normalize(*get_normalization(in_channels))
+        ])(image)
+        assert torch.equal(ImageTransform((48, 160), in_channels)(image), expected), \
+            "Preprocessing differs from torchvision"
+    
+    print("✓ Native backbone test passed!\n")
+
+def test_test_time_augmentation():
+    """Test batched test-time augmentation and its early exit"""
+    print("Testing test-time augmentation...")
+    
+    tta = barcode_detector.TestTimeAugmentation(stages=[[(0, 1.0, 0.0, False), (5, 1.2, 0.1, True)],
+                                                        [(0, 0.9, 0.0, False)]])
+    detector = BarcodeDetector(tta=tta)
+    images = torch.stack([detector.transform(Image.new('RGB', (320, 240), color))
+                          for color in ('white', 'gray')])
+    
+    variants = tta.variants(images, tta.stages[0], detector.transform.mean, detector.transform.std)
+    assert variants.shape == (4,) + images.shape[1:], f"Unexpected variants {variants.shape}"
+    assert torch.allclose(variants[0], images[0], atol=1e-4), "Identity variant changed the image"
+    assert torch.allclose(variants[2], images[1], atol=1e-4), "Variants not grouped by image"
+    
+    def logits(barcode, batch_size, unsure=(), presence=5.0):
+        """Presence and digit logits favoring one reading, split between
+        two digits at the unsure positions"""
+        digits = torch.zeros(batch_size, 13, 11)
+        for position in range(13):
+            digit = int(barcode[position]) if position < len(barcode) else 10
+            digits[:, position, digit] = 1.0 if position in unsure else 8.0
+            if position in unsure:
+                digits[:, position, (digit + 1) % 10] = 1.0
+        return torch.tensor([[0.0, presence]] * batch_size), digits
+    
+    # A confident plain pass needs no further forward call
+    calls = []
+    def confident(x):
+        calls.append(len(x))
+        return logits('5901234123457', len(x))
+    detector.runner = confident
+    assert detector.detect_images([Image.new('RGB', (320, 240))]) == ['5901234123457'], \
+        "Confident reading not returned"
+    assert calls == [1], f"Augmentation ran for a confident reading: {calls}"
+    
+    # An unsure plain pass is settled by the first stage, in one batch
+    calls = []
+    def unsure_then_confident(x):
+        calls.append(len(x))
+        return logits('5901234123457', len(x), unsure=(4,) if len(calls) == 1 else ())
+    detector.runner = unsure_then_confident
+    timings = {}
+    result = detector.detect_images([Image.new('RGB', (320, 240))] * 2, timings)
+    assert result == ['5901234123457'] * 2, f"Averaged reading not returned: {result}"
+    assert calls == [2, 4], f"Unexpected forward calls {calls}"
+    assert 'tta' in timings, "Augmentation not timed"
+    
+    # Without a confident reading every stage runs, then the average is
+    # decoded in the configured mode
+    calls = []
+    def never_confident(x):
+        calls.append(len(x))
+        return logits('5901234123457', len(x), unsure=(4,))
+    detector.runner = never_confident
+    assert detector.detect_images([Image.new('RGB', (320, 240))]) == ['5901234123457'], \
+        "Best-effort reading not returned"
+    assert calls == [1, 2, 1], f"Unexpected forward calls {calls}"
+    
+    # A confident reading with a bad check digit never stops early; the
+    # final answer still follows the decode mode
+    calls = []
+    def bad_checksum(x):
+        calls.append(len(x))
+        return logits('5901234123458', len(x))
+    detector.runner = bad_checksum
+    assert detector.detect_images([Image.new('RGB', (320, 240))]) == ['5901234123458'], \
+        "Greedy reading not returned"
+    assert calls == [1, 2, 1], f"Greedy exit accepted a bad check digit: {calls}"
+    
+    calls = []
+    def no_checksum(x):
+        calls.append(len(x))
+        return logits('1234', len(x))
+    
+    checksum_detector = BarcodeDetector(decode_mode='checksum', min_confidence=0.5, tta=tta)
+    calls = []
+    checksum_detector.runner = no_checksum
+    assert checksum_detector.detect_images([Image.new('RGB', (320, 240))]) == [None], \
+        "Invalid checksum accepted"
+    assert calls == [1, 2, 1], f"Unexpected forward calls {calls}"
+    
+    # Frames clearly without a barcode are not retried
+    calls = []
+    def absent(x):
+        calls.append(len(x))
+        return logits('5901234123457', len(x), unsure=(4,), presence=-5.0)
+    detector.runner = absent
+    assert detector.detect_images([Image.new('RGB', (320, 240))]) == [None], \
+        "Barcode read in an empty frame"
+    assert calls == [1], f"Augmentation ran for an empty frame: {calls}"
+    
+    # The camera path goes through the same augmentation
+    calls = []
+    detector.runner = unsure_then_confident
+    frame = np.full((240, 320, 3), 255, dtype=np.uint8).tobytes()
+    assert detector.detect_barcode(frame, (320, 240)) == '5901234123457', \
+        "Camera frame not read with augmentation"
+    assert calls == [1, 2], f"Unexpected camera path forward calls {calls}"
+    
+    print("✓ Test-time augmentation test passed!\n")
+
 def run_all_tests():
     """Run all tests"""
     print("=" * 60)
@@ -172,9 +792,23 @@ def run_all_tests():
     
     try:
         test_barcode_net()
+        test_grayscale_input_mode()
+        test_compact_model()
         test_detector_initialization()
         test_image_processing()
         test_digit_decoding()
+        test_checksum_validation()
+        test_checksum_decoding()
+        test_frame_quality_gate()
+        test_request_profiler()
+        test_execution_backends()
+        test_batch_detection()
+        test_scan_images()
+        test_model_reload()
+        test_flat_model_format()
+        test_draft_decoding()
+        test_native_backbone()
+        test_test_time_augmentation()
         test_barcode_detection()
         
         print("=" * 60)
@@ -183,7 +817,7 @@ def run_all_tests():
         print()
         print("Note: The model needs training to accurately detect barcodes.")
         print("Run 'python train_model.py' to train the model.")
-        
+    
     except Exception as e:
         print(f"\n✗ Test failed with error: {e}")
         import traceback
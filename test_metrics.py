@@ -0,0 +1,113 @@
+"""
+Test script for the Prometheus metrics of the detection server
+Reads /metrics through the Flask test client
+"""
+
+from metrics import MetricsRegistry
+import server
+
+def scrape():
+    """Fetch /metrics and return its text"""
+    response = server.app.test_client().get('/metrics')
+    assert response.status_code == 200, f"Unexpected status {response.status_code}"
+    assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4'), \
+        "Wrong exposition content type"
+    return response.get_data(as_text=True)
+
+def sample(text, series):
+    """Value of one series such as pybar_requests_total{outcome="error"}"""
+    for line in text.splitlines():
+        if line.startswith(series + ' '):
+            return float(line.split(' ')[-1])
+    raise AssertionError(f"{series} missing from /metrics")
+
+def test_request_counter():
+    """Test that detection requests are counted by outcome"""
+    print("Testing request counter...")
+    
+    series = 'pybar_requests_total{outcome="bad_request"}'
+    text = scrape()
+    assert '# TYPE pybar_requests_total counter' in text, "Counter type missing"
+    before = sample(text, series)
+    
+    client = server.app.test_client()
+    for _ in range(3):
+        assert client.post('/api/detect', json={}).status_code == 400, "Empty request accepted"
+    
+    assert sample(scrape(), series) == before + 3, "Requests not counted"
+    
+    print("✓ Request counter test passed!\n")
+
+def test_stage_histogram():
+    """Test the cumulative buckets, sum and count of the latency histogram"""
+    print("Testing stage latency histogram...")
+    
+    server.app.test_client().post('/api/detect', json={})
+    text = scrape()
+    assert '# TYPE pybar_stage_duration_seconds histogram' in text, "Histogram type missing"
+    
+    prefix = 'pybar_stage_duration_seconds_bucket{stage="total",le="'
+    buckets = [float(line.split(' ')[-1]) for line in text.splitlines()
+               if line.startswith(prefix)]
+    assert len(buckets) > 1, "Buckets missing"
+    assert buckets == sorted(buckets), "Buckets not cumulative"
+    
+    count = sample(text, 'pybar_stage_duration_seconds_count{stage="total"}')
+    assert count >= 1, "Request not observed"
+    assert sample(text, prefix + '+Inf"}') == count == buckets[-1], \
+        "+Inf bucket differs from count"
+    assert sample(text, 'pybar_stage_duration_seconds_sum{stage="total"}') > 0, "Sum missing"
+    
+    print("✓ Stage latency histogram test passed!\n")
+
+def test_label_rendering():
+    """Test label sets, escaping and the series reported from the start"""
+    print("Testing label rendering...")
+    
+    # Every outcome is exported before it happens, so rates start at zero
+    text = scrape()
+    for outcome in server.REQUEST_OUTCOMES:
+        sample(text, f'pybar_requests_total{{outcome="{outcome}"}}')
+    sample(text, 'pybar_model_reloads_total{status="swapped"}')
+    
+    registry = MetricsRegistry()
+    counter = registry.counter('test_total', 'Labeled counter', ['path', 'code'])
+    counter.inc(path='a"b\\c\nd', code=200)
+    rendered = registry.render()
+    assert 'test_total{path="a\\"b\\\\c\\nd",code="200"} 1' in rendered, \
+        f"Labels not escaped: {rendered}"
+    try:
+        counter.inc(path='/')
+        raise AssertionError("Missing label accepted")
+    except ValueError:
+        pass
+    
+    print("✓ Label rendering test passed!\n")
+
+def run_all_tests():
+    """Run all metrics tests"""
+    print("=" * 60)
+    print("PyBar Metrics Test Suite")
+    print("=" * 60)
+    print()
+    
+    try:
+        test_request_counter()
+        test_stage_histogram()
+        test_label_rendering()
+        
+        print("=" * 60)
+        print("All tests completed successfully! ✓")
+        print("=" * 60)
+    
+    except Exception as e:
+        print(f"\n✗ Test failed with error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    
+    return True
+
+if __name__ == '__main__':
+    success = run_all_tests()
+    exit(0 if success else 1)
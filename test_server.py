@@ -7,7 +7,9 @@ import requests
 import base64
 from PIL import Image, ImageDraw
 import io
+import os
 import sys
+import json
 
 def create_test_barcode_image(barcode_number, size=(224, 224)):
     """Create a simple test barcode image"""
@@ -108,13 +110,204 @@ def test_detect_endpoint(base_url, barcode_number):
         else:
             print("✗ Detection failed!")
             return False
-            
+    
     except Exception as e:
         print(f"✗ Error: {e}")
         import traceback
         traceback.print_exc()
         return False
 
+def test_binary_upload(base_url, barcode_number):
+    """Test a raw JPEG upload at the model input size, as the web client sends"""
+    print("\n" + "="*60)
+    print(f"Testing Binary Upload: {barcode_number}")
+    print("="*60)
+    
+    try:
+        height, width = requests.get(f"{base_url}/api/health").json()['model_input_size']
+        image = create_test_barcode_image(barcode_number, size=(width, height)).convert('L')
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=85)
+        print(f"Sending {len(buffer.getvalue())} bytes ({width}x{height} grayscale JPEG)...")
+        
+        response = requests.post(
+            f"{base_url}/api/detect",
+            data=buffer.getvalue(),
+            headers={"Content-Type": "image/jpeg"}
+        )
+        
+        print(f"Status Code: {response.status_code}")
+        result = response.json()
+        print(f"Response: {result}")
+        
+        if response.status_code == 200 and 'success' in result:
+            print("✓ Binary upload passed!")
+            return True
+        else:
+            print("✗ Binary upload failed!")
+            return False
+    except Exception as e:
+        print(f"✗ Error: {e}")
+        return False
+
+def test_chunked_upload_limit(base_url):
+    """Test that a chunked upload without Content-Length is still size limited"""
+    print("\n" + "="*60)
+    print("Testing Chunked Upload Limit")
+    print("="*60)
+    
+    # Same limit as the server, from the same environment variable
+    max_image_bytes = int(os.environ.get('PYBAR_MAX_IMAGE_BYTES', str(20 * 1024 * 1024)))
+    max_upload_bytes = max_image_bytes * 4 // 3 + 64 * 1024
+    
+    def chunks():
+        # Exactly one byte over the limit, so the server reads all of it
+        remaining = max_upload_bytes + 1
+        while remaining > 0:
+            size = min(1024 * 1024, remaining)
+            remaining -= size
+            yield b'\xff' * size
+    
+    try:
+        # A generator body is sent with Transfer-Encoding: chunked
+        response = requests.post(f"{base_url}/api/detect", data=chunks(),
+                                 headers={"Content-Type": "image/jpeg"})
+        print(f"Status Code: {response.status_code}")
+        
+        if response.status_code == 413:
+            print("✓ Chunked upload limit passed!")
+            return True
+        else:
+            print("✗ Chunked upload limit failed!")
+            return False
+    except Exception as e:
+        print(f"✗ Error: {e}")
+        return False
+
+def test_metrics_endpoint(base_url):
+    """Test the Prometheus metrics endpoint"""
+    print("\n" + "="*60)
+    print("Testing Metrics Endpoint")
+    print("="*60)
+    
+    try:
+        response = requests.get(f"{base_url}/metrics")
+        print(f"Status Code: {response.status_code}")
+        
+        expected = [
+            'pybar_requests_total{outcome="detected"}',
+            'pybar_stage_duration_seconds_count{stage="forward"}',
+            'pybar_stage_duration_seconds_count{stage="total"}',
+            'pybar_queue_depth',
+            'pybar_model_load_seconds'
+        ]
+        missing = [name for name in expected if name not in response.text]
+        
+        if response.status_code == 200 and not missing:
+            print("✓ Metrics endpoint passed!")
+            return True
+        else:
+            print(f"✗ Metrics endpoint failed! Missing: {missing}")
+            return False
+    except Exception as e:
+        print(f"✗ Error: {e}")
+        return False
+
+def test_batch_endpoint(base_url, barcode_numbers):
+    """Test the bulk detection endpoint with a multipart upload"""
+    print("\n" + "="*60)
+    print(f"Testing Batch Endpoint ({len(barcode_numbers)} images)")
+    print("="*60)
+    
+    try:
+        files = []
+        for barcode_number in barcode_numbers:
+            buffer = io.BytesIO()
+            create_test_barcode_image(barcode_number).save(buffer, format='JPEG')
+            files.append(('images', (f"{barcode_number}.jpg", buffer.getvalue(), 'image/jpeg')))
+        files.append(('images', ('broken.jpg', b'not an image', 'image/jpeg')))
+        
+        response = requests.post(f"{base_url}/api/detect/batch", files=files, stream=True)
+        print(f"Status Code: {response.status_code}")
+        lines = [json.loads(line) for line in response.iter_lines() if line]
+        for line in lines:
+            print(f"  {line}")
+        
+        results, summary = lines[:-1], lines[-1]
+        if (response.status_code == 200 and summary.get('done')
+                and summary['images'] == len(files) and len(results) == len(files)
+                and [result['index'] for result in results] == list(range(len(files)))
+                and 'error' in results[-1]):
+            print("✓ Batch endpoint passed!")
+            return True
+        else:
+            print("✗ Batch endpoint failed!")
+            return False
+    except Exception as e:
+        print(f"✗ Error: {e}")
+        return False
+
+def test_static_caching(base_url):
+    """Test cache headers, ETag revalidation and compression of the web app"""
+    print("\n" + "="*60)
+    print("Testing Static Asset Caching")
+    print("="*60)
+    
+    try:
+        page = requests.get(base_url)
+        revalidated = requests.get(base_url, headers={"If-None-Match": page.headers['ETag']})
+        script = page.text.split('<script src="')[1].split('"')[0]
+        asset = requests.get(f"{base_url}/{script}")
+        print(f"Page: {page.status_code}, {page.headers.get('Cache-Control')}, "
+              f"revalidated {revalidated.status_code}")
+        print(f"{script}: {asset.status_code}, {asset.headers.get('Cache-Control')}, "
+              f"{asset.headers.get('Content-Encoding')}")
+        
+        if (page.status_code == 200 and revalidated.status_code == 304
+                and script != 'app.js' and 'immutable' in asset.headers.get('Cache-Control', '')
+                and asset.headers.get('Content-Encoding') in ('gzip', 'br')
+                and requests.get(f"{base_url}/sw.js").status_code == 200):
+            print("✓ Static asset caching passed!")
+            return True
+        else:
+            print("✗ Static asset caching failed!")
+            return False
+    except Exception as e:
+        print(f"✗ Error: {e}")
+        return False
+
+def test_profile_trace(base_url, barcode_number):
+    """Test profiling a detection request and downloading its trace"""
+    print("\n" + "="*60)
+    print("Testing Profile Trace Download")
+    print("="*60)
+    
+    token = os.environ.get('PYBAR_ADMIN_TOKEN')
+    if not token:
+        print("Skipped: set PYBAR_ADMIN_TOKEN to the server's admin token")
+        return True
+    headers = {"Authorization": f"Bearer {token}"}
+    
+    try:
+        requests.post(f"{base_url}/admin/profile", json={"count": 1}, headers=headers)
+        image_data = image_to_base64(create_test_barcode_image(barcode_number))
+        requests.post(f"{base_url}/api/detect", json={"image": image_data})
+        
+        traces = requests.get(f"{base_url}/admin/profile", headers=headers).json()['traces']
+        print(f"Traces: {traces[:3]}")
+        response = requests.get(f"{base_url}/admin/profile/{traces[0]}", headers=headers)
+        print(f"Status Code: {response.status_code}, {len(response.content)} bytes")
+        
+        if response.status_code == 200 and 'traceEvents' in response.json():
+            print("✓ Profile trace download passed!")
+            return True
+        else:
+            print("✗ Profile trace download failed!")
+            return False
+    except Exception as e:
+        print(f"✗ Error: {e}")
+        return False
+
 def run_tests(base_url="http://localhost:5000"):
     """Run all tests"""
     print("\n" + "="*60)
@@ -146,6 +339,24 @@ def run_tests(base_url="http://localhost:5000"):
     for barcode in test_barcodes:
         results.append(test_detect_endpoint(base_url, barcode))
     
+    # Test 3: Compact upload of the web client
+    results.append(test_binary_upload(base_url, test_barcodes[0]))
+    
+    # Test 4: Size limit without a Content-Length
+    results.append(test_chunked_upload_limit(base_url))
+    
+    # Test 5: Bulk detection
+    results.append(test_batch_endpoint(base_url, test_barcodes))
+    
+    # Test 6: Metrics recorded by the detection requests
+    results.append(test_metrics_endpoint(base_url))
+    
+    # Test 7: Caching of the web app
+    results.append(test_static_caching(base_url))
+    
+    # Test 8: Request profiling for the admin
+    results.append(test_profile_trace(base_url, test_barcodes[0]))
+    
     # Summary
     print("\n" + "="*60)
     print("Test Summary")
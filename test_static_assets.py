@@ -0,0 +1,82 @@
+"""
+Test script for the static asset build of the web app
+Tests content hashing, precompression and the service worker precache list
+"""
+
+import os
+import gzip
+import tempfile
+from static_assets import build_assets
+
+def test_static_assets():
+    """Test the hashed, precompressed static asset build"""
+    print("Testing static assets...")
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = os.path.join(tmp_dir, 'static')
+        os.makedirs(source)
+        files = {
+            'index.html': '<link rel="stylesheet" href="style.css"><script src="app.js"></script>',
+            'app.js': 'console.log("scanner");\n' * 50,
+            'style.css': 'body { margin: 0; }\n' * 50,
+            'sw.js': "const CACHE_NAME = '__PYBAR_CACHE_NAME__';\n"
+                     "const PRECACHE_URLS = __PYBAR_PRECACHE_URLS__;\n"
+        }
+        for name, text in files.items():
+            with open(os.path.join(source, name), 'w') as f:
+                f.write(text)
+        
+        assets = build_assets(source, os.path.join(tmp_dir, 'build'))
+        hashed = sorted(path for path in assets if path.count('.') == 2)
+        assert len(hashed) == 2, f"Unexpected hashed assets {hashed}"
+        page = assets['/'].body.decode()
+        assert all(path.lstrip('/') in page for path in hashed), "Page not rewritten"
+        assert all(assets[path].cache_control.endswith('immutable') for path in hashed), \
+            "Hashed assets not immutable"
+        assert assets['/'].cache_control == 'no-cache', "Page cached without revalidation"
+        
+        app_js = next(path for path in hashed if path.startswith('/app.'))
+        assert gzip.decompress(assets[app_js].encodings['gzip']) == assets[app_js].body, \
+            "gzip variant differs"
+        worker = assets['/sw.js'].body.decode()
+        assert '__PYBAR' not in worker and f'.{app_js}' in worker, "Precache list not filled in"
+        
+        # Changing an asset changes its name, the page and the service worker
+        with open(os.path.join(source, 'app.js'), 'a') as f:
+            f.write('console.log("v2");\n')
+        rebuilt = build_assets(source)
+        assert app_js not in rebuilt and rebuilt['/'].etag != assets['/'].etag, \
+            "Changed asset kept its name"
+        assert rebuilt['/sw.js'].body != assets['/sw.js'].body, "Service worker not updated"
+        
+        built = os.listdir(os.path.join(tmp_dir, 'build'))
+        assert app_js.lstrip('/') + '.gz' in built and 'manifest.json' in built, \
+            f"Incomplete build output {built}"
+    
+    print("✓ Static assets test passed!\n")
+
+def run_all_tests():
+    """Run all static asset tests"""
+    print("=" * 60)
+    print("PyBar Static Assets Test Suite")
+    print("=" * 60)
+    print()
+    
+    try:
+        test_static_assets()
+        
+        print("=" * 60)
+        print("All tests completed successfully! ✓")
+        print("=" * 60)
+    
+    except Exception as e:
+        print(f"\n✗ Test failed with error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    
+    return True
+
+if __name__ == '__main__':
+    success = run_all_tests()
+    exit(0 if success else 1)
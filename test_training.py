@@ -0,0 +1,277 @@
+"""
+Test script for the training data pipeline
+Tests the synthetic barcode renderers used by train_model
+"""
+
+import os
+import tempfile
+import torch
+import numpy as np
+from barcode_renderer import BarcodeBatchRenderer, SyntheticBarcodeBatchDataset
+from barcode_shards import ShardedBarcodeDataset, build_shards
+from batch_augment import BatchAugmenter
+from barcode_detector import BarcodeNet
+from prune_model import prune_channels
+from train_model import (EpochSampler, SyntheticBarcodeDataset, compute_loss, distillation_loss,
+                         make_loader)
+
+def test_batch_renderer():
+    """Test the vectorized batch renderer output"""
+    print("Testing vectorized batch renderer...")
+    
+    renderer = BarcodeBatchRenderer(image_size=(320, 96))
+    rng = np.random.default_rng(0)
+    digits, lengths = renderer.random_labels(16, rng)
+    images = renderer.render(digits, lengths, rng)
+    
+    assert images.shape == (16, 96, 320), f"Unexpected batch shape {images.shape}"
+    assert images.dtype == np.uint8, "Images should be uint8"
+    assert (lengths >= 8).all() and (lengths <= 13).all(), "Barcode length out of range"
+    assert ((digits == 10).sum(axis=1) == 13 - lengths).all(), "Padding mismatch"
+    
+    # Bars are drawn in the middle band, the border stays mostly white
+    assert images[:, 96 // 4:3 * 96 // 4].mean() < images[:, :5].mean(), "No bars rendered"
+    
+    print("✓ Batch renderer test passed!\n")
+
+def test_batch_renderer_matches_pil():
+    """Test that the vectorized renderer draws the same pixels as the PIL dataset"""
+    print("Testing vectorized renderer against the PIL dataset...")
+    
+    for image_size in [(224, 224), (320, 96)]:
+        renderer = BarcodeBatchRenderer(image_size=image_size, rotation_prob=0, max_noise=0)
+        dataset = SyntheticBarcodeDataset(image_size=image_size, in_channels=1, seed=0,
+                                          rotation_prob=0)
+        rng = np.random.default_rng(5)
+        digits, lengths = renderer.random_labels(32, rng)
+        images = renderer.render(digits, lengths, rng)
+        
+        for image, number, length in zip(images, digits, lengths):
+            barcode_number = ''.join(str(d) for d in number[:length])
+            expected = np.asarray(dataset._create_barcode_image(barcode_number))
+            assert np.array_equal(image, expected), \
+                f"Pixels differ from the PIL dataset for {barcode_number} at {image_size}"
+    
+    print("✓ Renderer pixel equality test passed!\n")
+
+def test_batch_dataset():
+    """Test the batch dataset shapes and determinism"""
+    print("Testing synthetic batch dataset...")
+    
+    dataset = SyntheticBarcodeBatchDataset(num_samples=50, batch_size=16, in_channels=3, seed=7)
+    assert len(dataset) == 4, f"Unexpected number of batches {len(dataset)}"
+    
+    images, presence, digits = dataset[3]
+    assert images.shape == (2, 3, 224, 224), f"Unexpected last batch shape {images.shape}"
+    assert presence.tolist() == [1, 1], "Presence labels mismatch"
+    assert digits.shape == (2, 13), "Digit labels shape mismatch"
+    
+    # Same seed and epoch give the same batch, a new epoch gives new samples
+    assert torch.equal(dataset[0][2], dataset[0][2]), "Batches are not deterministic"
+    first = dataset[0][2]
+    dataset.set_epoch(1)
+    assert not torch.equal(first, dataset[0][2]), "Epochs produce identical samples"
+    
+    print("✓ Batch dataset test passed!\n")
+
+def test_parallel_loading_determinism():
+    """Test that worker processes reproduce the single-process samples"""
+    print("Testing seeded multi-worker data loading...")
+    
+    dataset = SyntheticBarcodeDataset(num_samples=24, image_size=(160, 48), seed=3)
+    
+    def load_epochs(num_workers):
+        loader = make_loader(dataset, batch_size=8, shuffle=True, seed=1,
+                             num_workers=num_workers)
+        epochs = []
+        for epoch in range(2):
+            loader.sampler.set_epoch(epoch)
+            epochs.append(torch.cat([digits for _, _, digits in loader]))
+        return epochs
+    
+    serial = load_epochs(0)
+    parallel = load_epochs(2)
+    
+    assert all(torch.equal(a, b) for a, b in zip(serial, parallel)), "Workers changed the samples"
+    assert not torch.equal(serial[0], serial[1]), "Epochs produce identical samples"
+    
+    print("✓ Seeded multi-worker loading test passed!\n")
+
+def test_distributed_sampler_sharding():
+    """Test that data-parallel replicas split every epoch evenly"""
+    print("Testing sampler sharding across replicas...")
+    
+    dataset = list(range(11))
+    samplers = [EpochSampler(dataset, shuffle=True, seed=4, num_replicas=3, rank=rank)
+                for rank in range(3)]
+    for sampler in samplers:
+        sampler.set_epoch(2)
+    
+    shards = [list(sampler) for sampler in samplers]
+    assert all(len(shard) == 4 for shard in shards), "Replicas run different step counts"
+    assert all(epoch == 2 for shard in shards for epoch, _ in shard), "Epoch not propagated"
+    assert {idx for shard in shards for _, idx in shard} == set(dataset), "Samples missing"
+    
+    print("✓ Sampler sharding test passed!\n")
+
+def test_sharded_dataset():
+    """Test building and memory-mapping pre-rendered shards"""
+    print("Testing pre-rendered dataset shards...")
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        build_shards(os.path.join(tmp_dir, 'a'), 25, shard_size=10, image_size=(160, 48), seed=5)
+        build_shards(os.path.join(tmp_dir, 'b'), 25, shard_size=10, image_size=(160, 48), seed=5)
+        
+        dataset = ShardedBarcodeDataset(os.path.join(tmp_dir, 'a'), in_channels=1)
+        other = ShardedBarcodeDataset(os.path.join(tmp_dir, 'b'), in_channels=1)
+        
+        assert len(dataset) == 25, f"Unexpected dataset length {len(dataset)}"
+        assert dataset.image_size == (160, 48), "Image size not recorded"
+        
+        image, presence, digits = dataset[(2, 23)]
+        assert image.shape == (1, 48, 160), f"Unexpected image shape {image.shape}"
+        assert presence == 1 and digits.shape == (13,), "Labels mismatch"
+        
+        # The same seed builds the same samples
+        assert torch.equal(image, other[23][0]), "Shards are not reproducible"
+        assert torch.equal(digits, other[23][2]), "Labels are not reproducible"
+    
+    print("✓ Dataset shards test passed!\n")
+
+def test_batch_augmentation():
+    """Test the batched tensor augmentation"""
+    print("Testing batched augmentation...")
+    
+    dataset = SyntheticBarcodeBatchDataset(num_samples=8, batch_size=8, image_size=(160, 48),
+                                           in_channels=1, seed=0)
+    images, _, _ = dataset[0]
+    augmenter = BatchAugmenter(prob=1.0)
+    
+    first = augmenter(images, generator=torch.Generator().manual_seed(1))
+    second = augmenter(images, generator=torch.Generator().manual_seed(1))
+    
+    assert first.shape == images.shape, f"Unexpected shape {first.shape}"
+    assert torch.isfinite(first).all(), "Augmentation produced invalid values"
+    assert torch.equal(first, second), "Augmentation is not reproducible"
+    assert not torch.allclose(first, images), "Batch was not augmented"
+    
+    # prob=0 leaves every sample as it is, the warp included
+    unchanged = BatchAugmenter(prob=0.0)(images, generator=torch.Generator().manual_seed(1))
+    assert torch.allclose(unchanged, images, atol=1e-5), "Sample changed with prob=0"
+    
+    # Strong warps keep a dark region the size of the bars away from the
+    # frame border, and cut it off without the bound
+    frame = torch.ones(32, 1, 48, 160)
+    frame[:, :, 48 // 4 + 1:3 * 48 // 4 - 1, 160 // 20:-160 // 20] = 0.0
+    for bar_extent, cut in [((0.93, 0.5), False), (None, True)]:
+        augmenter = BatchAugmenter(max_rotation=20, max_scale=0.4, max_translate=0.2,
+                                   max_perspective=0.3, prob=1.0, bar_extent=bar_extent)
+        augmenter._generator = torch.Generator().manual_seed(0)
+        warped = augmenter.warp(frame.clone())
+        border = torch.cat([warped[:, 0, [0, -1], :].flatten(1),
+                            warped[:, 0, :, [0, -1]].flatten(1)], dim=1)
+        assert (border.min(dim=1).values < 0.5).any() == cut, \
+            f"Bars {'not ' if cut else ''}cut off with bar_extent={bar_extent}"
+    
+    print("✓ Batched augmentation test passed!\n")
+
+def test_vectorized_loss():
+    """Test the reshaped digit loss against per-position losses"""
+    print("Testing vectorized multi-head loss...")
+    
+    presence_logits = torch.randn(6, 2)
+    digit_logits = torch.randn(6, 13, 11)
+    presence_labels = torch.randint(0, 2, (6,))
+    digit_labels = torch.randint(0, 11, (6, 13))
+    
+    criterion = torch.nn.CrossEntropyLoss()
+    expected = criterion(presence_logits, presence_labels)
+    expected += sum(criterion(digit_logits[:, i], digit_labels[:, i]) for i in range(13)) / 13
+    loss = compute_loss(presence_logits, digit_logits, presence_labels, digit_labels)
+    
+    assert torch.allclose(loss, expected), f"Loss mismatch: {loss} vs {expected}"
+    
+    print("✓ Vectorized loss test passed!\n")
+
+def test_distillation_loss():
+    """Test the soft target loss used for knowledge distillation"""
+    print("Testing distillation loss...")
+    
+    presence_logits = torch.randn(6, 2)
+    digit_logits = torch.randn(6, 13, 11)
+    presence_labels = torch.randint(0, 2, (6,))
+    digit_labels = torch.randint(0, 11, (6, 13))
+    hard = compute_loss(presence_logits, digit_logits, presence_labels, digit_labels)
+    
+    # A student matching its teacher only pays the hard label loss
+    loss = distillation_loss(presence_logits, digit_logits, presence_logits, digit_logits,
+                             presence_labels, digit_labels, weight=0.7)
+    assert torch.allclose(loss, 0.3 * hard, atol=1e-5), f"Unexpected loss {loss}"
+    
+    # Disagreeing with the teacher is penalized
+    loss = distillation_loss(presence_logits, digit_logits, -presence_logits, -digit_logits,
+                             presence_labels, digit_labels, weight=0.7)
+    assert loss > 0.3 * hard, "Soft targets ignored"
+    
+    print("✓ Distillation loss test passed!\n")
+
+def test_structured_pruning():
+    """Test that pruning exports a smaller dense model"""
+    print("Testing structured channel pruning...")
+    
+    model = BarcodeNet(in_channels=1, input_size=(48, 160), layers=(1, 1, 1, 1), width=32)
+    model.eval()
+    images = torch.randn(2, 1, 48, 160)
+    
+    # Keeping every channel preserves the outputs exactly
+    unpruned = prune_channels(model, 0.0)
+    unpruned.eval()
+    with torch.no_grad():
+        assert torch.allclose(model(images)[1], unpruned(images)[1], atol=1e-5), \
+            "Unpruned copy changed the outputs"
+    
+    pruned = prune_channels(model, 0.5)
+    assert pruned.get_config()['block_widths'] == [16, 32, 64, 128], "Unexpected block widths"
+    assert sum(p.numel() for p in pruned.parameters()) < sum(p.numel() for p in model.parameters()), \
+        "Pruned model is not smaller"
+    
+    # The config alone rebuilds the pruned architecture
+    rebuilt = BarcodeNet(**pruned.get_config())
+    rebuilt.load_state_dict(pruned.state_dict())
+    
+    print("✓ Structured pruning test passed!\n")
+
+def run_all_tests():
+    """Run all tests"""
+    print("=" * 60)
+    print("PyBar Training Pipeline Test Suite")
+    print("=" * 60)
+    print()
+    
+    try:
+        test_batch_renderer()
+        test_batch_renderer_matches_pil()
+        test_batch_dataset()
+        test_parallel_loading_determinism()
+        test_distributed_sampler_sharding()
+        test_sharded_dataset()
+        test_batch_augmentation()
+        test_vectorized_loss()
+        test_distillation_loss()
+        test_structured_pruning()
+        
+        print("=" * 60)
+        print("All tests completed successfully! ✓")
+        print("=" * 60)
+    
+    except Exception as e:
+        print(f"\n✗ Test failed with error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    
+    return True
+
+if __name__ == '__main__':
+    success = run_all_tests()
+    exit(0 if success else 1)
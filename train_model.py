@@ -6,33 +6,117 @@ This script trains the BarcodeNet model on synthetic or real barcode images
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torch.utils.data import Dataset, DataLoader
+import torch.nn.functional as F
+from torch.utils.data import Dataset, DataLoader, Sampler
 import torchvision.transforms as transforms
 from PIL import Image, ImageDraw, ImageFont
 import numpy as np
 import random
 import os
-from barcode_detector import BarcodeNet
+import time
+from barcode_detector import (BarcodeNet, DEFAULT_INPUT_SIZE, get_normalization, load_model,
+                              save_model)
+from barcode_renderer import SyntheticBarcodeBatchDataset
+from barcode_shards import ShardedBarcodeDataset
+from batch_augment import BatchAugmenter
+
+def derive_seed(*values):
+    """
+    Combine integers such as (seed, epoch, index) into a 32-bit seed
+    
+    Returns:
+        Integer seed that differs for every combination of values
+    """
+    return int(np.random.SeedSequence([int(v) for v in values]).generate_state(1)[0])
+
+class EpochSampler(Sampler):
+    """
+    Sampler yielding (epoch, index) pairs
+    
+    The sampler runs in the training process, so passing the epoch along with
+    every index lets datasets inside (persistent) DataLoader workers derive
+    per-epoch random state without any shared mutable state.
+    """
+    
+    def __init__(self, data_source, shuffle=False, seed=0, num_replicas=1, rank=0):
+        """
+        Initialize the sampler
+        
+        Args:
+            data_source: Dataset to sample from
+            shuffle: Whether to visit the indices in a random order
+            seed: Seed for the shuffling order
+            num_replicas: Number of data-parallel processes sharing the data
+            rank: Index of this process; it visits every num_replicas-th index
+        """
+        self.data_source = data_source
+        self.shuffle = shuffle
+        self.seed = seed
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.epoch = 0
+    
+    def set_epoch(self, epoch):
+        """Select the epoch used for the order and passed to the dataset"""
+        self.epoch = epoch
+    
+    def __iter__(self):
+        if self.shuffle:
+            generator = torch.Generator()
+            generator.manual_seed(derive_seed(self.seed, self.epoch))
+            order = torch.randperm(len(self.data_source), generator=generator).tolist()
+        else:
+            order = list(range(len(self.data_source)))
+        
+        # Pad so that every replica runs the same number of steps
+        order += order[:len(self) * self.num_replicas - len(order)]
+        for idx in order[self.rank::self.num_replicas]:
+            yield (self.epoch, idx)
+    
+    def __len__(self):
+        return (len(self.data_source) + self.num_replicas - 1) // self.num_replicas
+
+def seed_worker(worker_id):
+    """
+    DataLoader worker initialization
+    
+    Samples are seeded from (seed, epoch, index) by the datasets, so workers
+    only need to avoid oversubscribing the CPU with intra-op threads.
+    """
+    torch.set_num_threads(1)
 
 class SyntheticBarcodeDataset(Dataset):
     """Generate synthetic barcode images for training"""
     
-    def __init__(self, num_samples=1000, image_size=(224, 224)):
+    def __init__(self, num_samples=1000, image_size=(224, 224), in_channels=3, seed=None,
+                 rotation_prob=0.5):
         """
         Initialize synthetic barcode dataset
         
         Args:
             num_samples: Number of synthetic samples to generate
-            image_size: Size of generated images
+            image_size: Size of generated images as (width, height)
+            in_channels: 3 for RGB images, 1 for grayscale images
+            seed: Base random seed (random if None)
+            rotation_prob: Probability of rotating a sample
         """
         self.num_samples = num_samples
         self.image_size = image_size
+        self.in_channels = in_channels
+        self.rotation_prob = rotation_prob
+        self.seed = seed if seed is not None else random.getrandbits(32)
+        self.epoch = 0
+        self.rng = random.Random(self.seed)
+        mean, std = get_normalization(in_channels)
         self.transform = transforms.Compose([
             transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                               std=[0.229, 0.224, 0.225])
+            transforms.Normalize(mean=mean, std=std)
         ])
     
+    def set_epoch(self, epoch):
+        """Select the epoch used when indices come without one"""
+        self.epoch = epoch
+    
     def __len__(self):
         return self.num_samples
     
@@ -40,12 +124,23 @@ class SyntheticBarcodeDataset(Dataset):
         """
         Generate a synthetic barcode image
         
+        Args:
+            idx: Sample index, or (epoch, index) pair from EpochSampler
+        
         Returns:
             Tuple of (image_tensor, presence_label, digit_labels)
         """
+        epoch = self.epoch
+        if isinstance(idx, tuple):
+            epoch, idx = idx
+        
+        # Every sample has its own deterministic random state, whichever
+        # worker process generates it
+        self.rng.seed(derive_seed(self.seed, epoch, idx))
+        
         # Generate random barcode number (8-13 digits)
-        num_digits = random.randint(8, 13)
-        barcode_number = ''.join([str(random.randint(0, 9)) for _ in range(num_digits)])
+        num_digits = self.rng.randint(8, 13)
+        barcode_number = ''.join([str(self.rng.randint(0, 9)) for _ in range(num_digits)])
         
         # Create image with barcode
         image = self._create_barcode_image(barcode_number)
@@ -66,12 +161,13 @@ class SyntheticBarcodeDataset(Dataset):
         
         Args:
             barcode_number: Barcode digits as string
-            
+        
         Returns:
             PIL Image with barcode
         """
         width, height = self.image_size
-        image = Image.new('RGB', (width, height), color='white')
+        mode = 'L' if self.in_channels == 1 else 'RGB'
+        image = Image.new(mode, (width, height), color='white')
         draw = ImageDraw.Draw(image)
         
         # Draw vertical bars representing the barcode
@@ -101,14 +197,127 @@ class SyntheticBarcodeDataset(Dataset):
             pass
         
         # Add some noise and variations
-        if random.random() > 0.5:
+        if self.rng.random() < self.rotation_prob:
             # Add random rotation
-            angle = random.uniform(-10, 10)
+            angle = self.rng.uniform(-10, 10)
             image = image.rotate(angle, fillcolor='white')
         
         return image
 
-def train_model(num_epochs=10, batch_size=32, learning_rate=0.001, save_path='barcode_model.pth'):
+def load_shards(data_dir, image_size, in_channels):
+    """
+    Open a pre-rendered dataset and check that it matches the model input
+    
+    Args:
+        data_dir: Directory written by barcode_shards.build_shards
+        image_size: Expected image size as (width, height)
+        in_channels: Number of model input channels
+    
+    Returns:
+        ShardedBarcodeDataset
+    """
+    dataset = ShardedBarcodeDataset(data_dir, in_channels=in_channels)
+    if dataset.image_size != tuple(image_size):
+        raise ValueError(f"Shards in {data_dir} have image size {dataset.image_size}, "
+                         f"expected {tuple(image_size)}")
+    return dataset
+
+def make_loader(dataset, batch_size, shuffle=False, seed=0, num_workers=0, pin_memory=False,
+                prefetch_factor=2, num_replicas=1, rank=0):
+    """
+    Create a DataLoader with epoch-aware sampling and parallel workers
+    
+    Args:
+        dataset: Dataset of samples, or a SyntheticBarcodeBatchDataset whose
+            items are whole batches (automatic batching is then disabled)
+        batch_size: Batch size for datasets of samples
+        shuffle: Whether to shuffle the order every epoch
+        seed: Seed for the shuffling order
+        num_workers: Number of worker processes (0 loads in the training process)
+        pin_memory: Whether to pin batches for faster host to GPU copies
+        prefetch_factor: Batches loaded in advance by each worker
+        num_replicas: Number of data-parallel processes sharing the data
+        rank: Index of this process
+    
+    Returns:
+        DataLoader whose sampler has a set_epoch method
+    """
+    options = {}
+    if num_workers > 0:
+        options = {
+            'persistent_workers': True,
+            'prefetch_factor': prefetch_factor,
+            'worker_init_fn': seed_worker
+        }
+    
+    if isinstance(dataset, SyntheticBarcodeBatchDataset):
+        batch_size = None
+    
+    return DataLoader(dataset, batch_size=batch_size,
+                      sampler=EpochSampler(dataset, shuffle=shuffle, seed=seed,
+                                           num_replicas=num_replicas, rank=rank),
+                      num_workers=num_workers, pin_memory=pin_memory, **options)
+
+def compute_loss(presence_logits, digit_logits, presence_labels, digit_labels):
+    """
+    Compute the combined presence and digit loss
+    
+    The digit heads are scored with a single cross-entropy over all
+    (batch * positions) predictions, which equals the mean of the
+    per-position losses.
+    
+    Args:
+        presence_logits: Tensor of shape (batch, 2)
+        digit_logits: Tensor of shape (batch, positions, 11)
+        presence_labels: Tensor of shape (batch,)
+        digit_labels: Tensor of shape (batch, positions)
+    
+    Returns:
+        Scalar loss tensor
+    """
+    presence_loss = F.cross_entropy(presence_logits.float(), presence_labels)
+    digit_loss = F.cross_entropy(digit_logits.float().reshape(-1, digit_logits.shape[-1]),
+                                 digit_labels.reshape(-1))
+    return presence_loss + digit_loss
+
+def distillation_loss(presence_logits, digit_logits, teacher_presence, teacher_digits,
+                      presence_labels, digit_labels, temperature=4.0, weight=0.7):
+    """
+    Compute the knowledge distillation loss of a student model
+    
+    Blends the KL divergence to the teacher's temperature-softened presence
+    and digit distributions with the regular loss on the hard labels. The
+    soft term is scaled by temperature^2 to keep its gradients comparable.
+    
+    Args:
+        presence_logits: Student tensor of shape (batch, 2)
+        digit_logits: Student tensor of shape (batch, positions, 11)
+        teacher_presence: Teacher tensor of shape (batch, 2)
+        teacher_digits: Teacher tensor of shape (batch, positions, 11)
+        presence_labels: Tensor of shape (batch,)
+        digit_labels: Tensor of shape (batch, positions)
+        temperature: Softmax temperature of the soft targets
+        weight: Share of the soft target loss (0 trains on hard labels only)
+    
+    Returns:
+        Scalar loss tensor
+    """
+    def soft_loss(student, teacher):
+        student = student.float().reshape(-1, student.shape[-1]) / temperature
+        teacher = teacher.float().reshape(-1, teacher.shape[-1]) / temperature
+        return F.kl_div(F.log_softmax(student, dim=1), F.log_softmax(teacher, dim=1),
+                        reduction='batchmean', log_target=True)
+    
+    soft = soft_loss(presence_logits, teacher_presence) + soft_loss(digit_logits, teacher_digits)
+    hard = compute_loss(presence_logits, digit_logits, presence_labels, digit_labels)
+    return weight * temperature ** 2 * soft + (1 - weight) * hard
+
+def train_model(num_epochs=10, batch_size=32, learning_rate=0.001, save_path='barcode_model.pth',
+                input_size=DEFAULT_INPUT_SIZE, in_channels=3, renderer='vectorized',
+                num_workers=None, prefetch_factor=2, seed=None, train_data=None, val_data=None,
+                augment=True, bf16=False, channels_last=False, checkpoint_path=None,
+                resume=False, rank=0, world_size=1, architecture=None, teacher_path=None,
+                temperature=4.0, distill_weight=0.7, init_path=None):
     """
     Train the barcode recognition model
     
@@ -117,66 +326,224 @@ def train_model(num_epochs=10, batch_size=32, learning_rate=0.001, save_path='ba
         batch_size: Training batch size
         learning_rate: Learning rate for optimizer
         save_path: Path to save trained model
+        input_size: Model input size as (height, width), e.g. (96, 320)
+        in_channels: 3 for RGB input, 1 for grayscale input
+        renderer: 'vectorized' to render whole batches with numpy, or 'pil'
+            to draw every sample with PIL
+        num_workers: DataLoader worker processes (default: one per spare CPU core)
+        prefetch_factor: Batches loaded in advance by each worker
+        seed: Random seed for the training data (random if None). The same
+            seed reproduces the same samples for any number of workers.
+        train_data: Directory of pre-rendered shards (see barcode_shards.py)
+            used instead of synthetic training samples
+        val_data: Directory of pre-rendered validation shards
+        augment: Apply batched geometric and photometric augmentation
+            (BatchAugmenter) to every training batch after loading
+        bf16: Run forward passes under bfloat16 autocast (CPUs with AVX512-BF16
+            or AMX benefit most)
+        channels_last: Use the channels_last (NHWC) memory format for the
+            model and its inputs
+        checkpoint_path: Path of the resumable training checkpoint written
+            after every epoch (default: next to save_path)
+        resume: Continue from checkpoint_path if it exists
+        rank: Process index when called by train_distributed
+        world_size: Number of data-parallel processes; batch_size is per process
+        architecture: Extra BarcodeNet arguments (layers, width, feature_dim)
+            for a model smaller than the default ResNet18
+        teacher_path: Trained model whose soft targets the new model is
+            distilled from (see distill_model.py); it must share the input
+            geometry
+        temperature: Softmax temperature of the distillation targets
+        distill_weight: Share of the soft target loss when distilling
+        init_path: Saved model whose architecture and weights training starts
+            from, e.g. a pruned model to fine-tune (see prune_model.py)
     """
+    distributed = world_size > 1
+    is_main = rank == 0
+    log = print if is_main else (lambda *args, **kwargs: None)
+    
     # Setup device
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    print(f"Training on device: {device}")
+    device = torch.device('cuda' if torch.cuda.is_available() and not distributed else 'cpu')
+    log(f"Training on device: {device}")
+    
+    if checkpoint_path is None:
+        checkpoint_path = os.path.splitext(save_path)[0] + '_checkpoint.pth'
+    
+    # A resumed run continues with the seed, and therefore the data, it started with
+    checkpoint = None
+    if resume and os.path.exists(checkpoint_path):
+        checkpoint = torch.load(checkpoint_path, map_location='cpu', weights_only=False)
+        seed = checkpoint['seed']
+        log(f"Resuming from {checkpoint_path} at epoch {checkpoint['epoch'] + 1}")
+    elif resume:
+        log(f"No checkpoint found at {checkpoint_path}, starting from scratch")
+    
+    if num_workers is None:
+        num_workers = max((os.cpu_count() or 1) // world_size - 1, 0)
+    if seed is None:
+        seed = random.getrandbits(32)
+    log(f"Data loading: {num_workers} workers, seed {seed}")
     
     # Create dataset and dataloader
-    train_dataset = SyntheticBarcodeDataset(num_samples=5000)
-    train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True)
+    height, width = input_size
+    if renderer == 'vectorized':
+        train_dataset = SyntheticBarcodeBatchDataset(num_samples=5000, batch_size=batch_size,
+                                                     image_size=(width, height),
+                                                     in_channels=in_channels,
+                                                     seed=derive_seed(seed, 0))
+        val_dataset = SyntheticBarcodeBatchDataset(num_samples=1000, batch_size=batch_size,
+                                                   image_size=(width, height),
+                                                   in_channels=in_channels,
+                                                   seed=derive_seed(seed, 1))
+    elif renderer == 'pil':
+        train_dataset = SyntheticBarcodeDataset(num_samples=5000, image_size=(width, height),
+                                                in_channels=in_channels,
+                                                seed=derive_seed(seed, 0))
+        val_dataset = SyntheticBarcodeDataset(num_samples=1000, image_size=(width, height),
+                                              in_channels=in_channels,
+                                              seed=derive_seed(seed, 1))
+    else:
+        raise ValueError(f"Unknown renderer: {renderer}")
     
-    val_dataset = SyntheticBarcodeDataset(num_samples=1000)
-    val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False)
+    # Pre-rendered shards replace the synthetic datasets
+    if train_data:
+        train_dataset = load_shards(train_data, (width, height), in_channels)
+        log(f"Training on {len(train_dataset)} pre-rendered samples from {train_data}")
+    if val_data:
+        val_dataset = load_shards(val_data, (width, height), in_channels)
+        log(f"Validating on {len(val_dataset)} pre-rendered samples from {val_data}")
+    
+    loader_options = {
+        'num_workers': num_workers,
+        'pin_memory': device.type == 'cuda',
+        'prefetch_factor': prefetch_factor,
+        'num_replicas': world_size,
+        'rank': rank
+    }
+    train_loader = make_loader(train_dataset, batch_size, shuffle=True, seed=seed,
+                               **loader_options)
+    
+    # The validation sampler stays at epoch 0, so every epoch is validated
+    # on the same samples
+    val_loader = make_loader(val_dataset, batch_size, **loader_options)
     
     # Initialize model
-    model = BarcodeNet()
+    if init_path:
+        model = load_model(init_path)
+        if (model.in_channels, model.input_size) != (in_channels, tuple(input_size)):
+            raise ValueError(f"Model {init_path} expects {model.in_channels}x"
+                             f"{model.input_size} input, not {in_channels}x{tuple(input_size)}")
+        log(f"Starting from the weights of {init_path}")
+    else:
+        model = BarcodeNet(in_channels=in_channels, input_size=input_size,
+                           **(architecture or {}))
+    if checkpoint is not None:
+        config = model.get_config()
+        if any(checkpoint['config'].get(key, value) != value for key, value in config.items()):
+            raise ValueError(f"Checkpoint {checkpoint_path} was trained with "
+                             f"{checkpoint['config']}, not {model.get_config()}")
+        model.load_state_dict(checkpoint['state_dict'])
     model.to(device)
     
-    # Loss functions
-    presence_criterion = nn.CrossEntropyLoss()
-    digit_criterion = nn.CrossEntropyLoss()
+    memory_format = torch.channels_last if channels_last else torch.contiguous_format
+    model.to(memory_format=memory_format)
+    
+    # Frozen teacher providing soft targets for distillation
+    teacher = None
+    if teacher_path:
+        teacher = load_model(teacher_path, map_location=device)
+        if (teacher.in_channels, teacher.input_size) != (in_channels, tuple(input_size)):
+            raise ValueError(f"Teacher {teacher_path} expects {teacher.in_channels}x"
+                             f"{teacher.input_size} input, not {in_channels}x{tuple(input_size)}")
+        teacher.to(device, memory_format=memory_format)
+        teacher.eval()
+        for param in teacher.parameters():
+            param.requires_grad_(False)
+        log(f"Distilling from {teacher_path} (temperature {temperature}, "
+            f"soft weight {distill_weight})")
+    autocast_dtype = torch.bfloat16 if bf16 else None
+    
+    # The unwrapped model is the one that gets saved
+    net = model
+    if distributed:
+        model = nn.parallel.DistributedDataParallel(model)
     
     # Optimizer
     optimizer = optim.Adam(model.parameters(), lr=learning_rate)
     
+    # Batched augmentation runs on the training device after loading
+    augmenter = BatchAugmenter() if augment else None
+    augment_generator = torch.Generator()
+    augment_generator.manual_seed(derive_seed(seed, 2, rank))
+    
     # Training loop
     best_val_loss = float('inf')
+    start_epoch = 0
+    
+    if checkpoint is not None:
+        optimizer.load_state_dict(checkpoint['optimizer'])
+        best_val_loss = checkpoint['best_val_loss']
+        start_epoch = checkpoint['epoch']
+        rng_state = checkpoint['rng_state']
+        torch.set_rng_state(rng_state['torch'])
+        random.setstate(rng_state['python'])
+        np.random.set_state(rng_state['numpy'])
+        if rank < len(rng_state['augment']):
+            augment_generator.set_state(rng_state['augment'][rank])
     
-    for epoch in range(num_epochs):
+    for epoch in range(start_epoch, num_epochs):
+        train_loader.sampler.set_epoch(epoch)
+        
         model.train()
         train_loss = 0.0
+        num_images = 0
+        data_time = 0.0
+        epoch_start = time.perf_counter()
+        batch_start = epoch_start
         
         for batch_idx, (images, presence_labels, digit_labels) in enumerate(train_loader):
-            images = images.to(device)
-            presence_labels = presence_labels.to(device)
-            digit_labels = digit_labels.to(device)
+            data_time += time.perf_counter() - batch_start
             
-            # Forward pass
-            optimizer.zero_grad()
-            presence_logits, digit_logits = model(images)
+            images = images.to(device, non_blocking=True)
+            presence_labels = presence_labels.to(device, non_blocking=True)
+            digit_labels = digit_labels.to(device, non_blocking=True)
             
-            # Calculate losses
-            presence_loss = presence_criterion(presence_logits, presence_labels)
+            if augmenter is not None:
+                images = augmenter(images, generator=augment_generator)
+            images = images.contiguous(memory_format=memory_format)
             
-            # Digit loss (sum over all positions)
-            digit_loss = 0
-            for i in range(13):
-                digit_loss += digit_criterion(digit_logits[:, i, :], digit_labels[:, i])
-            digit_loss /= 13
+            # Forward pass
+            optimizer.zero_grad()
+            with torch.autocast(device_type=device.type, dtype=autocast_dtype,
+                                enabled=bf16):
+                presence_logits, digit_logits = model(images)
             
-            # Total loss
-            loss = presence_loss + digit_loss
+            # Calculate losses in fp32
+            if teacher is not None:
+                with torch.no_grad(), torch.autocast(device_type=device.type,
+                                                     dtype=autocast_dtype, enabled=bf16):
+                    teacher_presence, teacher_digits = teacher(images)
+                loss = distillation_loss(presence_logits, digit_logits, teacher_presence,
+                                         teacher_digits, presence_labels, digit_labels,
+                                         temperature=temperature, weight=distill_weight)
+            else:
+                loss = compute_loss(presence_logits, digit_logits, presence_labels,
+                                    digit_labels)
             
             # Backward pass
             loss.backward()
             optimizer.step()
             
             train_loss += loss.item()
+            num_images += images.size(0) * world_size
             
             if batch_idx % 20 == 0:
-                print(f"Epoch [{epoch+1}/{num_epochs}], Batch [{batch_idx}/{len(train_loader)}], "
-                      f"Loss: {loss.item():.4f}")
+                log(f"Epoch [{epoch+1}/{num_epochs}], Batch [{batch_idx}/{len(train_loader)}], "
+                    f"Loss: {loss.item():.4f}")
+            
+            batch_start = time.perf_counter()
+        
+        epoch_time = time.perf_counter() - epoch_start
         
         # Validation
         model.eval()
@@ -186,11 +553,13 @@ def train_model(num_epochs=10, batch_size=32, learning_rate=0.001, save_path='ba
         
         with torch.no_grad():
             for images, presence_labels, digit_labels in val_loader:
-                images = images.to(device)
+                images = images.to(device).contiguous(memory_format=memory_format)
                 presence_labels = presence_labels.to(device)
                 digit_labels = digit_labels.to(device)
                 
-                presence_logits, digit_logits = model(images)
+                with torch.autocast(device_type=device.type, dtype=autocast_dtype,
+                                    enabled=bf16):
+                    presence_logits, digit_logits = net(images)
                 
                 # Presence accuracy
                 presence_pred = torch.argmax(presence_logits, dim=1)
@@ -198,27 +567,111 @@ def train_model(num_epochs=10, batch_size=32, learning_rate=0.001, save_path='ba
                 total_presence += presence_labels.size(0)
                 
                 # Loss
-                presence_loss = presence_criterion(presence_logits, presence_labels)
-                digit_loss = 0
-                for i in range(13):
-                    digit_loss += digit_criterion(digit_logits[:, i, :], digit_labels[:, i])
-                digit_loss /= 13
-                
-                val_loss += (presence_loss + digit_loss).item()
+                val_loss += compute_loss(presence_logits, digit_logits,
+                                         presence_labels, digit_labels).item()
+        
+        val_batches = len(val_loader)
+        if distributed:
+            # Every process validated its own share of the samples
+            totals = torch.tensor([val_loss, val_batches, correct_presence, total_presence],
+                                  dtype=torch.float64)
+            torch.distributed.all_reduce(totals)
+            val_loss, val_batches, correct_presence, total_presence = totals.tolist()
         
-        val_loss /= len(val_loader)
+        val_loss /= val_batches
         presence_acc = 100.0 * correct_presence / total_presence
         
-        print(f"Epoch [{epoch+1}/{num_epochs}], Train Loss: {train_loss/len(train_loader):.4f}, "
-              f"Val Loss: {val_loss:.4f}, Presence Acc: {presence_acc:.2f}%")
+        log(f"Epoch [{epoch+1}/{num_epochs}], Train Loss: {train_loss/len(train_loader):.4f}, "
+            f"Val Loss: {val_loss:.4f}, Presence Acc: {presence_acc:.2f}%")
+        log(f"Epoch [{epoch+1}/{num_epochs}], Throughput: {num_images / epoch_time:.1f} images/sec, "
+            f"Step Time: {1000 * epoch_time / len(train_loader):.1f} ms, "
+            f"Data Wait: {100 * data_time / epoch_time:.1f}%")
         
         # Save best model
         if val_loss < best_val_loss:
             best_val_loss = val_loss
-            torch.save(model.state_dict(), save_path)
-            print(f"Model saved to {save_path}")
+            if is_main:
+                save_model(net, save_path)
+                log(f"Model saved to {save_path}")
+        
+        # Every process contributes its augmentation generator state
+        augment_states = [augment_generator.get_state()]
+        if distributed:
+            augment_states = [None] * world_size
+            torch.distributed.all_gather_object(augment_states, augment_generator.get_state())
+        
+        if is_main:
+            save_checkpoint(checkpoint_path, {
+                'epoch': epoch + 1,
+                'seed': seed,
+                'config': net.get_config(),
+                'state_dict': net.state_dict(),
+                'optimizer': optimizer.state_dict(),
+                'best_val_loss': best_val_loss,
+                'rng_state': {
+                    'torch': torch.get_rng_state(),
+                    'python': random.getstate(),
+                    'numpy': np.random.get_state(),
+                    'augment': augment_states
+                }
+            })
+    
+    log("Training completed!")
+
+def save_checkpoint(path, checkpoint):
+    """
+    Atomically write a resumable training checkpoint
+    
+    The checkpoint is written to a temporary file first, so an interruption
+    while saving never leaves a truncated checkpoint behind.
+    
+    Args:
+        path: Checkpoint file path
+        checkpoint: Dictionary to save
+    """
+    tmp_path = path + '.tmp'
+    torch.save(checkpoint, tmp_path)
+    os.replace(tmp_path, path)
+
+def _distributed_worker(rank, world_size, port, kwargs):
+    """Entry point of every process spawned by train_distributed"""
+    os.environ['MASTER_ADDR'] = '127.0.0.1'
+    os.environ['MASTER_PORT'] = str(port)
+    torch.set_num_threads(max((os.cpu_count() or 1) // world_size, 1))
+    torch.distributed.init_process_group('gloo', rank=rank, world_size=world_size)
+    try:
+        train_model(rank=rank, world_size=world_size, **kwargs)
+    finally:
+        torch.distributed.destroy_process_group()
+
+def train_distributed(world_size, **kwargs):
+    """
+    Train with DistributedDataParallel over the gloo backend on one machine
+    
+    Every process trains on its own share of each epoch with
+    cpu_count / world_size threads and averages gradients with the others,
+    so the effective batch size is world_size * batch_size.
+    
+    Args:
+        world_size: Number of training processes
+        **kwargs: train_model arguments
+    """
+    import socket
+    import torch.multiprocessing as mp
+    
+    if world_size <= 1:
+        return train_model(**kwargs)
+    
+    # All processes must agree on the seed
+    if kwargs.get('seed') is None:
+        kwargs['seed'] = random.getrandbits(32)
+    
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
     
-    print("Training completed!")
+    print(f"Starting {world_size} training processes (gloo)")
+    mp.spawn(_distributed_worker, args=(world_size, port, kwargs), nprocs=world_size, join=True)
 
 if __name__ == '__main__':
     # Train the model